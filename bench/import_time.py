@@ -0,0 +1,88 @@
+# bench/import_time.py
+# 导入耗时回归基准：在全新解释器中分别导入各模块（以及运行 main.py --help），
+# 记录耗时并检查是否提前加载了重量级依赖。
+#   python bench/import_time.py --repeat 5 --output import_time.json --check
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 只应在对应阶段真正需要时才加载的依赖
+HEAVY_MODULES = ["vllm", "torch", "transformers", "swebench", "pandas", "polars", "datasets", "peft"]
+TARGETS = [
+    "main", "predictor", "pipeline_scheduler", "llm_provider", "llm_backends", "constants",
+    "execution_verifier", "env_manager", "repo_index", "snippet_extractor", "patch_validator", "utils",
+]
+PROBE = """
+import sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+heavy = [name for name in {heavy!r} if name in sys.modules]
+print(repr((elapsed, heavy)))
+"""
+
+
+def run_probe(module):
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE.format(module=module, heavy=HEAVY_MODULES)],
+        cwd=REPO_ROOT, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        return None, [result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "failed"]
+    return eval(result.stdout.strip().splitlines()[-1])
+
+
+def time_help():
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "main.py", "--help"], cwd=REPO_ROOT, capture_output=True)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="导入耗时回归基准")
+    parser.add_argument("--repeat", type=int, default=5, help="每个模块重复测量的次数（取中位数）")
+    parser.add_argument("--output", type=str, default=None, help="结果写入 JSON 文件，便于跨提交比较")
+    parser.add_argument("--check", action="store_true", help="有模块加载了重量级依赖或超出预算时返回非零")
+    parser.add_argument("--budget-ms", type=float, default=500.0, help="单个模块导入耗时预算（毫秒）")
+    args = parser.parse_args()
+
+    results = {}
+    failures = []
+    for module in TARGETS:
+        samples = []
+        heavy = []
+        for _ in range(args.repeat):
+            elapsed, heavy = run_probe(module)
+            if elapsed is None:
+                break
+            samples.append(elapsed)
+        if not samples:
+            print(f"{module:<20} import failed: {heavy[0]}")
+            failures.append(module)
+            results[module] = {"error": heavy[0]}
+            continue
+        median_ms = statistics.median(samples) * 1000
+        results[module] = {"median_ms": round(median_ms, 2), "min_ms": round(min(samples) * 1000, 2),
+                           "heavy_modules": heavy}
+        print(f"{module:<20} {median_ms:8.1f} ms" + (f"  loads {', '.join(heavy)}" if heavy else ""))
+        if heavy or median_ms > args.budget_ms:
+            failures.append(module)
+    help_samples = [time_help() for _ in range(args.repeat)]
+    results["main.py --help"] = {"median_ms": round(statistics.median(help_samples) * 1000, 2)}
+    print(f"{'main.py --help':<20} {results['main.py --help']['median_ms']:8.1f} ms")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"python": sys.version.split()[0], "results": results}, f, indent=2)
+    if args.check and failures:
+        print("Import regressions:", ", ".join(failures))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
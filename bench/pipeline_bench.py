@@ -0,0 +1,395 @@
+# bench/pipeline_bench.py
+# 离线端到端基准：不需要 GPU。从 SWE-bench Extra 实例文件（见 input/data_description.md）抽样，
+# 为每个实例合成小型仓库压缩包（包含金标准补丁涉及的文件），用 FakeBackend（可叠加已录制的回复缓存）
+# 端到端运行 Predictor，报告吞吐、各阶段延迟、内存峰值，以及不同仓库规模下
+# stringify_directory / fetch_file_contents 的耗时。结果写成 JSON，可与其他提交的结果比较：
+#   python bench/pipeline_bench.py --instances train.parquet --sample 32 --output bench.json
+#   python bench/pipeline_bench.py --compare bench.json --max-regression 0.2
+# 比较要求参数与基线一致且 --repeat 不少于 MIN_COMPARE_REPEAT；变慢幅度低于噪声下限的指标不算回归。
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import re
+import resource
+import shutil
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+import tracemalloc
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+import tracing
+from llm_backends import FakeBackend
+from llm_provider import LLMProvider
+from pipeline_scheduler import PipelineScheduler
+from predictor import Predictor, REPO_PATH
+from repo_index import RepoIndex
+from utils import Utils
+from virtual_repo import open_repo_source
+
+WORDS = [
+    "parser", "config", "render", "session", "request", "encode", "decode", "cache", "token", "schema",
+    "loader", "widget", "handler", "record", "stream", "buffer", "matrix", "format", "index", "client",
+]
+PROBLEM_TEMPLATES = [
+    "Calling {a}.{b}() raises TypeError when {c} is None.",
+    "{a} ignores the {b} option and always uses the default {c}.",
+    "Regression: {a}_{b} returns an empty {c} after upgrading.",
+]
+# 比较时热点测量至少重复的次数：单次测量的抖动可达 1.5~2 倍
+MIN_COMPARE_REPEAT = 3
+# 不影响测量结果、比较时不要求一致的参数
+COMPARE_OPTIONS = ("max_regression", "noise_floor_ms")
+# 内存指标的噪声下限（MB）
+PEAK_MB_NOISE_FLOOR = 1.0
+
+
+# ---- 合成仓库 ----
+
+def identifiers(text):
+    words = sorted(set(re.findall(r"\b[a-z_][a-z0-9_]{3,20}\b", text.lower())))
+    return words or WORDS
+
+
+def synthetic_module(rng, words, num_functions=8):
+    lines = ['"""Synthetic module for benchmarking."""', "import os", ""]
+    for i in range(num_functions):
+        name = f"{rng.choice(words)}_{rng.choice(WORDS)}_{i}"
+        lines += [
+            "",
+            f"def {name}(value, {rng.choice(WORDS)}=None):",
+            f'    """Handle {rng.choice(words)} for {rng.choice(WORDS)}."""',
+            "    if value is None:",
+            f"        return {rng.choice(WORDS)!r}",
+            f"    result = [item for item in value if item != {rng.choice(words)!r}]",
+            "    return os.path.join(*result) if result else None",
+        ]
+    return "\n".join(lines) + "\n"
+
+
+def synthetic_tree(num_files, words, rng):
+    """生成 (相对路径, 文本) 列表：若干包目录下的模块、测试与文档。"""
+    files = []
+    per_package = 20
+    for i in range(num_files):
+        package = f"pkg_{i // per_package}"
+        if i % per_package == 0:
+            files.append((f"src/{package}/__init__.py", synthetic_module(rng, words, 1)))
+        elif i % 10 == 9:
+            files.append((f"tests/test_{package}_{i}.py", synthetic_module(rng, words, 3)))
+        elif i % 25 == 24:
+            files.append((f"docs/{package}_{i}.md", f"# {rng.choice(words)}\n\nUsage notes.\n"))
+        else:
+            files.append((f"src/{package}/{rng.choice(words)}_{i}.py", synthetic_module(rng, words)))
+    return files
+
+
+def gold_files(patch):
+    """从金标准补丁还原被修改文件的原始内容（上下文行与删除行放回原行号，其余行用占位填充）。"""
+    files = {}
+    current = None
+    old_line = 0
+    for line in (patch or "").splitlines():
+        if line.startswith("--- a/"):
+            current = files.setdefault(line[6:].strip(), {})
+        elif line.startswith("--- "):
+            current = None
+        elif line.startswith("@@") and current is not None:
+            match = re.match(r"@@ -(\d+)", line)
+            old_line = int(match.group(1)) if match else 1
+        elif current is not None and line[:1] in (" ", "-") and not line.startswith("---"):
+            current[old_line] = line[1:]
+            old_line += 1
+    texts = {}
+    for path, lines in files.items():
+        last = max(lines) if lines else 0
+        texts[path] = "\n".join(lines.get(i, "# filler") for i in range(1, last + 1)) + "\n"
+    return texts
+
+
+def write_archive(path, files):
+    with tarfile.open(path, "w") as tar:
+        for relpath, text in files:
+            data = text.encode("utf-8")
+            info = tarfile.TarInfo(relpath)
+            info.size = len(data)
+            info.mtime = 0
+            tar.addfile(info, io.BytesIO(data))
+
+
+def write_tree(root, files):
+    for relpath, text in files:
+        target = os.path.join(root, relpath)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, "w", encoding="utf-8") as f:
+            f.write(text)
+
+
+# ---- 实例 ----
+
+def load_sample(path, sample, rng, work_dir, repo_files):
+    """读取实例文件并抽样（未提供时合成问题描述），为每个实例写出合成仓库压缩包。"""
+    if path:
+        from main import load_instances
+        records = load_instances(path, work_dir)
+        records = rng.sample(records, min(sample, len(records)))
+    else:
+        records = []
+        for i in range(sample):
+            template = rng.choice(PROBLEM_TEMPLATES)
+            records.append({
+                "instance_id": f"synthetic__{i}",
+                "problem_statement": template.format(a=rng.choice(WORDS), b=rng.choice(WORDS), c=rng.choice(WORDS)),
+            })
+    instances = []
+    for record in records:
+        words = identifiers(record["problem_statement"])
+        files = dict(synthetic_tree(repo_files, words, rng))
+        files.update(gold_files(record.get("patch")))
+        archive = os.path.join(work_dir, f"{record['instance_id'].replace('/', '__')}.tar")
+        write_archive(archive, sorted(files.items()))
+        instances.append({
+            "instance_id": record["instance_id"],
+            "problem_statement": record["problem_statement"],
+            "archive": archive,
+        })
+    return instances
+
+
+# ---- 端到端 ----
+
+def make_predictor(args):
+    backend = FakeBackend(latency=args.latency)
+    # --replay 为已录制的回复缓存（main.py --cache 生成），命中时回放真实回复，未命中时由替身生成
+    llm_provider = LLMProvider(backend, cache_path=args.replay)
+    return Predictor(
+        num_candidates=args.num_candidates, early_exit=args.early_exit,
+        localization=args.localization, llm_provider=llm_provider,
+    )
+
+
+def run_predictions(instances, args):
+    predictor = make_predictor(args)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        if args.pipeline:
+            return PipelineScheduler(predictor, queue_size=args.queue_size, max_batch=args.batch_size).run(instances)
+        return predictor.predict_batch(instances, batch_size=args.batch_size)
+
+
+def bench_pipeline(instances, args, work_dir):
+    """计时与阶段延迟一轮（开启追踪），内存峰值另跑一轮（tracemalloc 会拖慢计时）。"""
+    trace_path = os.path.join(work_dir, "trace.jsonl")
+    tracing.configure(trace_path)
+    start = time.perf_counter()
+    predictions = run_predictions(instances, args)
+    seconds = time.perf_counter() - start
+    tracing.configure(None)
+    stages, overall = tracing.summarize(tracing.load_spans(trace_path))
+
+    tracemalloc.start()
+    run_predictions(instances, args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        "instances": len(instances),
+        "with_patch": sum(1 for patch in predictions.values() if patch),
+        "seconds": round(seconds, 3),
+        "seconds_per_instance": round(seconds / max(1, len(instances)), 4),
+        "instances_per_min": round(len(instances) / seconds * 60, 1) if seconds else None,
+        "peak_mb": round(peak / 1024 ** 2, 2),
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "stages": {
+            group: {key: round(stats[key], 3) for key in ("count", "p50_ms", "p95_ms", "total_ms")}
+            for group, stats in sorted(stages.items())
+        },
+        "generated_tokens_per_accepted": overall["generated_tokens_per_accepted"],
+    }
+
+
+# ---- CPU 热点 ----
+
+def timed(function, repeat):
+    """重复 repeat 次取最小值（毫秒），受机器负载的影响比中位数小。"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - start)
+    return round(min(samples) * 1000, 3)
+
+
+def bench_hot_paths(sizes, repeat, rng, work_dir):
+    """每种规模分别以磁盘目录和 tar 包为来源，测量冷索引下的目录列表与文件内容提取耗时。"""
+    results = {}
+    for size in sizes:
+        files = synthetic_tree(size, WORDS, rng)
+        root = os.path.join(work_dir, f"tree_{size}")
+        write_tree(root, files)
+        archive = os.path.join(work_dir, f"tree_{size}.tar")
+        write_archive(archive, files)
+        modules = [relpath for relpath, _ in files if relpath.endswith(".py")]
+        queried = [(relpath, rng.choice(WORDS)) for relpath in rng.sample(modules, min(5, len(modules)))]
+
+        def directory_index():
+            return RepoIndex(root)
+
+        def archive_index():
+            return RepoIndex(REPO_PATH, open_repo_source(archive, work_dir))
+
+        for source, make_index in (("dir", directory_index), ("tar", archive_index)):
+            def stringify():
+                index = make_index()
+                Utils.stringify_directory(index.root, repo_index=index)
+                index.source.close()
+
+            def fetch():
+                index = make_index()
+                query = {os.path.join(index.root, relpath): ["def ", word] for relpath, word in queried}
+                Utils.fetch_file_contents(query, repo_path=index.root, repo_index=index)
+                index.source.close()
+
+            result = results[f"{size}/{source}"] = {
+                "files": size, "stringify_ms": timed(stringify, repeat), "fetch_ms": timed(fetch, repeat),
+            }
+            print(f"  {size:6d} files ({source}): stringify {result['stringify_ms']:8.2f} ms, "
+                  f"fetch {result['fetch_ms']:8.2f} ms")
+    return results
+
+
+# ---- 比较 ----
+
+def flatten(results):
+    """{指标路径: 值}，只包含比较时检查的指标（越小越好）；耗时统一为毫秒。"""
+    metrics = {
+        "pipeline.ms_per_instance": results["pipeline"]["seconds_per_instance"] * 1000,
+        "pipeline.peak_mb": results["pipeline"]["peak_mb"],
+    }
+    for name, values in results["hot_paths"].items():
+        for key in ("stringify_ms", "fetch_ms"):
+            metrics[f"{name}.{key}"] = values[key]
+    return metrics
+
+
+def comparison_errors(params, baseline):
+    """与基线不可比较的原因列表：参数不同，或重复次数太少。"""
+    previous = baseline.get("params")
+    if previous is None:
+        return ["baseline has no recorded parameters"]
+    errors = []
+    changed = sorted(
+        key for key in set(params) | set(previous)
+        if key not in COMPARE_OPTIONS and params.get(key) != previous.get(key)
+    )
+    if changed:
+        errors.append("parameters differ from the baseline: " + ", ".join(
+            f"{key}={previous.get(key)!r} -> {params.get(key)!r}" for key in changed
+        ))
+    if min(params.get("repeat") or 0, previous.get("repeat") or 0) < MIN_COMPARE_REPEAT:
+        errors.append(f"--repeat must be at least {MIN_COMPARE_REPEAT} in both runs to compare")
+    return errors
+
+
+def compare(results, baseline, max_regression, noise_floor_ms):
+    """
+    打印与基线的比值，返回回归的指标列表：比值超过 1 + max_regression，
+    且绝对差值超过噪声下限（耗时 noise_floor_ms 毫秒，内存 PEAK_MB_NOISE_FLOOR MB）。
+    """
+    regressions = []
+    current, previous = flatten(results), flatten(baseline)
+    print(f"Compared with {baseline.get('commit') or 'baseline'}:")
+    for name, value in current.items():
+        if name not in previous or not previous[name]:
+            continue
+        ratio = value / previous[name]
+        floor = PEAK_MB_NOISE_FLOOR if name.endswith("_mb") else noise_floor_ms
+        flag = ""
+        if ratio > 1 + max_regression:
+            flag = "  REGRESSION" if value - previous[name] > floor else "  (within noise)"
+        print(f"  {name:<36} {previous[name]:10.3f} -> {value:10.3f} ({ratio:5.2f}x){flag}")
+        if flag == "  REGRESSION":
+            regressions.append(name)
+    return regressions
+
+
+def git_commit():
+    result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True)
+    return result.stdout.strip() or None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线端到端基准（替身推理后端，不需要 GPU）")
+    parser.add_argument("--instances", type=str, default=None,
+                        help="SWE-bench Extra 实例文件（.parquet 或 .jsonl）；不提供时合成问题描述")
+    parser.add_argument("--sample", type=int, default=16, help="抽样的实例数")
+    parser.add_argument("--seed", type=int, default=0, help="抽样与合成仓库的随机种子")
+    parser.add_argument("--repo-files", type=int, default=200, help="端到端运行中每个合成仓库的文件数")
+    parser.add_argument("--repo-sizes", type=str, default="100,1000,5000",
+                        help="CPU 热点测量的仓库规模（文件数，逗号分隔）")
+    parser.add_argument("--repeat", type=int, default=5, help="CPU 热点每项重复次数（取最小值）")
+    parser.add_argument("--latency", type=float, default=0.0, help="替身后端每次 generate 的延迟（秒）")
+    parser.add_argument("--replay", type=str, default=None, help="已录制的回复缓存（SQLite），命中时回放")
+    parser.add_argument("--pipeline", action="store_true", help="使用异步多阶段流水线")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--queue-size", type=int, default=8)
+    parser.add_argument("--num-candidates", type=int, default=None)
+    parser.add_argument("--early-exit", action="store_true")
+    parser.add_argument("--localization", choices=["flat", "lazy"], default="flat")
+    parser.add_argument("--output", type=str, default=None, help="结果写入 JSON 文件")
+    parser.add_argument("--compare", type=str, default=None, help="与之前写出的结果比较")
+    parser.add_argument("--max-regression", type=float, default=0.2,
+                        help="比较时允许的最大变慢比例，超过则返回非零")
+    parser.add_argument("--noise-floor-ms", type=float, default=2.0,
+                        help="比较时耗时指标的噪声下限：变慢不超过该毫秒数的不算回归")
+    args = parser.parse_args()
+
+    params = {key: value for key, value in vars(args).items() if key not in ("output", "compare")}
+    baseline = None
+    if args.compare:
+        # 先检查可比性，避免跑完整个基准才发现结果不能比较
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        errors = comparison_errors(params, baseline)
+        if errors:
+            parser.error("cannot compare with " + args.compare + ": " + "; ".join(errors))
+
+    rng = random.Random(args.seed)
+    work_dir = tempfile.mkdtemp(prefix="chainpatch-bench-")
+    try:
+        instances = load_sample(args.instances, args.sample, rng, work_dir, args.repo_files)
+        print(f"End-to-end: {len(instances)} instance(s), {args.repo_files} files per repo")
+        pipeline = bench_pipeline(instances, args, work_dir)
+        print(f"  {pipeline['instances_per_min']} instances/min, {pipeline['with_patch']} with patch, "
+              f"peak {pipeline['peak_mb']} MB (traced), max RSS {pipeline['max_rss_mb']} MB")
+        for group, stats in pipeline["stages"].items():
+            print(f"  {group:<28} p50 {stats['p50_ms']:9.2f} ms  p95 {stats['p95_ms']:9.2f} ms")
+        print("CPU hot paths:")
+        hot_paths = bench_hot_paths([int(size) for size in args.repo_sizes.split(",")], args.repeat, rng, work_dir)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    results = {
+        "commit": git_commit(),
+        "python": sys.version.split()[0],
+        "params": params,
+        "pipeline": pipeline,
+        "hot_paths": hot_paths,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if baseline is not None:
+        regressions = compare(results, baseline, args.max_regression, args.noise_floor_ms)
+        if regressions:
+            print("Regressions:", ", ".join(regressions))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+# blob_store.py
+import errno
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import tarfile
+import tempfile
+import threading
+import time
+from collections import Counter
+
+# Linux FICLONE ioctl：在支持的文件系统（btrfs、xfs 等）上做写时复制克隆
+FICLONE = 0x40049409
+# 当前方式不可用（跨文件系统、不支持克隆、链接数上限等）时改用下一种方式
+LINK_ERRORS = {errno.EXDEV, errno.EPERM, errno.EOPNOTSUPP, errno.ENOTTY, errno.EINVAL, errno.EMLINK}
+
+
+def reflink(src, dst):
+    with open(src, "rb") as source, open(dst, "wb") as target:
+        try:
+            fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+        except OSError:
+            target.close()
+            os.unlink(dst)
+            raise
+
+
+class BlobSource:
+    """以 BlobStore 中某个压缩包的清单为后端的仓库文件来源，接口与 virtual_repo.ArchiveSource 相同。"""
+    def __init__(self, store, key, files):
+        self.store = store
+        self.key = key
+        # {相对路径: (blob 名称, 字节数)}
+        self.files = files
+
+    def list_files(self, skip_dir=None):
+        files = []
+        for name in sorted(self.files):
+            parts = name.split(os.sep)[:-1]
+            if skip_dir and any(skip_dir(part) for part in parts):
+                continue
+            files.append((name, self.files[name][1]))
+        return files
+
+    def is_file(self, relpath):
+        return os.path.normpath(relpath) in self.files
+
+    def read_bytes(self, relpath):
+        with open(self.store.blob_path(self.files[os.path.normpath(relpath)][0]), "rb") as f:
+            return f.read()
+
+    def materialize(self, relpaths, dest):
+        for relpath in relpaths:
+            target = os.path.join(dest, relpath)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            self.store.link(self.files[os.path.normpath(relpath)][0], target)
+
+    def close(self):
+        self.store.release(self.key)
+
+
+class BlobStore:
+    """
+    内容寻址的仓库文件存储，同一仓库的多个压缩包（相近的提交）共享相同内容的文件：
+    - blobs/ab/cdef...：按内容 sha1 存放的只读文件（可执行文件加 .x 后缀，权限与内容一起寻址）；
+    - store.db：manifests 表记录每个已导入压缩包的清单 {相对路径: [blob 名称, 字节数]}，
+      blobs 表记录每个 blob 被多少个清单引用；
+    - 导入压缩包时只写入新的 blob；物化工作目录时默认用 reflink，文件系统不支持时复制；
+    - 引用数降为 0 的 blob 被回收；超过 quota_bytes 时按最近使用时间淘汰未在使用中的清单。
+    link="hardlink" 时物化的文件与存储共享 inode：以 root 运行的测试原地修改仓库文件会破坏存储，
+    只在确定工作目录中的文件都先删除再写（如 execution_verifier.apply_contents）时使用。
+    """
+    def __init__(self, root, quota_bytes=20 * 1024 ** 3, link="auto"):
+        self.root = root
+        self.quota_bytes = quota_bytes
+        # auto / reflink / hardlink / copy
+        self.link_mode = link
+        os.makedirs(os.path.join(root, "blobs"), exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(root, "store.db"), check_same_thread=False, timeout=60)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS blobs (name TEXT PRIMARY KEY, size INTEGER, refs INTEGER)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS manifests ("
+            "key TEXT PRIMARY KEY, archive TEXT, files TEXT, size INTEGER, last_access REAL)"
+        )
+        self.conn.commit()
+        self._lock = threading.RLock()
+        # 本进程中正在使用的清单（打开的 BlobSource），淘汰时跳过
+        self._in_use = Counter()
+        # 第一次成功的物化方式，之后不再尝试更快但不支持的方式
+        self._link_methods = None
+        # 正在导入、尚未计入引用数的 blob，回收时跳过
+        self._pending = Counter()
+
+    def blob_path(self, name):
+        return os.path.join(self.root, "blobs", name[:2], name[2:])
+
+    @staticmethod
+    def archive_key(archive_path):
+        stat = os.stat(archive_path)
+        raw = f"{os.path.abspath(archive_path)}|{stat.st_size}|{stat.st_mtime_ns}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def open(self, archive_path):
+        """导入（已导入则复用）压缩包并返回 BlobSource；不是 tar 包时抛出 tarfile.ReadError。"""
+        key = self.archive_key(archive_path)
+        with self._lock:
+            self._in_use[key] += 1
+        try:
+            files = self.lookup(key)
+            if files is None:
+                files = self.import_archive(archive_path, key)
+        except BaseException:
+            self.release(key)
+            raise
+        return BlobSource(self, key, files)
+
+    def release(self, key):
+        with self._lock:
+            self._in_use[key] -= 1
+            if self._in_use[key] <= 0:
+                del self._in_use[key]
+
+    def lookup(self, key):
+        with self._lock:
+            row = self.conn.execute("SELECT files FROM manifests WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self.conn.execute("UPDATE manifests SET last_access = ? WHERE key = ?", (time.time(), key))
+            self.conn.commit()
+        return {relpath: tuple(entry) for relpath, entry in json.loads(row[0]).items()}
+
+    def import_archive(self, archive_path, key):
+        """顺序读取 tar 包（支持压缩格式），只写入存储中还没有的 blob，返回清单。"""
+        start = time.time()
+        files = {}
+        new_blobs = 0
+        new_bytes = 0
+        try:
+            self.read_archive(archive_path, files)
+            new_blobs, new_bytes = self.commit_manifest(archive_path, key, files)
+        finally:
+            with self._lock:
+                self._pending.subtract(blob for blob, _ in files.values())
+                self._pending = +self._pending
+        print(f"Imported {archive_path}: {len(files)} files, {new_blobs} new blobs "
+              f"({new_bytes / 1024 ** 2:.1f} MB) in {time.time() - start:.2f}s")
+        self.enforce_quota(keep=key)
+        return files
+
+    def read_archive(self, archive_path, files):
+        with tarfile.open(archive_path, "r|*") as tar:
+            for member in tar:
+                if not member.isfile():
+                    continue
+                name = os.path.normpath(member.name)
+                if name.startswith("..") or os.path.isabs(name):
+                    continue
+                data = tar.extractfile(member).read()
+                blob = hashlib.sha1(data).hexdigest() + (".x" if member.mode & 0o100 else "")
+                with self._lock:
+                    self._pending[blob] += 1
+                self.write_blob(blob, data)
+                files[name] = (blob, len(data))
+
+    def commit_manifest(self, archive_path, key, files):
+        """记录清单并增加 blob 引用数，返回 (新 blob 数, 新 blob 字节数)。"""
+        sizes = {blob: size for blob, size in files.values()}
+        new_blobs = new_bytes = 0
+        with self._lock:
+            # 并发导入同一压缩包时只记录一次
+            if self.conn.execute("SELECT 1 FROM manifests WHERE key = ?", (key,)).fetchone() is None:
+                self.conn.execute(
+                    "INSERT INTO manifests (key, archive, files, size, last_access) VALUES (?, ?, ?, ?, ?)",
+                    (key, os.path.abspath(archive_path), json.dumps(files), sum(sizes.values()), time.time()),
+                )
+                known = self.known_blobs(list(sizes))
+                for blob, size in sizes.items():
+                    if blob not in known:
+                        new_blobs += 1
+                        new_bytes += size
+                    self.conn.execute(
+                        "INSERT INTO blobs (name, size, refs) VALUES (?, ?, 1) "
+                        "ON CONFLICT(name) DO UPDATE SET refs = refs + 1",
+                        (blob, size),
+                    )
+                self.conn.commit()
+        return new_blobs, new_bytes
+
+    def known_blobs(self, names):
+        known = set()
+        for start in range(0, len(names), 500):
+            chunk = names[start:start + 500]
+            known.update(row[0] for row in self.conn.execute(
+                f"SELECT name FROM blobs WHERE name IN ({','.join('?' * len(chunk))})", chunk
+            ))
+        return known
+
+    def write_blob(self, name, data):
+        """原子写入 blob（临时文件 + rename）；已存在时跳过。"""
+        path = self.blob_path(name)
+        if os.path.exists(path):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.chmod(tmp, 0o555 if name.endswith(".x") else 0o444)
+        os.replace(tmp, path)
+
+    def link(self, name, target):
+        """把 blob 物化到 target：按 link_mode 尝试 reflink（写时复制）或硬链接，不可用时复制。"""
+        source = self.blob_path(name)
+        if os.path.lexists(target):
+            os.unlink(target)
+        methods = self._link_methods or {
+            "auto": ["reflink", "copy"], "reflink": ["reflink", "copy"],
+            "hardlink": ["hardlink", "copy"], "copy": ["copy"],
+        }[self.link_mode]
+        for i, method in enumerate(methods):
+            try:
+                if method == "reflink":
+                    reflink(source, target)
+                elif method == "hardlink":
+                    os.link(source, target)
+                else:
+                    shutil.copyfile(source, target)
+            except OSError as e:
+                if method == "copy" or e.errno not in LINK_ERRORS:
+                    raise
+                continue
+            self._link_methods = methods[i:]
+            if method != "hardlink":
+                # 克隆与复制得到独立的文件，恢复可写权限
+                os.chmod(target, 0o755 if name.endswith(".x") else 0o644)
+            return
+
+    def remove(self, key):
+        """删除清单并把其中 blob 的引用数减一，随后回收无引用的 blob。"""
+        with self._lock:
+            row = self.conn.execute("SELECT files FROM manifests WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return
+            blobs = {entry[0] for entry in json.loads(row[0]).values()}
+            self.conn.execute("DELETE FROM manifests WHERE key = ?", (key,))
+            self.conn.executemany("UPDATE blobs SET refs = refs - 1 WHERE name = ?", [(blob,) for blob in blobs])
+            self.conn.commit()
+        self.gc()
+
+    def gc(self):
+        """删除引用数为 0 的 blob，返回释放的字节数。"""
+        with self._lock:
+            rows = [
+                (name, size) for name, size in self.conn.execute("SELECT name, size FROM blobs WHERE refs <= 0")
+                if name not in self._pending
+            ]
+            for name, _ in rows:
+                try:
+                    os.unlink(self.blob_path(name))
+                except FileNotFoundError:
+                    pass
+            self.conn.executemany("DELETE FROM blobs WHERE name = ?", [(name,) for name, _ in rows])
+            self.conn.commit()
+        return sum(size for _, size in rows)
+
+    def disk_usage(self):
+        with self._lock:
+            return self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+
+    def enforce_quota(self, keep=None):
+        """超过配额时按最近使用时间淘汰清单（跳过使用中的与 keep），直到回到配额以内。"""
+        with self._lock:
+            if self.disk_usage() <= self.quota_bytes:
+                return
+            keys = [row[0] for row in self.conn.execute("SELECT key FROM manifests ORDER BY last_access")]
+            for key in keys:
+                if key == keep or key in self._in_use:
+                    continue
+                self.remove(key)
+                if self.disk_usage() <= self.quota_bytes:
+                    break
+            print(f"Blob store usage after eviction: {self.disk_usage() / 1024 ** 3:.2f} GB")
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,102 @@
+# candidate_clusters.py
+import ast
+import difflib
+import hashlib
+import os
+
+from patch_validator import PatchValidator, PatchError
+
+
+class CandidateCluster:
+    """语义相同的一组候选补丁：patch 为代表（规范化后的 diff），size 为被采样到的次数。"""
+    def __init__(self, key, patch, size=0):
+        self.key = key
+        self.patch = patch
+        self.size = size
+
+
+def unified_diff(rel, old_text, new_text):
+    """标准 3 行上下文的统一 diff；新建/删除文件使用 /dev/null，末尾缺少换行时加注 "\\ No newline"。"""
+    old_lines = old_text.splitlines(keepends=True)
+    new_lines = new_text.splitlines(keepends=True)
+    lines = []
+    for line in difflib.unified_diff(
+        old_lines, new_lines,
+        fromfile=f"a/{rel}" if old_lines else "/dev/null",
+        tofile=f"b/{rel}" if new_lines else "/dev/null",
+    ):
+        lines.append(line)
+        if not line.endswith("\n"):
+            lines.append("\n\\ No newline at end of file\n")
+    return "".join(lines)
+
+
+class CandidateClusterer:
+    """
+    候选补丁的规范化、去重与聚类：
+    1. 用 PatchValidator 在内存中把补丁应用到仓库（容忍错误的行号与空白差异），再与原文件重新生成 diff，
+       得到与模型写法无关的规范化补丁（标准 hunk 头、固定 3 行上下文、文件按路径排序）；
+    2. 按补丁后文件的语义聚类：Python 文件比较 AST（忽略注释、空白与格式），其他文件比较去掉行尾空白的文本；
+    3. 按簇大小降序返回，每簇只需验证一个代表，簇大小可作为额外的赞成票。
+    无法应用的补丁各自成簇（以原文为键，内容不变）；应用后没有任何改动的补丁被丢弃。
+    """
+    def __init__(self, repo_index):
+        self.repo_index = repo_index
+        self.validator = PatchValidator(repo_index)
+        # {文本哈希: 语义摘要}，同一文件的多个候选常常完全相同
+        self._digests = {}
+
+    def original(self, rel):
+        if not self.validator.exists(rel):
+            return ""
+        return "".join(self.repo_index.read_lines(os.path.join(self.repo_index.root, rel)))
+
+    def normalize(self, patch_string):
+        """返回 (规范化补丁, {相对路径: 新文本或 None（删除）})；无法应用时抛出 PatchError。"""
+        _, contents = self.validator.apply(patch_string)
+        parts = []
+        for rel in sorted(contents):
+            old_text = self.original(rel)
+            new_text = contents[rel] or ""
+            # 应用补丁时总是补上末尾换行；原文件没有时保持原样，不产生无关的改动
+            if old_text and not old_text.endswith("\n") and new_text.endswith("\n"):
+                new_text = new_text[:-1]
+            parts.append(unified_diff(rel, old_text, new_text))
+        return "".join(parts), contents
+
+    def digest(self, rel, text):
+        if text is None:
+            return None
+        raw = hashlib.sha1(text.encode("utf-8")).hexdigest()
+        if raw not in self._digests:
+            canonical = None
+            if rel.endswith(".py"):
+                try:
+                    # ast.dump 默认不含行号等位置信息，注释与格式差异不影响结果
+                    canonical = ast.dump(ast.parse(text))
+                except (SyntaxError, ValueError):
+                    canonical = None
+            if canonical is None:
+                canonical = "\n".join(line.rstrip() for line in text.splitlines())
+            self._digests[raw] = hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+        return self._digests[raw]
+
+    def semantic_key(self, contents):
+        return tuple(sorted((rel, self.digest(rel, text)) for rel, text in contents.items()))
+
+    def cluster(self, patches):
+        """把候选补丁列表聚类，返回按 (簇大小降序, 首次出现顺序) 排列的 CandidateCluster 列表。"""
+        clusters = {}
+        for patch in patches:
+            try:
+                canonical, contents = self.normalize(patch)
+            except PatchError:
+                key, canonical = ("raw", patch), patch
+            else:
+                if not canonical:
+                    continue
+                key = self.semantic_key(contents)
+            if key not in clusters:
+                clusters[key] = CandidateCluster(key, canonical)
+            clusters[key].size += 1
+        return sorted(clusters.values(), key=lambda cluster: -cluster.size)
@@ -1,10 +1,4 @@
 from collections import defaultdict
-from swebench.harness.constants import (
-    MAP_REPO_TO_REQS_PATHS,
-    MAP_REPO_TO_TEST_FRAMEWORK,
-    MAP_VERSION_TO_INSTALL,
-)
-from swebench.harness.log_parsers import parse_log_pytest, MAP_REPO_TO_PARSER
 
 MAP_VERSION_TO_INSTALL_PLACEHOLDER = {
     "0.0": {
@@ -45,14 +39,38 @@ TEST_PYTEST_WO_DEPRECATION = (
     "pytest --no-header -rA --tb=no  -p no:cacheprovider -W ignore::DeprecationWarning"
 )
 
-
-MAP_REPO_TO_REQS_PATHS = defaultdict(
-    lambda: MAP_REPO_TO_REQS_PATHS_PLACEHOLDER, MAP_REPO_TO_REQS_PATHS
-)
-MAP_REPO_TO_TEST_FRAMEWORK = defaultdict(
-    lambda: TEST_PYTEST_WO_DEPRECATION, MAP_REPO_TO_TEST_FRAMEWORK
+# 以下映射依赖 swebench，第一次访问时才导入（constants.MAP_... 或 from constants import MAP_...）
+LAZY_MAPS = (
+    "MAP_REPO_TO_REQS_PATHS",
+    "MAP_REPO_TO_TEST_FRAMEWORK",
+    "MAP_VERSION_TO_INSTALL",
+    "MAP_REPO_TO_PARSER",
 )
-MAP_VERSION_TO_INSTALL = defaultdict(
-    lambda: MAP_VERSION_TO_INSTALL_PLACEHOLDER, MAP_VERSION_TO_INSTALL
-)
-MAP_REPO_TO_PARSER = defaultdict(lambda: parse_log_pytest, MAP_REPO_TO_PARSER)
\ No newline at end of file
+
+
+def load_swebench_maps():
+    from swebench.harness.constants import (
+        MAP_REPO_TO_REQS_PATHS,
+        MAP_REPO_TO_TEST_FRAMEWORK,
+        MAP_VERSION_TO_INSTALL,
+    )
+    from swebench.harness.log_parsers import parse_log_pytest, MAP_REPO_TO_PARSER
+    return {
+        "MAP_REPO_TO_REQS_PATHS": defaultdict(
+            lambda: MAP_REPO_TO_REQS_PATHS_PLACEHOLDER, MAP_REPO_TO_REQS_PATHS
+        ),
+        "MAP_REPO_TO_TEST_FRAMEWORK": defaultdict(
+            lambda: TEST_PYTEST_WO_DEPRECATION, MAP_REPO_TO_TEST_FRAMEWORK
+        ),
+        "MAP_VERSION_TO_INSTALL": defaultdict(
+            lambda: MAP_VERSION_TO_INSTALL_PLACEHOLDER, MAP_VERSION_TO_INSTALL
+        ),
+        "MAP_REPO_TO_PARSER": defaultdict(lambda: parse_log_pytest, MAP_REPO_TO_PARSER),
+    }
+
+
+def __getattr__(name):
+    if name in LAZY_MAPS:
+        globals().update(load_swebench_maps())
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
\ No newline at end of file
@@ -0,0 +1,164 @@
+# directory_renderer.py
+import os
+import re
+
+# 测试与文档目录/文件，按策略从目录列表中去掉
+TEST_DIR_NAMES = {"test", "tests", "testing", "unittests", "test_data", "testdata"}
+DOC_DIR_NAMES = {"doc", "docs", "documentation", "examples", "example", "benchmarks"}
+DOC_EXTENSIONS = {".md", ".rst", ".txt", ".html", ".css", ".ipynb"}
+# 保留的顶层说明/配置文件
+KEEP_FILES = {"setup.py", "setup.cfg", "pyproject.toml", "tox.ini", "conftest.py"}
+
+
+def split_identifiers(text):
+    """把文本切分为小写标识符片段：snake_case、CamelCase 与路径分隔符都会拆开。"""
+    words = set()
+    for word in re.findall(r"[A-Za-z_][A-Za-z0-9_]*", text):
+        for part in re.split(r"_+", word):
+            for piece in re.findall(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|[0-9]+", part):
+                if len(piece) > 2:
+                    words.add(piece.lower())
+        if len(word) > 2:
+            words.add(word.lower())
+    return words
+
+
+class DirectoryRenderer:
+    """
+    在给定 token 预算内渲染目录列表：
+    1. 按策略去掉测试、文档文件；
+    2. 按路径与问题描述的词汇重叠打分；
+    3. 超出预算时，优先把得分低、层级深的子目录折叠为一行摘要，直到放得下；
+    4. 最终对完整字符串计数，仍超出则按得分从低到高删行，保证不超预算。
+    """
+    def __init__(self, tokenizer, drop_tests=True, drop_docs=True, count_line=None):
+        self.tokenizer = tokenizer
+        self.drop_tests = drop_tests
+        self.drop_docs = drop_docs
+        # 逐行计数（路径与折叠摘要）：传入 PromptBudget.count 时使用其 LRU 缓存，
+        # 同一仓库的路径在各实例、各次渲染之间只编码一次；整体文本仍直接编码
+        self.count_line = count_line or self.count_tokens
+
+    def count_tokens(self, text):
+        return len(self.tokenizer.encode(text, add_special_tokens=False))
+
+    def keep(self, relpath):
+        parts = relpath.split(os.sep)
+        filename = parts[-1]
+        if filename in KEEP_FILES:
+            return True
+        dirs = {part.lower() for part in parts[:-1]}
+        if self.drop_tests and (
+            dirs & TEST_DIR_NAMES or filename.startswith("test_") or filename.endswith("_test.py")
+        ):
+            return False
+        if self.drop_docs and (
+            dirs & DOC_DIR_NAMES or os.path.splitext(filename)[1].lower() in DOC_EXTENSIONS
+        ):
+            return False
+        return True
+
+    def keep_directory(self, reldir):
+        dirs = {part.lower() for part in reldir.split(os.sep)}
+        if self.drop_tests and dirs & TEST_DIR_NAMES:
+            return False
+        if self.drop_docs and dirs & DOC_DIR_NAMES:
+            return False
+        return True
+
+    @staticmethod
+    def score(relpath, problem_words, problem_statement):
+        words = split_identifiers(relpath)
+        score = len(words & problem_words)
+        stem = os.path.splitext(os.path.basename(relpath))[0]
+        if len(stem) > 2 and stem in problem_statement:
+            score += 2
+        return score
+
+    def render(self, repo_index, problem_statement, token_budget, boost=None):
+        """boost 为 {完整路径: 加分}（如检索索引排在前面的文件），加分的文件最后才会被折叠或删去。"""
+        root = repo_index.root
+        problem_words = split_identifiers(problem_statement)
+        boost = boost or {}
+        entries = []
+        for path, _, _ in repo_index.files:
+            relpath = os.path.relpath(path, root)
+            if self.keep(relpath) or path in boost:
+                score = self.score(relpath, problem_words, problem_statement) + boost.get(path, 0)
+                entries.append((path, relpath, score))
+
+        line_tokens = {path: self.count_line(path + "\n") for path, _, _ in entries}
+        total = sum(line_tokens.values())
+        collapsed = {}
+        if total > token_budget:
+            collapsed = self.collapse(entries, line_tokens, total, token_budget, root)
+
+        lines = []
+        emitted = set()
+        for path, relpath, score in entries:
+            collapsed_dir = self.collapsed_ancestor(relpath, collapsed)
+            if collapsed_dir is None:
+                lines.append((path, score))
+            elif collapsed_dir not in emitted:
+                emitted.add(collapsed_dir)
+                lines.append((self.summary_line(root, collapsed_dir, collapsed[collapsed_dir]), score))
+
+        # 以整体编码结果为准，必要时删去得分最低的行
+        text = "\n".join(line for line, _ in lines)
+        while lines and self.count_tokens(text) > token_budget:
+            drop = max(1, len(lines) // 20)
+            ranked = sorted(range(len(lines)), key=lambda i: lines[i][1])
+            removed = set(ranked[:drop])
+            lines = [line for i, line in enumerate(lines) if i not in removed]
+            text = "\n".join(line for line, _ in lines)
+        return text
+
+    def collapse(self, entries, line_tokens, total, token_budget, root):
+        """贪心折叠子目录，返回 {相对目录: 折叠的文件数}。"""
+        dir_files = {}
+        dir_tokens = {}
+        dir_score = {}
+        for path, relpath, score in entries:
+            parts = relpath.split(os.sep)[:-1]
+            for depth in range(1, len(parts) + 1):
+                directory = os.sep.join(parts[:depth])
+                dir_files[directory] = dir_files.get(directory, 0) + 1
+                dir_tokens[directory] = dir_tokens.get(directory, 0) + line_tokens[path]
+                dir_score[directory] = max(dir_score.get(directory, 0), score)
+
+        # 得分低的先折叠；得分相同时先折叠更深的目录
+        order = sorted(dir_files, key=lambda d: (dir_score[d], -d.count(os.sep), -dir_tokens[d]))
+        collapsed = {}
+        current = dict(dir_tokens)
+        for directory in order:
+            if total <= token_budget:
+                break
+            if self.collapsed_ancestor(directory + os.sep, collapsed) is not None:
+                continue
+            summary = self.count_line(self.summary_line(root, directory, dir_files[directory]) + "\n")
+            saved = current[directory] - summary
+            if saved <= 0:
+                continue
+            # 子目录中已折叠的摘要一并被替换
+            for inner in [d for d in collapsed if d.startswith(directory + os.sep)]:
+                del collapsed[inner]
+            collapsed[directory] = dir_files[directory]
+            total -= saved
+            parts = directory.split(os.sep)
+            for depth in range(1, len(parts)):
+                current[os.sep.join(parts[:depth])] -= saved
+            current[directory] = summary
+        return collapsed
+
+    @staticmethod
+    def collapsed_ancestor(relpath, collapsed):
+        parts = relpath.split(os.sep)[:-1]
+        for depth in range(1, len(parts) + 1):
+            directory = os.sep.join(parts[:depth])
+            if directory in collapsed:
+                return directory
+        return None
+
+    @staticmethod
+    def summary_line(root, directory, num_files):
+        return f"{os.path.join(root, directory)}/ ... ({num_files} files not shown)"
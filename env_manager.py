@@ -0,0 +1,251 @@
+# env_manager.py
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import threading
+import time
+
+import constants
+
+
+def run_command(command, cwd, env, timeout):
+    print(f"$ {command}")
+    return subprocess.run(
+        command, shell=True, cwd=cwd, env=env, timeout=timeout,
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, errors="replace",
+    )
+
+
+def install_spec(repo, version):
+    specs = constants.MAP_VERSION_TO_INSTALL[repo]
+    if str(version) in specs:
+        return specs[str(version)]
+    try:
+        return specs[str(float(version))]
+    except (KeyError, ValueError):
+        # 未登记的版本使用该仓库（或占位配置）的第一个安装方式
+        return next(iter(specs.values()))
+
+
+def venv_env(env_path, worktree=None):
+    """在 env_path 虚拟环境中运行命令的环境变量；给出 worktree 时其源码优先于已安装的包。"""
+    env = dict(os.environ)
+    env["VIRTUAL_ENV"] = env_path
+    env["PATH"] = os.path.join(env_path, "bin") + os.pathsep + env.get("PATH", "")
+    if worktree is not None:
+        env["PYTHONPATH"] = os.pathsep.join([worktree, os.path.join(worktree, "src")])
+    return env
+
+
+class EnvBuildError(Exception):
+    pass
+
+
+def disk_usage(path):
+    """目录占用的字节数，硬链接共享的 inode 只计一次。"""
+    seen = set()
+    total = 0
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            try:
+                st = os.lstat(os.path.join(root, name))
+            except OSError:
+                continue
+            if (st.st_dev, st.st_ino) in seen:
+                continue
+            seen.add((st.st_dev, st.st_ino))
+            total += st.st_size
+    return total
+
+
+class EnvManager:
+    """
+    以 (repo, version, environment_setup_commit) 为键的测试环境缓存：
+    - 每个键只构建一次（builds/<key>：安装源码 src 与虚拟环境 venv），支持离线 wheel 缓存；
+    - 构建结果以硬链接复制为快照，pool/<key>/ 下保持 pool_size 份就绪副本，acquire 直接取用；
+    - 超出 quota_bytes 时按最近使用时间淘汰未被占用的构建（连同其副本）；占用按构建时记录在
+      meta.json 中的大小计算，副本与构建共享 inode，不计入。
+    运行测试时通过 python -m 调用，副本中 bin/ 下脚本的 shebang 路径不影响使用。
+    """
+    def __init__(self, env_dir="./envs", pool_size=2, quota_bytes=50 * 1024 ** 3, wheel_dir=None, timeout=3600):
+        self.env_dir = env_dir
+        self.pool_size = pool_size
+        self.quota_bytes = quota_bytes
+        self.wheel_dir = wheel_dir
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._build_locks = {}
+        self._in_use = {}
+        self._copy_counter = 0
+
+    @staticmethod
+    def env_key(repo, version, environment_setup_commit=""):
+        digest = hashlib.sha1(f"{repo}|{version}|{environment_setup_commit}".encode("utf-8")).hexdigest()[:12]
+        return re.sub(r"[^A-Za-z0-9_.-]", "_", f"{repo}__{version}") + "-" + digest
+
+    def build_dir(self, key):
+        return os.path.join(self.env_dir, "builds", key)
+
+    def pool_dir(self, key):
+        return os.path.join(self.env_dir, "pool", key)
+
+    def touch(self, key):
+        meta_path = os.path.join(self.build_dir(key), "meta.json")
+        with open(meta_path) as f:
+            meta = json.load(f)
+        meta["last_used"] = time.time()
+        with open(meta_path, "w") as f:
+            json.dump(meta, f)
+
+    def build(self, key, repo, version, source_dir):
+        """
+        在 builds/<key> 中安装环境；已有 meta.json 即视为构建完成。
+        任一步骤失败时删除不完整的构建并抛出 EnvBuildError，meta.json 只在全部步骤成功后写入。
+        """
+        build_dir = self.build_dir(key)
+        if os.path.exists(os.path.join(build_dir, "meta.json")):
+            return build_dir
+        shutil.rmtree(build_dir, ignore_errors=True)
+        try:
+            self.install(build_dir, repo, version, source_dir)
+        except BaseException:
+            shutil.rmtree(build_dir, ignore_errors=True)
+            raise
+        with open(os.path.join(build_dir, "meta.json"), "w") as f:
+            json.dump({
+                "repo": repo, "version": str(version), "last_used": time.time(), "size": disk_usage(build_dir),
+            }, f)
+        return build_dir
+
+    def run_step(self, command, cwd, env, required=True):
+        """运行一个安装步骤；失败时 required 为真则抛出 EnvBuildError，否则只打印警告并继续。"""
+        try:
+            result = run_command(command, cwd, env, self.timeout)
+        except subprocess.TimeoutExpired:
+            error = f"timed out after {self.timeout}s: {command}"
+        else:
+            if result.returncode == 0:
+                return
+            error = f"exit code {result.returncode}: {command}\n{result.stdout[-2000:]}"
+        if required:
+            raise EnvBuildError(error)
+        print(f"Warning: optional install step failed, continuing: {error}")
+
+    def install(self, build_dir, repo, version, source_dir):
+        src = os.path.join(build_dir, "src")
+        venv = os.path.join(build_dir, "venv")
+        # 可编辑安装引用源码路径，因此源码随环境一起保留
+        shutil.copytree(source_dir, src, symlinks=True)
+        spec = install_spec(repo, version)
+        base_python = shutil.which(f"python{spec.get('python', '')}") or sys.executable
+        if subprocess.run([base_python, "-m", "venv", venv]).returncode != 0:
+            raise EnvBuildError(f"failed to create virtualenv with {base_python}")
+        python = os.path.join(venv, "bin", "python")
+        env = venv_env(venv)
+        if self.wheel_dir:
+            env["PIP_NO_INDEX"] = "1"
+            env["PIP_FIND_LINKS"] = os.path.abspath(self.wheel_dir)
+        # pre_install 多为系统包安装（apt 等，需要 root 与网络），离线机器上通常已具备或无法安装，失败时继续
+        for command in spec.get("pre_install", []):
+            self.run_step(command, src, env, required=False)
+        if spec.get("packages") == "requirements.txt":
+            for reqs_path in constants.MAP_REPO_TO_REQS_PATHS[repo]:
+                if os.path.isfile(os.path.join(src, reqs_path)):
+                    self.run_step(f"{python} -m pip install -r {reqs_path}", src, env)
+        if spec.get("pip_packages"):
+            self.run_step(f"{python} -m pip install " + " ".join(spec["pip_packages"]), src, env)
+        if spec.get("install"):
+            self.run_step(spec["install"], src, env)
+
+    def snapshot(self, key):
+        """以硬链接复制构建好的虚拟环境，返回副本路径。"""
+        with self._lock:
+            self._copy_counter += 1
+            name = f"{os.getpid()}-{self._copy_counter}"
+        copy = os.path.join(self.pool_dir(key), name)
+        shutil.copytree(os.path.join(self.build_dir(key), "venv"), copy, symlinks=True, copy_function=os.link)
+        return copy
+
+    def acquire(self, repo, version, environment_setup_commit, source_dir):
+        """返回一份可独占使用的就绪环境（虚拟环境目录），用完后调用 release。"""
+        key = self.env_key(repo, version, environment_setup_commit)
+        with self._lock:
+            build_lock = self._build_locks.setdefault(key, threading.Lock())
+        with build_lock:
+            self.build(key, repo, version, source_dir)
+            self.touch(key)
+        with self._lock:
+            pool = self.pool_dir(key)
+            ready = [
+                os.path.join(pool, name) for name in sorted(os.listdir(pool))
+                if os.path.join(pool, name) not in self._in_use
+            ] if os.path.isdir(pool) else []
+            env_path = ready[0] if ready else None
+            if env_path is not None:
+                self._in_use[env_path] = key
+        if env_path is None:
+            env_path = self.snapshot(key)
+            with self._lock:
+                self._in_use[env_path] = key
+        self.evict()
+        return env_path
+
+    def release(self, env_path):
+        """归还副本：池中副本不足 pool_size 时保留以备复用，否则删除。"""
+        with self._lock:
+            key = self._in_use.pop(env_path, None)
+            if key is None:
+                return
+            pool = self.pool_dir(key)
+            keep = len(os.listdir(pool)) - sum(1 for k in self._in_use.values() if k == key) <= self.pool_size
+        if not keep:
+            shutil.rmtree(env_path, ignore_errors=True)
+
+    def warm(self, repo, version, environment_setup_commit, source_dir):
+        """预先构建并准备 pool_size 份副本。"""
+        key = self.env_key(repo, version, environment_setup_commit)
+        env_path = self.acquire(repo, version, environment_setup_commit, source_dir)
+        self.release(env_path)
+        while len(os.listdir(self.pool_dir(key))) < self.pool_size:
+            self.snapshot(key)
+
+    def builds(self):
+        """[(last_used, key, 字节数), ...]；旧版本写入的 meta.json 没有大小时遍历一次构建目录并补记。"""
+        builds_root = os.path.join(self.env_dir, "builds")
+        if not os.path.isdir(builds_root):
+            return []
+        builds = []
+        for key in os.listdir(builds_root):
+            meta_path = os.path.join(builds_root, key, "meta.json")
+            try:
+                with open(meta_path) as f:
+                    meta = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if "size" not in meta:
+                meta["size"] = disk_usage(os.path.join(builds_root, key))
+                with open(meta_path, "w") as f:
+                    json.dump(meta, f)
+            builds.append((meta.get("last_used", 0), key, meta["size"]))
+        return builds
+
+    def evict(self):
+        """超出磁盘配额时，按 last_used 从旧到新删除未被占用的构建及其副本。"""
+        builds = self.builds()
+        usage = sum(size for _, _, size in builds)
+        if usage <= self.quota_bytes:
+            return
+        for _, key, size in sorted(builds):
+            with self._lock:
+                if key in self._in_use.values():
+                    continue
+                print(f"Evicting environment {key}")
+                shutil.rmtree(self.pool_dir(key), ignore_errors=True)
+                shutil.rmtree(self.build_dir(key), ignore_errors=True)
+            usage -= size
+            if usage <= self.quota_bytes:
+                break
@@ -0,0 +1,200 @@
+# execution_verifier.py
+import json
+import os
+import shutil
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from importlib import metadata
+
+import constants
+from env_manager import EnvBuildError, EnvManager, run_command, venv_env
+from patch_validator import PatchValidator, PatchError
+
+PASSED = "PASSED"
+
+
+@lru_cache(maxsize=None)
+def parser_takes_test_spec():
+    """swebench 2.1 起日志解析函数的签名为 parser(log, test_spec)，之前为 parser(log)。"""
+    major, minor = (int(part) for part in metadata.version("swebench").split(".")[:2])
+    return (major, minor) >= (2, 1)
+
+
+def parse_test_log(repo, log):
+    parser = constants.MAP_REPO_TO_PARSER[repo]
+    return parser(log, None) if parser_takes_test_spec() else parser(log)
+
+
+class TestResult:
+    def __init__(self, patch, fail_to_pass=0, pass_to_pass=0, error=None, log=""):
+        self.patch = patch
+        self.fail_to_pass = fail_to_pass
+        self.pass_to_pass = pass_to_pass
+        self.error = error
+        self.log = log
+
+    @property
+    def score(self):
+        return (self.fail_to_pass, self.pass_to_pass)
+
+
+class TestVerifier:
+    """
+    基于测试执行的候选排序：
+    - 测试环境由 EnvManager 按 (repo, version, environment_setup_commit) 构建一次并缓存，
+      每个候选从预热池中取一份硬链接副本独占使用；
+    - 每个候选在硬链接复制的工作树中应用（写入时先断开链接，不影响共享的基础树）；
+    - 多个候选用线程池并行运行 MAP_REPO_TO_TEST_FRAMEWORK 测试命令（配合 pytest-xdist），
+      用 MAP_REPO_TO_PARSER 解析日志，按 FAIL_TO_PASS / PASS_TO_PASS 通过数排序。
+    """
+    def __init__(self, env_manager=None, max_workers=4, xdist_workers=2, timeout=1800):
+        self.env_manager = env_manager if env_manager is not None else EnvManager()
+        self.max_workers = max_workers
+        self.xdist_workers = xdist_workers
+        self.timeout = timeout
+        # 后台预热：环境逐个构建，每个环境键只提交一次
+        self._warm_executor = ThreadPoolExecutor(max_workers=1)
+        self._warm_keys = set()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def env_args(instance):
+        return instance["repo"], instance["version"], instance.get("environment_setup_commit") or ""
+
+    def warm(self, task):
+        """
+        在后台构建实例的测试环境并准备 pool_size 份副本，返回 Future；
+        同一环境已提交过时返回 None（rank 中的 acquire 会等待正在进行的构建）。
+        """
+        key = self.env_manager.env_key(*self.env_args(task.instance))
+        with self._lock:
+            if key in self._warm_keys:
+                return None
+            self._warm_keys.add(key)
+        return self._warm_executor.submit(self.warm_now, task)
+
+    def warm_now(self, task):
+        try:
+            self.env_manager.warm(*self.env_args(task.instance), self.materialize_base(task))
+        except Exception as e:
+            # 预热失败不影响预测；rank 时会重新尝试构建
+            print(f"[{task.instance_id}] Test environment warm-up failed: {e!r}")
+    @staticmethod
+    def test_command(repo, version):
+        command = constants.MAP_REPO_TO_TEST_FRAMEWORK[repo]
+        if isinstance(command, dict):
+            command = command.get(str(version)) or next(iter(command.values()))
+        return command
+
+    @staticmethod
+    def test_list(value):
+        """SWE-bench 中为 JSON 字符串，SWE-bench Extra 的 parquet 中为序列。"""
+        if value is None:
+            return []
+        if isinstance(value, str):
+            return json.loads(value)
+        return list(value)
+
+    @staticmethod
+    def materialize_base(task):
+        """把仓库完整写到任务工作目录中作为基础树（只写一次）。"""
+        base = os.path.join(task.workspace, "base")
+        if not os.path.isdir(base):
+            source = task.repo_index.source
+            source.materialize([relpath for relpath, _ in source.list_files()], base)
+        return base
+
+    @staticmethod
+    def apply_contents(worktree, contents):
+        for relpath, text in contents.items():
+            target = os.path.join(worktree, relpath)
+            # 硬链接文件先删除再写，避免修改共享的基础树
+            if os.path.lexists(target):
+                os.unlink(target)
+            if text is None:
+                continue
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open(target, "w", encoding="utf-8") as f:
+                f.write(text)
+
+    def test_contents(self, task):
+        """测试补丁应用后的 {相对路径: 新文本}；每个实例只应用一次，无法应用时抛出 PatchError。"""
+        test_patch = task.instance.get("test_patch")
+        if not test_patch:
+            return {}
+        return PatchValidator(task.repo_index).apply(test_patch)[1]
+
+    def run_candidate(self, task, base, test_contents, test_files, index, patch):
+        instance = task.instance
+        try:
+            _, contents = PatchValidator(task.repo_index).apply(patch)
+        except PatchError as e:
+            return TestResult(patch, error=str(e))
+        worktree = os.path.join(task.workspace, f"candidate-{index}")
+        shutil.rmtree(worktree, ignore_errors=True)
+        shutil.copytree(base, worktree, copy_function=os.link)
+        self.apply_contents(worktree, dict(contents, **test_contents))
+
+        repo, version = instance["repo"], instance["version"]
+        env_path = self.env_manager.acquire(*self.env_args(instance), base)
+        python = os.path.join(env_path, "bin", "python")
+        fail_to_pass = self.test_list(instance.get("FAIL_TO_PASS"))
+        pass_to_pass = self.test_list(instance.get("PASS_TO_PASS"))
+        command = self.test_command(repo, version)
+        if command.startswith("pytest"):
+            command = f"{python} -m {command}"
+            if self.xdist_workers > 1:
+                command += f" -n {self.xdist_workers}"
+        command = " ".join([command] + test_files)
+        try:
+            log = run_command(command, worktree, venv_env(env_path, worktree), self.timeout).stdout
+        except subprocess.TimeoutExpired as e:
+            log = e.stdout or ""
+        finally:
+            shutil.rmtree(worktree, ignore_errors=True)
+            self.env_manager.release(env_path)
+        status = parse_test_log(repo, log)
+        return TestResult(
+            patch,
+            fail_to_pass=sum(1 for test in fail_to_pass if status.get(test) == PASSED),
+            pass_to_pass=sum(1 for test in pass_to_pass if status.get(test) == PASSED),
+            log=log,
+        )
+
+    def rank(self, task, candidates):
+        """
+        并行执行各候选的测试，按 (FAIL_TO_PASS 通过数, PASS_TO_PASS 通过数) 降序返回 TestResult 列表；
+        实例本身无法排序（测试补丁无法应用、没有要运行的测试）时返回 None，由调用方保留原顺序。
+        """
+        instance = task.instance
+        test_files = sorted({
+            test.split("::")[0]
+            for test in self.test_list(instance.get("FAIL_TO_PASS")) + self.test_list(instance.get("PASS_TO_PASS"))
+        })
+        if not test_files:
+            print(f"[{task.instance_id}] No FAIL_TO_PASS / PASS_TO_PASS tests, skipping test ranking")
+            return None
+        try:
+            test_contents = self.test_contents(task)
+        except PatchError as e:
+            print(f"[{task.instance_id}] Test patch does not apply, skipping test ranking: {e}")
+            return None
+        if task.warming is not None:
+            # 本实例的预热仍在写入同一基础树
+            task.warming.result()
+        base = self.materialize_base(task)
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                results = list(pool.map(
+                    lambda item: self.run_candidate(task, base, test_contents, test_files, *item),
+                    enumerate(candidates),
+                ))
+        except EnvBuildError as e:
+            print(f"[{task.instance_id}] Test environment build failed, skipping test ranking: {e}")
+            return None
+        for result in results:
+            print(f"[{task.instance_id}] Test results: FAIL_TO_PASS {result.fail_to_pass}, "
+                  f"PASS_TO_PASS {result.pass_to_pass}" + (f", error: {result.error}" if result.error else ""))
+        return sorted(results, key=lambda result: result.score, reverse=True)
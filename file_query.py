@@ -1,55 +1,23 @@
 # file_query.py
+import os
 import re
 import xml.etree.ElementTree as ET
 from llm_provider import LLMProvider
+from directory_renderer import DirectoryRenderer
+from prompts import FEW_SHOT_PROMPT
 
 class FileQuery:
+    STAGE = "file_query"
+    # 分层定位时每轮最多展开的目录数
+    MAX_EXPAND = 5
+
     def __init__(self, llm_provider: LLMProvider):
         self.llm_provider = llm_provider
         self.tokenizer = llm_provider.tokenizer
-        self.reading_prompt = """
-You will be implementing a git diff patch to solve an issue with the code repository.
-Before selecting the files to inspect, think carefully about the problem and determine which parts of the code are most likely causing the issue.
-Below is an example demonstrating the chain-of-thought process:
-
-Example:
-Problem Statement: "When running pylint on a.py, a TypeError occurs due to an unsupported format string on a NoneType value. The error originates in astroid's _infer_from_values."
-File Directory:
-<directory>
-repo/astroid/nodes/node_classes.py
-repo/astroid/transform.py
-repo/astroid/context.py
-repo/astroid/nodes/_base_nodes.py
-repo/astroid/nodes/scoped_nodes/scoped_nodes.py
-</directory>
-Chain of Thought:
-1. The error message indicates that a None value is being formatted, which is not allowed.
-2. The file "repo/astroid/nodes/node_classes.py" contains the function _infer_from_values where "format(value.value, format_spec.value)" is called.
-3. To pinpoint the problem, search for the strings "format_spec.value" and "value.value" in that file.
-Final Selection:
-<root>
-    <entry>
-        <filepath>repo/astroid/nodes/node_classes.py</filepath>
-        <strings_to_search>
-            <string_to_search>format_spec.value</string_to_search>
-            <string_to_search>value.value</string_to_search>
-        </strings_to_search>
-    </entry>
-</root>
-
-Now, process the following:
-
-This is the problem statement.
-
-{problem_statement}
-
-This is the file directory
-
-<directory>
-{directory_string}
-</directory>
-
-Which files should be inspected so that we can solve the problem?
+        self.budget = llm_provider.budget
+        self.policy = llm_provider.policy
+        self.directory_renderer = DirectoryRenderer(self.tokenizer, count_line=self.budget.count)
+        self.selection_instructions = """Which files should be inspected so that we can solve the problem?
 When inspecting each file, what strings should be searched?
 
 Return the strings to search in this format:
@@ -69,39 +37,208 @@ Return the strings to search in this format:
 Notes:
 - Ensure each entry is enclosed between <root> and </root>.
 - Return the FULL filepath exactly as given in the directory.
+- Lines with a directory path followed by a file count summarize directories, not files; do not select them.
 - If searching for a function or keyword, consider adding surrounding spaces or punctuation (e.g., " calculate(").
 - Prefer longer, more specific search strings.
 - Do not inspect more than 5 files; include only the necessary ones.
-""".strip()
+""".rstrip()
+        self.reading_prompt = FEW_SHOT_PROMPT + """
 
-    def get_query(self, directory_string, problem_statement):
-        from vllm import SamplingParams
-        sampling_params = SamplingParams(
+This is the file directory
+
+<directory>
+{directory_string}
+</directory>
+
+""" + self.selection_instructions
+        # 分层定位：每轮只展示部分目录，模型可以要求展开子目录，直到给出 <root> 选择
+        self.lazy_reading_prompt = FEW_SHOT_PROMPT + """
+
+This is a partial view of the file directory.
+Lines ending with "/ (N files)" are directories whose contents are not shown yet.
+
+<directory>
+{directory_string}
+</directory>
+
+{expand_instructions}""" + self.selection_instructions
+        self.expand_instructions = """
+If the files that should be inspected are inside directories that are not shown yet, do not guess their paths.
+Instead, ask to expand at most {max_expand} directories, copying each directory path exactly as given, in this format:
+
+<expand>
+    <dir>directory path</dir>
+</expand>
+
+Otherwise, answer the questions below.
+
+""".lstrip()
+
+    def build_prompt(self, directory_string, problem_statement):
+        prompt = self.reading_prompt.format(
+            problem_statement=problem_statement,
+            directory_string=directory_string
+        )
+        messages = [{"role": "user", "content": prompt}]
+        return self.tokenizer.apply_chat_template(
+            conversation=messages,
+            tokenize=False,
+            add_generation_prompt=True
+        )
+
+    def base_tokens(self, template, problem_statement, *sections):
+        """除目录外的提示词 token 数（模板静态部分 + 裁剪后的问题描述 + 其他段）。"""
+        return self.budget.prompt_tokens(
+            self.budget.static_part(template), self.budget.fit_problem(problem_statement), *sections
+        )
+
+    def render_directory(self, repo_index, problem_statement, boost=None):
+        """在模型窗口内渲染目录：预算 = 提示词上限（窗口 - 最小输出空间） - 其余提示词长度。"""
+        token_budget = max(0, self.budget.input_limit - self.base_tokens(self.reading_prompt, problem_statement))
+        return self.directory_renderer.render(repo_index, problem_statement, token_budget, boost=boost)
+
+    def fit_prompt(self, directory_string, problem_statement):
+        """按预算裁剪问题描述与目录，返回 (提示词, 估算的 token 数)。"""
+        base = self.base_tokens(self.reading_prompt, problem_statement)
+        directory_string = self.budget.fit_lines(directory_string, self.budget.input_limit - base)
+        return (
+            self.build_prompt(directory_string, self.budget.fit_problem(problem_statement)),
+            base + self.budget.count(directory_string),
+        )
+
+    def generate(self, list_of_texts, prompt_tokens):
+        return self.policy.generate(
+            list(list_of_texts), list(prompt_tokens), self.STAGE,
             temperature=1.0,
             min_p=0.01,
             skip_special_tokens=True,
-            max_tokens=32768,
         )
-        prompt = self.reading_prompt.format(
-            problem_statement=problem_statement,
-            directory_string=directory_string
+
+    def get_queries(self, requests):
+        """
+        批量文件查询：requests 为 (directory_string, problem_statement) 列表，
+        所有实例的提示词合并为一次 generate 调用，按输入顺序返回 (file_query, response_text) 列表。
+        """
+        if not requests:
+            return []
+        list_of_texts, prompt_tokens = zip(*[
+            self.fit_prompt(directory_string, problem_statement)
+            for directory_string, problem_statement in requests
+        ])
+        print("FileQuery token lengths:", list(prompt_tokens))
+        responses = self.generate(list_of_texts, prompt_tokens)
+        if not responses:
+            return [("", "") for _ in requests]
+        results = []
+        for resp in responses:
+            response_text = resp.outputs[0].text
+            results.append((self.extract_file_query(response_text), response_text))
+        return results
+
+    def get_query(self, directory_string, problem_statement):
+        return self.get_queries([(directory_string, problem_statement)])[0]
+
+    def render_partial_directory(self, repo_index, expanded):
+        """渲染部分目录：只展开 expanded 中的目录，其余目录折叠为「路径/ (N files)」一行。"""
+        tree = repo_index.tree
+        lines = []
+
+        def visit(directory):
+            subdirs, files, _ = tree[directory]
+            for path in files:
+                if self.directory_renderer.keep(os.path.relpath(path, repo_index.root)):
+                    lines.append(path)
+            for subdir in subdirs:
+                if not self.directory_renderer.keep_directory(subdir):
+                    continue
+                if subdir in expanded:
+                    visit(subdir)
+                else:
+                    lines.append(f"{os.path.join(repo_index.root, subdir)}/ ({tree[subdir][2]} files)")
+
+        visit("")
+        return "\n".join(lines)
+
+    def build_lazy_prompt(self, repo_index, expanded, problem_statement, final_round):
+        """返回 (提示词, 估算的 token 数)；部分目录超出预算时从末尾删行。"""
+        expand_instructions = "" if final_round else self.expand_instructions.format(max_expand=self.MAX_EXPAND)
+        base = self.base_tokens(self.lazy_reading_prompt, problem_statement, expand_instructions)
+        directory_string = self.budget.fit_lines(
+            self.render_partial_directory(repo_index, expanded), self.budget.input_limit - base
+        )
+        prompt = self.lazy_reading_prompt.format(
+            problem_statement=self.budget.fit_problem(problem_statement),
+            directory_string=directory_string,
+            expand_instructions=expand_instructions,
+        )
+        messages = [{"role": "user", "content": prompt}]
+        text = self.tokenizer.apply_chat_template(
+            conversation=messages,
+            tokenize=False,
+            add_generation_prompt=True
         )
-        list_of_messages = [[{"role": "user", "content": prompt}]]
-        list_of_texts = [
-            self.tokenizer.apply_chat_template(
-                conversation=messages,
-                tokenize=False,
-                add_generation_prompt=True
-            )
-            for messages in list_of_messages
-        ]
-        print("FileQuery token lengths:", [len(self.tokenizer.encode(text)) for text in list_of_texts])
-        response = self.llm_provider.generate(prompts=list_of_texts, sampling_params=sampling_params)
-        if not response:
-            return "", ""
-        response_text = response[0].outputs[0].text
-        file_query = self.extract_file_query(response_text)
-        return file_query, response_text
+        return text, base + self.budget.count(directory_string)
+
+    def get_queries_lazy(self, requests, max_rounds=4):
+        """
+        分层文件定位：requests 为 (repo_index, problem_statement) 列表。
+        第一轮只展示顶层目录，之后每轮只展开模型选中的目录，直到模型给出 <root> 选择；
+        每轮所有未完成实例合并为一次 generate 调用，最后一轮强制给出选择。
+        按输入顺序返回 (file_query, response_text) 列表。
+        """
+        expanded = [set() for _ in requests]
+        results = [("", "") for _ in requests]
+        pending = list(range(len(requests)))
+        for round_no in range(max_rounds):
+            if not pending:
+                break
+            final_round = round_no == max_rounds - 1
+            list_of_texts, prompt_tokens = zip(*[
+                self.build_lazy_prompt(requests[i][0], expanded[i], requests[i][1], final_round)
+                for i in pending
+            ])
+            print(f"FileQuery round {round_no + 1} token lengths:", list(prompt_tokens))
+            responses = self.generate(list_of_texts, prompt_tokens)
+            if not responses:
+                break
+            still_pending = []
+            for i, resp in zip(pending, responses):
+                response_text = resp.outputs[0].text
+                if "<root>" in response_text or final_round:
+                    results[i] = (self.extract_file_query(response_text), response_text)
+                    continue
+                repo_index = requests[i][0]
+                to_expand = self.extract_expand_dirs(response_text, repo_index)[:self.MAX_EXPAND]
+                new_dirs = [d for d in to_expand if d not in expanded[i]]
+                if not new_dirs:
+                    results[i] = ("", response_text)
+                    continue
+                for directory in new_dirs:
+                    # 展开目录时其所有祖先目录也需展开
+                    parts = directory.split(os.sep)
+                    expanded[i].update(os.sep.join(parts[:depth]) for depth in range(1, len(parts) + 1))
+                still_pending.append(i)
+            pending = still_pending
+        return results
+
+    @staticmethod
+    def extract_expand_dirs(response_text, repo_index):
+        """解析 <expand><dir>...</dir></expand>，返回仓库中存在的相对目录。"""
+        tree = repo_index.tree
+        dirs = []
+        for block in re.findall(r'<expand>(.*?)</expand>', response_text, re.DOTALL):
+            for raw in re.findall(r'<dir>(.*?)</dir>', block, re.DOTALL):
+                path = re.sub(r'\s*\(\d+ files\)\s*$', '', raw.strip()).rstrip("/")
+                # 只去掉完整的根目录前缀（root 为 repo 时 repository/ 不是其子目录）
+                root = os.path.normpath(repo_index.root)
+                if os.path.isabs(path) or path == root or path.startswith(root + os.sep):
+                    path = repo_index.relpath(path)
+                    if path is None:
+                        continue
+                path = os.path.normpath(path)
+                if path in tree and path not in dirs:
+                    dirs.append(path)
+        return dirs
 
     @staticmethod
     def extract_file_query(xml_content):
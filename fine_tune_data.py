@@ -0,0 +1,68 @@
+# fine_tune_data.py
+# 微调数据的分词与组批，只依赖分词器接口，不导入 torch / transformers，便于在 CPU 环境测试。
+
+
+def tokenize_batch(batch, tokenizer, max_length):
+    """
+    batched map：提示词（问题描述）与补丁分别分词后拼接，labels 中提示词部分为 -100，
+    只在补丁 token 上计算损失。补丁原样分词（保留 CRLF 等字节），末尾加 EOS。
+    """
+    prompts = ["Problem: " + problem + " Patch: " for problem in batch["problem_statement"]]
+    prompt_ids = tokenizer(prompts, add_special_tokens=False)["input_ids"]
+    patch_ids = tokenizer(batch["patch"], add_special_tokens=False)["input_ids"]
+    bos = [tokenizer.bos_token_id] if tokenizer.bos_token_id is not None else []
+    eos = [tokenizer.eos_token_id]
+    result = {"input_ids": [], "labels": [], "length": [], "target_length": []}
+    for prompt, patch in zip(prompt_ids, patch_ids):
+        target = patch + eos
+        room = max_length - len(bos) - len(target)
+        if room < min(len(prompt), 256):
+            # 补丁太长，留不下足够的问题描述：丢弃（length 为 0，随后过滤）
+            input_ids, labels, target = [], [], []
+        else:
+            # 问题描述过长时保留开头与结尾
+            if len(prompt) > room:
+                head = room * 3 // 4
+                prompt = prompt[:head] + prompt[len(prompt) - (room - head):]
+            input_ids = bos + prompt + target
+            labels = [-100] * (len(bos) + len(prompt)) + target
+        result["input_ids"].append(input_ids)
+        result["labels"].append(labels)
+        result["length"].append(len(input_ids))
+        result["target_length"].append(len(target))
+    return result
+
+
+def pad_batch(batch, pad_id, multiple=8):
+    """动态填充到本批最长样本（按 multiple 对齐），填充部分 labels 为 -100、attention_mask 为 0。"""
+    longest = max(len(example["input_ids"]) for example in batch)
+    longest = (longest + multiple - 1) // multiple * multiple
+    result = {"input_ids": [], "labels": [], "attention_mask": []}
+    for example in batch:
+        padding = longest - len(example["input_ids"])
+        result["input_ids"].append(list(example["input_ids"]) + [pad_id] * padding)
+        result["labels"].append(list(example["labels"]) + [-100] * padding)
+        result["attention_mask"].append([1] * len(example["input_ids"]) + [0] * padding)
+    return result
+
+
+def flatten_batch(batch):
+    """
+    拼接为一条序列，position_ids 在每个样本处重置（与 transformers.DataCollatorWithFlattening 相同）；
+    每个样本首个 label 置为 -100，避免跨样本预测。
+    """
+    result = {"input_ids": [[]], "labels": [[]], "position_ids": [[]]}
+    for example in batch:
+        result["input_ids"][0].extend(example["input_ids"])
+        result["labels"][0].extend([-100] + list(example["labels"][1:]))
+        result["position_ids"][0].extend(range(len(example["input_ids"])))
+    return result
+
+
+def length_summary(total, lengths, target_lengths, max_length):
+    """分词统计；样本全部被过滤时直接报错，而不是打印 nan。"""
+    if not lengths:
+        raise ValueError(f"All {total} examples were dropped: no patch fits in max_length={max_length} tokens")
+    return (f"Tokenized {total} examples, dropped {total - len(lengths)} with patches over {max_length} tokens; "
+            f"mean length {sum(lengths) / len(lengths):.0f}, "
+            f"patch tokens {sum(target_lengths) / sum(lengths):.1%} of all tokens")
@@ -1,7 +1,7 @@
 # fine_tuner.py
+import hashlib
 import os
 import torch
-import numpy as np
 from datasets import load_dataset
 from torch.utils.data import DataLoader, WeightedRandomSampler
 from transformers import (
@@ -13,6 +13,8 @@ from transformers import (
 )
 from peft import LoraConfig, get_peft_model
 
+from fine_tune_data import flatten_batch, length_summary, pad_batch, tokenize_batch
+
 
 class FineTuner:
     def __init__(
@@ -21,11 +23,23 @@ class FineTuner:
             dataset_path="./input/train-00000-of-00001.parquet",
             output_dir="./fine_tuned_model",
             per_device_train_batch_size=4,
+            max_length=4096,
+            cache_dir="./fine_tune_cache",
+            num_proc=None,
+            packing=False,
     ):
         self.model_name = model_name
         self.dataset_path = dataset_path
         self.output_dir = output_dir
         self.per_device_train_batch_size = per_device_train_batch_size
+        # 样本最大 token 数：超出时先截断问题描述，补丁保持完整；补丁本身放不下的样本丢弃
+        self.max_length = max_length
+        # 分词结果缓存为 Arrow 分片（内存映射读取），分词器、max_length 或数据文件不变时直接复用
+        self.cache_dir = cache_dir
+        self.num_proc = num_proc or max(1, (os.cpu_count() or 2) // 2)
+        # packing：把一批样本拼接成一条序列（按 position_ids 隔离样本，需要 flash_attention_2）；
+        # 否则按长度分桶组批并动态填充
+        self.packing = packing
 
         # QLoRA 4-bit 量化配置
         self.bnb_config = BitsAndBytesConfig(
@@ -46,31 +60,46 @@ class FineTuner:
         # 加载分词器和预训练模型
         self.tokenizer = AutoTokenizer.from_pretrained(model_name)
         self.model = AutoModelForCausalLM.from_pretrained(
-            model_name, quantization_config=self.bnb_config, device_map="auto"
+            model_name, quantization_config=self.bnb_config, device_map="auto",
+            **({"attn_implementation": "flash_attention_2"} if packing else {}),
         )
         self.model = get_peft_model(self.model, self.lora_config)
 
+    def cache_key(self):
+        """分词缓存的键：分词器、max_length 与数据文件（路径、大小、修改时间）。"""
+        stat = os.stat(self.dataset_path)
+        raw = f"{self.model_name}|{self.max_length}|{os.path.abspath(self.dataset_path)}|{stat.st_size}|{stat.st_mtime}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
     def load_data(self):
         # 使用 datasets 库加载 parquet 格式的数据集
-        dataset = load_dataset("parquet", data_files=self.dataset_path)["train"]
-
-        # 构造用于微调的输入文本。
-        def preprocess(example):
-            input_text = "Problem: " + example["problem_statement"] + " Patch: " + example["patch"]
-            example["input_text"] = input_text
-            return example
-
-        dataset = dataset.map(preprocess)
+        dataset = load_dataset("parquet", data_files=self.dataset_path, cache_dir=self.cache_dir)["train"]
+        os.makedirs(self.cache_dir, exist_ok=True)
+        cache_file = os.path.join(self.cache_dir, f"tokenized-{self.cache_key()}.arrow")
+        # 多进程分词，每个进程写一个 Arrow 分片；之后训练时按内存映射读取 token ID
+        dataset = dataset.map(
+            tokenize_batch,
+            fn_kwargs={"tokenizer": self.tokenizer, "max_length": self.max_length},
+            batched=True,
+            num_proc=self.num_proc,
+            remove_columns=dataset.column_names,
+            cache_file_name=cache_file,
+            desc="Tokenizing",
+        )
+        total = len(dataset)
+        dataset = dataset.filter(lambda length: length > 0, input_columns="length", num_proc=self.num_proc)
+        print(length_summary(total, dataset["length"], dataset["target_length"], self.max_length))
         return dataset
 
     def data_collator(self, batch):
-        # 将输入文本 token 化，并设置 labels
-        inputs = [example["input_text"] for example in batch]
-        tokenized = self.tokenizer(
-            inputs, padding=True, truncation=True, max_length=1024, return_tensors="pt"
-        )
-        tokenized["labels"] = tokenized["input_ids"].clone()
-        return tokenized
+        if self.packing:
+            return self.flattening_collator(batch)
+        pad_id = self.tokenizer.pad_token_id if self.tokenizer.pad_token_id is not None else self.tokenizer.eos_token_id
+        return {key: torch.tensor(value, dtype=torch.long) for key, value in pad_batch(batch, pad_id).items()}
+
+    def flattening_collator(self, batch):
+        # 拼接为一条序列，position_ids 在每个样本处重置（需要 flash_attention_2）
+        return {key: torch.tensor(value, dtype=torch.long) for key, value in flatten_batch(batch).items()}
 
     def fine_tune(
             self,
@@ -93,6 +122,10 @@ class FineTuner:
             evaluation_strategy="no",
             fp16=True,
             report_to="none",
+            # 不拼接时按长度分桶组批，减少填充
+            group_by_length=not self.packing,
+            length_column_name="length",
+            dataloader_num_workers=2,
         )
         trainer = Trainer(
             model=self.model,
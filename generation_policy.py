@@ -0,0 +1,215 @@
+# generation_policy.py
+from collections import Counter, defaultdict
+
+from llm_outputs import CompletionOutput, RequestOutput
+import tracing
+
+# 各阶段最终回答的结束标签：生成到这里即停止（停止串保留在输出中，供解析使用）
+STOP_SEQUENCES = {
+    "file_query": ["</root>", "</expand>"],
+    "patch_generator": ["</patch>"],
+    "patch_verifier": ["</label>"],
+}
+# 思考过程（</think> 之前）的 token 预算
+THINKING_BUDGETS = {"file_query": 8192, "patch_generator": 16384, "patch_verifier": 8192}
+# 最终回答（</think> 之后）的 token 预算
+ANSWER_BUDGETS = {"file_query": 1024, "patch_generator": 4096, "patch_verifier": 512}
+# 思考超出预算时追加的续写，迫使模型结束思考并给出回答
+FORCE_CONCLUSION = "\n\nI have run out of time to think. I must give my final answer now.\n</think>\n\n"
+# 窗口剩余空间少于此值时不再续写
+MIN_CONTINUATION_TOKENS = 16
+
+
+class Continuation:
+    """一个补全在多轮续写中的状态：原始提示词、累计的回复文本与生成 token 数。"""
+    def __init__(self, prompt, prompt_tokens, completion, count):
+        self.prompt = prompt
+        self.prompt_tokens = prompt_tokens
+        self.text = completion.text
+        self.token_ids = list(completion.token_ids or [])
+        self.finish_reason = completion.finish_reason
+        self.generated = len(self.token_ids) or count(self.text)
+        self.forced = False
+        self.continued = False
+
+    def update(self, completion, count):
+        self.text += completion.text
+        self.token_ids.extend(completion.token_ids or [])
+        self.finish_reason = completion.finish_reason
+        self.generated += len(completion.token_ids or []) or count(completion.text)
+        self.continued = True
+
+
+class GenerationPolicy:
+    """
+    各阶段共用的生成策略：
+    - 每个阶段设置停止串（</root>、</patch>、</label>），给出回答后立即停止，不再继续生成；
+    - 思考过程有 token 预算，超出时在已生成的文本后追加 FORCE_CONCLUSION 续写，只留回答预算；
+    - 停止串出现在思考过程中（草稿里的标签）或回答被长度截断时，续写直到回答完成；
+    - 续写以「原提示词 + 已生成文本」为新提示词，与原请求共享前缀缓存；
+    - 按阶段统计被强制收尾与最终仍被截断的比例。
+    thinking_budgets 中某阶段为 None 时不限制思考长度（只受窗口限制）。
+    """
+    def __init__(self, llm_provider, stop_sequences=None, thinking_budgets=None, answer_budgets=None,
+                 max_rounds=4):
+        self.llm_provider = llm_provider
+        self.budget = llm_provider.budget
+        self.stop_sequences = dict(STOP_SEQUENCES, **(stop_sequences or {}))
+        self.thinking_budgets = dict(THINKING_BUDGETS, **(thinking_budgets or {}))
+        self.answer_budgets = dict(ANSWER_BUDGETS, **(answer_budgets or {}))
+        self.max_rounds = max_rounds
+        # {阶段: Counter(completions / completed / forced / continued / truncated)}
+        self.stats = defaultdict(Counter)
+
+    def count(self, text):
+        # 回复文本不进入 PromptBudget 的计数缓存，避免长回复占满缓存
+        return len(self.budget.tokenizer.encode(text, add_special_tokens=False))
+
+    @staticmethod
+    def thinking(prompt, text):
+        """回复是否仍在思考过程中：生成提示以 <think> 结尾或回复中出现 <think>，且尚未出现 </think>。"""
+        if "</think>" in text:
+            return False
+        return "<think>" in text or prompt.rstrip().endswith("<think>")
+
+    def max_tokens(self, stage, prompt_tokens, generated=0, thinking=True):
+        """本轮的 max_tokens：思考中为剩余思考预算 + 回答预算，否则为回答预算；不超过窗口剩余空间。"""
+        thinking_budget = self.thinking_budgets.get(stage)
+        answer_budget = self.answer_budgets.get(stage)
+        window = self.budget.max_tokens(prompt_tokens + generated)
+        if thinking_budget is None or answer_budget is None:
+            return window
+        if thinking:
+            return min(window, max(0, thinking_budget - generated) + answer_budget)
+        return min(window, answer_budget)
+
+    def sampling_params(self, stage, prompt_tokens, **kwargs):
+        """第一轮的采样参数：阶段的停止串与预算内的 max_tokens。"""
+        return self.llm_provider.sampling_params(
+            stop=self.stop_sequences.get(stage) or None,
+            include_stop_str_in_output=True,
+            max_tokens=self.max_tokens(stage, prompt_tokens),
+            **kwargs,
+        )
+
+    def next_step(self, stage, state, last_round=False):
+        """
+        返回 "force"（追加收尾续写）、"resume"（原样续写）或 None（已完成）。
+        last_round 时仍在思考的补全直接强制收尾，保证最后一轮给出回答。
+        """
+        window = self.budget.max_model_len - state.prompt_tokens - state.generated
+        if window < MIN_CONTINUATION_TOKENS:
+            return None
+        thinking = self.thinking(state.prompt, state.text)
+        thinking_budget = self.thinking_budgets.get(stage)
+        if state.finish_reason == "length":
+            if thinking:
+                return None if state.forced else "force"
+            answer_budget = self.answer_budgets.get(stage)
+            if answer_budget is None:
+                return None
+            answer_tokens = self.count(state.text.split("</think>")[-1])
+            return "resume" if answer_tokens < answer_budget else None
+        stops = tuple(self.stop_sequences.get(stage) or ())
+        if thinking and stops and state.text.rstrip().endswith(stops):
+            if last_round or (thinking_budget is not None and state.generated >= thinking_budget):
+                return "force"
+            return "resume"
+        return None
+
+    def needs_continuation(self, stage, prompt, prompt_tokens, completion):
+        """已结束的第一轮补全是否还需要续写（流式生成时据此推迟判定）。"""
+        return self.next_step(stage, Continuation(prompt, prompt_tokens, completion, self.count)) is not None
+
+    def generate(self, prompts, prompt_tokens, stage, **kwargs):
+        """
+        按策略生成：prompt_tokens 为各提示词估算的 token 数，kwargs 为其余采样参数（n、temperature 等）。
+        返回与 prompts 对齐的输出列表，续写过的补全文本为各轮拼接的完整回复。
+        """
+        with tracing.span("generation", stage=stage, requests=len(prompts)) as attributes:
+            params = [self.sampling_params(stage, tokens, **kwargs) for tokens in prompt_tokens]
+            outputs = self.llm_provider.generate(prompts=prompts, sampling_params=params, stage=stage)
+            if not outputs:
+                return outputs
+            return self.continue_outputs(prompts, prompt_tokens, outputs, stage, attributes, **kwargs)
+
+    def complete(self, prompts, prompt_tokens, outputs, stage, **kwargs):
+        """对已有的第一轮输出（如流式验证中已结束的请求）按需续写，返回值与 generate 相同。"""
+        with tracing.span("generation", stage=stage, requests=len(prompts)) as attributes:
+            return self.continue_outputs(prompts, prompt_tokens, outputs, stage, attributes, **kwargs)
+
+    def continue_outputs(self, prompts, prompt_tokens, outputs, stage, attributes, **kwargs):
+        """按需多轮续写，每轮所有需要续写的补全合并为一次 generate 调用。"""
+        kwargs.pop("n", None)
+        states = [
+            [Continuation(prompt, tokens, completion, self.count) for completion in output.outputs]
+            for prompt, tokens, output in zip(prompts, prompt_tokens, outputs)
+        ]
+        rounds = 1
+        while rounds < self.max_rounds:
+            pending = []
+            for request_states in states:
+                for state in request_states:
+                    step = self.next_step(stage, state, last_round=rounds == self.max_rounds - 1)
+                    if step == "force":
+                        state.text += FORCE_CONCLUSION
+                        state.generated += self.count(FORCE_CONCLUSION)
+                        state.forced = True
+                    if step is not None:
+                        pending.append(state)
+            if not pending:
+                break
+            rounds += 1
+            responses = self.llm_provider.generate(
+                prompts=[state.prompt + state.text for state in pending],
+                sampling_params=[
+                    self.llm_provider.sampling_params(
+                        stop=self.stop_sequences.get(stage) or None,
+                        include_stop_str_in_output=True,
+                        max_tokens=self.max_tokens(
+                            stage, state.prompt_tokens, state.generated,
+                            thinking=self.thinking(state.prompt, state.text),
+                        ),
+                        **kwargs,
+                    )
+                    for state in pending
+                ],
+                stage=stage,
+            )
+            if not responses:
+                break
+            for state, response in zip(pending, responses):
+                state.update(response.outputs[0], self.count)
+
+        stats = Counter()
+        results = []
+        for output, request_states in zip(outputs, states):
+            for state in request_states:
+                stats["completions"] += 1
+                stats["forced"] += state.forced
+                stats["continued"] += state.continued
+                stats["truncated"] += state.finish_reason == "length"
+                stats["completed"] += state.finish_reason != "length" and not self.thinking(state.prompt, state.text)
+            if not any(state.continued for state in request_states):
+                results.append(output)
+                continue
+            results.append(RequestOutput(
+                output.request_id, output.prompt,
+                [CompletionOutput(state.text, state.finish_reason, state.token_ids) for state in request_states],
+                prompt_token_ids=output.prompt_token_ids,
+                num_cached_tokens=getattr(output, "num_cached_tokens", None) or 0,
+                usage=getattr(output, "usage", None),
+            ))
+        self.stats[stage].update(stats)
+        attributes.update(stats, rounds=rounds)
+        print(f"Generation ({stage}): {stats['completions']} completion(s), {stats['forced']} forced, "
+              f"{stats['continued']} continued, {stats['truncated']} truncated in {rounds} round(s)")
+        return results
+
+    def report(self):
+        """各阶段被强制收尾与最终仍被截断的比例。"""
+        for stage, stats in sorted(self.stats.items()):
+            total = stats["completions"] or 1
+            print(f"Generation policy ({stage}): {stats['completions']} completion(s), "
+                  f"forced {stats['forced'] / total:.1%}, truncated {stats['truncated'] / total:.1%}, "
+                  f"completed {stats['completed'] / total:.1%}")
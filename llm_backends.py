@@ -0,0 +1,392 @@
+# llm_backends.py
+# LLMProvider 的推理后端。每个后端提供：
+#   get_tokenizer()                        -> 带 encode / apply_chat_template 的分词器
+#   sampling_params(**kwargs)              -> 该后端的采样参数对象
+#   generate(prompts, sampling_params)     -> 与 prompts 对齐的 RequestOutput 列表；
+#                                             sampling_params 为单个对象或与 prompts 对齐的列表
+# 可选的 llm_engine（add_request / step / abort_request）用于流式中止；没有时 LLMProvider 退化为整批生成。
+import http.client
+import itertools
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from llm_outputs import CompletionOutput, RequestOutput
+
+DEFAULT_MODEL_PATH = '../input/m/deepseek-r1/transformers/deepseek-r1-distill-qwen-32b-awq/1'
+
+
+class GenerationParams:
+    """各后端通用的采样参数，字段名与 vllm.SamplingParams 一致（vLLM 后端在提交时转换）。"""
+    def __init__(self, n=1, **kwargs):
+        self.n = n
+        self.__dict__.update(kwargs)
+
+    def __repr__(self):
+        return f"GenerationParams({sorted(self.__dict__.items())!r})"
+
+
+def per_prompt(sampling_params, num_prompts):
+    """单个采样参数对象展开为与提示词对齐的列表。"""
+    if isinstance(sampling_params, list):
+        return sampling_params
+    return [sampling_params] * num_prompts
+
+
+class VLLMBackend:
+    """
+    进程内 vLLM 引擎。构造时不导入 vllm：引擎在第一次生成时才构建（设置 CUDA 环境变量、初始化 GPU），
+    分词器单独从模型目录加载；采样参数用 GenerationParams 表示，提交时再转为 vllm.SamplingParams。
+    """
+    def __init__(self, model_path=DEFAULT_MODEL_PATH, max_num_seqs=4, max_model_len=32768,
+                 tensor_parallel_size=1, gpu_memory_utilization=0.9, seed=42, enable_prefix_caching=True,
+                 cuda_visible_devices="0, 1, 2, 3"):
+        self.model_name = model_path
+        self.cuda_visible_devices = cuda_visible_devices
+        self.engine_args = dict(
+            model=model_path,
+            max_num_seqs=max_num_seqs,
+            max_model_len=max_model_len,
+            trust_remote_code=True,
+            tensor_parallel_size=tensor_parallel_size,
+            gpu_memory_utilization=gpu_memory_utilization,
+            seed=seed,
+            # 三个阶段的提示词共享「示例 + 问题描述 + 文件内容」前缀，开启自动前缀缓存复用其 KV
+            enable_prefix_caching=enable_prefix_caching,
+        )
+        self._llm = None
+        self._lock = threading.Lock()
+
+    @property
+    def llm(self):
+        with self._lock:
+            if self._llm is None:
+                # 必须在导入 vllm（初始化 CUDA）之前设置
+                if self.cuda_visible_devices is not None:
+                    os.environ["CUDA_VISIBLE_DEVICES"] = self.cuda_visible_devices
+                from vllm import LLM
+                self._llm = LLM(**self.engine_args)
+        return self._llm
+
+    @property
+    def llm_engine(self):
+        return VLLMEngine(self.llm.llm_engine, self.native_params)
+
+    def get_tokenizer(self):
+        if self._llm is not None:
+            return self._llm.get_tokenizer()
+        from transformers import AutoTokenizer
+        return AutoTokenizer.from_pretrained(self.model_name, trust_remote_code=True)
+
+    def sampling_params(self, **kwargs):
+        return GenerationParams(**kwargs)
+
+    @staticmethod
+    def native_params(params):
+        from vllm import SamplingParams
+        return SamplingParams(**vars(params))
+
+    def generate(self, prompts, sampling_params):
+        if isinstance(sampling_params, list):
+            native = [self.native_params(params) for params in sampling_params]
+        else:
+            native = self.native_params(sampling_params)
+        return self.llm.generate(prompts=prompts, sampling_params=native)
+
+
+class VLLMEngine:
+    """LLMEngine 的包装：提交请求时把 GenerationParams 转为 vllm.SamplingParams。"""
+    def __init__(self, engine, native_params):
+        self.engine = engine
+        self.native_params = native_params
+
+    def add_request(self, request_id, prompt, sampling_params):
+        self.engine.add_request(request_id, prompt, self.native_params(sampling_params))
+
+    def has_unfinished_requests(self):
+        return self.engine.has_unfinished_requests()
+
+    def step(self):
+        return self.engine.step()
+
+    def abort_request(self, request_ids):
+        self.engine.abort_request(request_ids)
+
+
+class RetryableError(Exception):
+    pass
+
+
+class Replica:
+    """一个 OpenAI 兼容服务端点：保持长连接的连接池，并记录进行中的请求数与失败冷却时间。"""
+    def __init__(self, url, timeout):
+        parts = urlsplit(url)
+        self.url = url
+        self.https = parts.scheme == "https"
+        self.host = parts.hostname
+        self.port = parts.port or (443 if self.https else 80)
+        self.base_path = parts.path.rstrip("/")
+        self.timeout = timeout
+        self.outstanding = 0
+        self.unhealthy_until = 0.0
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def connection(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        connection_class = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+        return connection_class(self.host, self.port, timeout=self.timeout)
+
+    def post(self, path, body, headers):
+        connection = self.connection()
+        try:
+            connection.request("POST", self.base_path + path, body=json.dumps(body), headers=headers)
+            response = connection.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            raise
+        if response.will_close:
+            connection.close()
+        else:
+            with self._lock:
+                self._idle.append(connection)
+        if response.status in (429, 500, 502, 503, 504):
+            raise RetryableError(f"{self.url}: HTTP {response.status}")
+        if response.status != 200:
+            raise RuntimeError(f"{self.url}: HTTP {response.status}: {data[:500]!r}")
+        return json.loads(data)
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
+
+
+class OpenAIBackend:
+    """
+    OpenAI 兼容的 /v1/completions 客户端（如 vllm serve 启动的多个副本）：
+    - 每个副本维护长连接池；总并发由线程池大小 max_concurrency 限制；
+    - 每个请求发给进行中请求最少的健康副本，失败的副本冷却 cooldown 秒；
+    - 连接错误与 429/5xx 重试：仍有健康副本时立即换副本，全部冷却中才按 backoff 指数退避。
+    提示词已按聊天模板渲染，因此使用 completions 接口；分词器从 tokenizer_path 本地加载。
+    """
+    def __init__(self, endpoints, model, tokenizer_path=DEFAULT_MODEL_PATH, max_concurrency=16,
+                 max_retries=3, timeout=1800, cooldown=10.0, backoff=1.0, api_key=None):
+        if not endpoints:
+            raise ValueError("OpenAIBackend needs at least one endpoint")
+        self.model_name = model
+        self.tokenizer_path = tokenizer_path
+        self.replicas = [Replica(url, timeout) for url in endpoints]
+        self.max_retries = max_retries
+        self.cooldown = cooldown
+        self.backoff = backoff
+        self.headers = {"Content-Type": "application/json", "Connection": "keep-alive"}
+        if api_key:
+            self.headers["Authorization"] = f"Bearer {api_key}"
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency)
+        self._tokenizer = None
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+        self._turn = itertools.count()
+
+    def get_tokenizer(self):
+        if self._tokenizer is None:
+            from transformers import AutoTokenizer
+            self._tokenizer = AutoTokenizer.from_pretrained(self.tokenizer_path, trust_remote_code=True)
+        return self._tokenizer
+
+    def sampling_params(self, **kwargs):
+        return GenerationParams(**kwargs)
+
+    def generate(self, prompts, sampling_params):
+        futures = [
+            self.executor.submit(self.complete, prompt, params)
+            for prompt, params in zip(prompts, per_prompt(sampling_params, len(prompts)))
+        ]
+        return [future.result() for future in futures]
+
+    def has_healthy_replica(self):
+        now = time.time()
+        return any(r.unhealthy_until <= now for r in self.replicas)
+
+    def pick(self):
+        with self._lock:
+            now = time.time()
+            healthy = [r for r in self.replicas if r.unhealthy_until <= now] or self.replicas
+            turn = next(self._turn)
+            # 进行中请求最少者优先，相同时轮转
+            replica = min(healthy, key=lambda r: (r.outstanding, (self.replicas.index(r) - turn) % len(self.replicas)))
+            replica.outstanding += 1
+            return replica
+
+    def complete(self, prompt, sampling_params):
+        body = {"model": self.model_name, "prompt": prompt}
+        body.update(vars(sampling_params))
+        error = None
+        for attempt in range(self.max_retries + 1):
+            if attempt and not self.has_healthy_replica():
+                time.sleep(min(30.0, self.backoff * 2 ** (attempt - 1)))
+            replica = self.pick()
+            try:
+                data = replica.post("/v1/completions", body, self.headers)
+            except (OSError, http.client.HTTPException, RetryableError) as e:
+                error = e
+                replica.unhealthy_until = time.time() + self.cooldown
+                print(f"Request to {replica.url} failed (attempt {attempt + 1}): {e}")
+                continue
+            finally:
+                with self._lock:
+                    replica.outstanding -= 1
+            choices = sorted(data["choices"], key=lambda choice: choice.get("index", 0))
+            usage = data.get("usage") or {}
+            cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+            return RequestOutput(
+                data.get("id") or str(next(self._ids)), prompt,
+                [CompletionOutput(choice["text"], choice.get("finish_reason")) for choice in choices],
+                num_cached_tokens=cached, usage=usage,
+            )
+        raise RuntimeError(f"completion failed after {self.max_retries + 1} attempts: {error}")
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        for replica in self.replicas:
+            replica.close()
+
+
+# ---- 本地确定性替身：不加载模型，按提示词类型返回固定格式的回复 ----
+
+class SimpleTokenizer:
+    """按约 4 个字符一个 token 估算长度。"""
+    def encode(self, text, add_special_tokens=True):
+        return fake_token_ids(text)
+
+    def apply_chat_template(self, conversation, tokenize=False, add_generation_prompt=True):
+        text = "".join(f"<|{message['role']}|>{message['content']}" for message in conversation)
+        return text + ("<|assistant|>" if add_generation_prompt else "")
+
+
+def fake_token_ids(text):
+    return list(range(len(text) // 4))
+
+
+def apply_limits(text, params):
+    """按采样参数的 stop 与 max_tokens 截断替身的回复，返回 (文本, finish_reason)。"""
+    end, finish_reason = len(text), "stop"
+    for stop in getattr(params, "stop", None) or []:
+        position = text.find(stop)
+        if position >= 0:
+            keep = position + len(stop) if getattr(params, "include_stop_str_in_output", False) else position
+            end = min(end, keep)
+    max_tokens = getattr(params, "max_tokens", None)
+    if max_tokens is not None and end > max_tokens * 4:
+        end, finish_reason = max_tokens * 4, "length"
+    return text[:end], finish_reason
+
+
+def canned_response(prompt):
+    """
+    按提示词判断阶段并返回可解析的固定回复：
+    - 文件查询：选择目录中的第一个文件（分层定位时先展开第一个折叠目录）；
+    - 补丁生成：在文件内容中第一行匹配行之后插入一行注释，保证补丁能在仓库中应用；
+    - 补丁验证：投 Yes。
+    """
+    body = prompt.split("Now, process the following:")[-1]
+    if "Which files should be inspected" in body:
+        match = re.search(r"<directory>\n(.*?)\n</directory>", body, re.DOTALL)
+        lines = match.group(1).splitlines() if match else []
+        collapsed = [line.split("/ (")[0] for line in lines if re.search(r"/ \(\d+ files\)$", line)]
+        files = [line for line in lines if line and not line.endswith(" files)") and not line.endswith("not shown)")]
+        if collapsed and "<expand>" in body.split("</directory>")[-1]:
+            return f"<expand>\n    <dir>{collapsed[0]}/</dir>\n</expand>"
+        filepath = files[0] if files else ""
+        return (f"<root>\n    <entry>\n        <filepath>{filepath}</filepath>\n        <strings_to_search>\n"
+                f"            <string_to_search>def </string_to_search>\n        </strings_to_search>\n"
+                f"    </entry>\n</root>")
+    if "Write a git diff" in body:
+        file_match = re.search(r"^FILE: (.+)$", body, re.MULTILINE)
+        line_match = re.search(r"^\s*(\d+) \| (.*)$", body, re.MULTILINE)
+        if not file_match or not line_match:
+            return "<patch>\n</patch>"
+        path, line_no, text = file_match.group(1), int(line_match.group(1)), line_match.group(2)
+        return (f"<patch>\n--- a/{path}\n+++ b/{path}\n@@ -{line_no},1 +{line_no},2 @@\n"
+                f" {text}\n+# stub\n</patch>")
+    return "The patch addresses the problem.\n<label>Yes</label>"
+
+
+class FakeEngine:
+    """与 LLMEngine 的 add_request / step / abort_request 接口兼容，每步输出回复的一段。"""
+    def __init__(self, responder, step_latency, num_steps=8):
+        self.responder = responder
+        self.step_latency = step_latency
+        self.num_steps = num_steps
+        self.requests = {}
+
+    def add_request(self, request_id, prompt, sampling_params):
+        text, finish_reason = apply_limits(self.responder(prompt), sampling_params)
+        self.requests[request_id] = [prompt, text, 0, finish_reason]
+
+    def has_unfinished_requests(self):
+        return bool(self.requests)
+
+    def abort_request(self, request_ids):
+        for request_id in ([request_ids] if isinstance(request_ids, str) else request_ids):
+            self.requests.pop(request_id, None)
+
+    def step(self):
+        time.sleep(self.step_latency)
+        outputs = []
+        for request_id, state in list(self.requests.items()):
+            prompt, text, position, finish_reason = state
+            state[2] = position = position + len(text) // self.num_steps + 1
+            finished = position >= len(text)
+            partial = text[:position]
+            outputs.append(RequestOutput(
+                request_id, prompt,
+                [CompletionOutput(partial, finish_reason if finished else None, fake_token_ids(partial))],
+                prompt_token_ids=fake_token_ids(prompt), finished=finished,
+            ))
+            if finished:
+                del self.requests[request_id]
+        return outputs
+
+
+class FakeBackend:
+    """
+    确定性的本地替身：每次 generate 调用等待 latency 秒（模拟一次批量解码），返回 responder 的回复；
+    回复按采样参数的 stop 与 max_tokens 截断。
+    """
+    def __init__(self, responder=None, latency=0.0):
+        self.model_name = "fake"
+        self.responder = responder or canned_response
+        self.latency = latency
+        self.tokenizer = SimpleTokenizer()
+        self.llm_engine = FakeEngine(self.responder, latency / 8)
+        self.num_calls = 0
+        self._ids = itertools.count()
+
+    def get_tokenizer(self):
+        return self.tokenizer
+
+    def sampling_params(self, **kwargs):
+        return GenerationParams(**kwargs)
+
+    def generate(self, prompts, sampling_params):
+        self.num_calls += 1
+        time.sleep(self.latency)
+        outputs = []
+        for prompt, params in zip(prompts, per_prompt(sampling_params, len(prompts))):
+            text, finish_reason = apply_limits(self.responder(prompt), params)
+            outputs.append(RequestOutput(
+                str(next(self._ids)), prompt,
+                [CompletionOutput(text, finish_reason, fake_token_ids(text)) for _ in range(params.n)],
+                prompt_token_ids=fake_token_ids(prompt),
+            ))
+        return outputs
@@ -0,0 +1,23 @@
+# llm_outputs.py
+# 与 vLLM RequestOutput / CompletionOutput 字段兼容的轻量结果对象，
+# 供缓存命中等不经过推理引擎的路径返回，各阶段可以无差别地读取 resp.outputs[i].text。
+
+
+class CompletionOutput:
+    def __init__(self, text, finish_reason="stop", token_ids=None):
+        self.text = text
+        self.finish_reason = finish_reason
+        self.token_ids = token_ids or []
+
+
+class RequestOutput:
+    def __init__(self, request_id, prompt, outputs, prompt_token_ids=None, num_cached_tokens=0, finished=True,
+                 usage=None):
+        self.request_id = request_id
+        self.prompt = prompt
+        self.outputs = outputs
+        self.prompt_token_ids = prompt_token_ids or []
+        self.num_cached_tokens = num_cached_tokens
+        self.finished = finished
+        # HTTP 后端不返回 token ID，只有服务端统计的 prompt_tokens / completion_tokens
+        self.usage = usage or {}
@@ -1,30 +1,184 @@
 # llm_provider.py
 import os
-from vllm import LLM, SamplingParams
+import itertools
+import threading
+from collections import Counter
 import warnings
+from response_cache import ResponseCache, CACHE_USE, CACHE_BYPASS
+from llm_backends import DEFAULT_MODEL_PATH, per_prompt
+from prompt_budget import PromptBudget
+from generation_policy import GenerationPolicy
+import tracing
 
 warnings.simplefilter('ignore')
-os.environ["CUDA_VISIBLE_DEVICES"] = "0, 1, 2, 3"
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
 
-llm_model_pth = '../input/m/deepseek-r1/transformers/deepseek-r1-distill-qwen-32b-awq/1'
+llm_model_pth = DEFAULT_MODEL_PATH
 
 MAX_NUM_SEQS = 4
 MAX_MODEL_LEN = 32768
 MAX_TOKENS  = 32768
 
+
+def token_usage(output):
+    """一个 RequestOutput 的 (提示词 token 数, 生成 token 数)；HTTP 后端取服务端的 usage 统计。"""
+    usage = getattr(output, "usage", None) or {}
+    prompt_tokens = len(output.prompt_token_ids or []) or usage.get("prompt_tokens", 0)
+    generated_tokens = (
+        sum(len(completion.token_ids or []) for completion in output.outputs) or usage.get("completion_tokens", 0)
+    )
+    return prompt_tokens, generated_tokens
+
+
+class LazyTokenizer:
+    """第一次使用时才加载的分词器代理，避免仅构造各阶段对象就加载模型文件。"""
+    def __init__(self, load):
+        self._load = load
+        self._tokenizer = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        if self._tokenizer is None:
+            with self._lock:
+                if self._tokenizer is None:
+                    self._tokenizer = self._load()
+        return getattr(self._tokenizer, name)
+
+
 class LLMProvider:
-    def __init__(self,   tensor_parallel_size=1, gpu_memory_utilization=0.9, seed=42):
-        self.llm = LLM(
-            model_path=llm_model_pth,
-            max_num_seqs=MAX_NUM_SEQS,
-            max_model_len=MAX_MODEL_LEN,
-            trust_remote_code=True,
-            tensor_parallel_size=tensor_parallel_size,
-            gpu_memory_utilization=gpu_memory_utilization,
-            seed=seed,
+    """
+    各阶段共用的生成入口：在推理后端（见 llm_backends.py，默认进程内 vLLM）之上
+    提供回复缓存、前缀缓存统计与流式中止。后端与分词器都在第一次使用时才初始化，
+    全部命中回复缓存的运行不会构建推理引擎。
+    """
+    def __init__(self, backend=None, seed=42, cache_path=None, cache_max_bytes=2 * 1024 ** 3,
+                 cache_policy=None, thinking_budgets=None):
+        if backend is None:
+            from llm_backends import VLLMBackend
+            backend = VLLMBackend(
+                model_path=llm_model_pth, max_num_seqs=MAX_NUM_SEQS, max_model_len=MAX_MODEL_LEN, seed=seed,
+            )
+        self.backend = backend
+        self.tokenizer = LazyTokenizer(self.backend.get_tokenizer)
+        # 各阶段共用的提示词预算与 token 计数缓存
+        self.budget = PromptBudget(self.tokenizer, MAX_MODEL_LEN, MAX_TOKENS)
+        # 各阶段共用的停止串、思考预算与强制收尾（thinking_budgets 为 {阶段: token 数或 None}）
+        self.policy = GenerationPolicy(self, thinking_budgets=thinking_budgets)
+        self._request_counter = itertools.count()
+        # 前缀缓存命中统计：最近一次调用与累计值
+        self.last_call_metrics = {}
+        self.prefix_cache_stats = {"calls": 0, "prompt_tokens": 0, "cached_tokens": 0}
+        # 持久化回复缓存；cache_policy 为 {阶段: use/bypass/refresh}，未列出的阶段默认 use
+        self.response_cache = (
+            ResponseCache(cache_path, backend.model_name, seed=seed, max_bytes=cache_max_bytes)
+            if cache_path else None
         )
-        self.tokenizer = self.llm.get_tokenizer()
+        self.cache_policy = cache_policy or {}
+        self._occurrences = Counter()
+
+    def sampling_params(self, **kwargs):
+        return self.backend.sampling_params(**kwargs)
+
+    def generate(self, prompts, sampling_params, stage=None):
+        """sampling_params 可以是单个对象，也可以是与 prompts 对齐的列表（如逐条设置 max_tokens）。"""
+        with tracing.span("llm", stage=stage, requests=len(prompts)) as attributes:
+            return self.generate_cached(prompts, sampling_params, stage, attributes)
+
+    def generate_cached(self, prompts, sampling_params, stage, attributes):
+        policy = self.cache_policy.get(stage, CACHE_USE)
+        if self.response_cache is None or policy == CACHE_BYPASS:
+            outputs = self.backend.generate(prompts, sampling_params)
+            attributes.update(self.record_metrics(outputs))
+            return outputs
+
+        params = per_prompt(sampling_params, len(prompts))
+        keys = []
+        for prompt, prompt_params in zip(prompts, params):
+            base_key = self.response_cache.make_key(prompt, prompt_params)
+            keys.append(self.response_cache.make_key(prompt, prompt_params, self._occurrences[base_key]))
+            self._occurrences[base_key] += 1
+        results = [None] * len(prompts)
+        if policy == CACHE_USE:
+            for i, (key, prompt) in enumerate(zip(keys, prompts)):
+                results[i] = self.response_cache.get(key, prompt)
+        misses = [i for i, result in enumerate(results) if result is None]
+        print(f"Response cache ({stage}): {len(prompts) - len(misses)}/{len(prompts)} hit")
+        attributes["response_cache_hits"] = len(prompts) - len(misses)
+        if misses:
+            outputs = self.backend.generate([prompts[i] for i in misses], [params[i] for i in misses])
+            attributes.update(self.record_metrics(outputs))
+            for i, output in zip(misses, outputs):
+                results[i] = output
+                self.response_cache.put(keys[i], stage, output)
+        self.response_cache.commit()
+        return results
+
+    def record_metrics(self, outputs):
+        """统计一次调用的提示词 token 数、前缀缓存命中的 token 数与生成 token 数，返回本次的统计。"""
+        outputs = [output for output in outputs if output is not None]
+        usages = [token_usage(output) for output in outputs]
+        prompt_tokens = sum(prompt for prompt, _ in usages)
+        cached_tokens = sum(getattr(output, "num_cached_tokens", None) or 0 for output in outputs)
+        self.last_call_metrics = {
+            "requests": len(outputs),
+            "prompt_tokens": prompt_tokens,
+            "cached_tokens": cached_tokens,
+            "generated_tokens": sum(generated for _, generated in usages),
+        }
+        self.prefix_cache_stats["calls"] += 1
+        self.prefix_cache_stats["prompt_tokens"] += prompt_tokens
+        self.prefix_cache_stats["cached_tokens"] += cached_tokens
+        hit_rate = cached_tokens / prompt_tokens if prompt_tokens else 0.0
+        print(f"Prefix cache: {cached_tokens}/{prompt_tokens} prompt tokens hit ({hit_rate:.1%}) "
+              f"over {len(outputs)} request(s)")
+        return self.last_call_metrics
+
+    def generate_with_abort(self, prompts, sampling_params, on_update, stage=None):
+        """
+        逐步解码的生成接口：直接驱动 LLMEngine，每产生一次增量输出就调用
+        on_update(index, request_output)，其返回值为需要立即中止的请求下标（可包含自身）。
+        返回与 prompts 对齐的最后一次输出列表（被中止的请求保留其中止前的部分输出）。
+        """
+        with tracing.span("llm", stage=stage, requests=len(prompts), streaming=True) as attributes:
+            engine = getattr(self.backend, "llm_engine", None)
+            if engine is None:
+                outputs = self.generate_then_replay(prompts, sampling_params, on_update)
+            else:
+                outputs = self.generate_streaming(engine, prompts, sampling_params, on_update)
+            attributes.update(self.last_call_metrics)
+            attributes["aborted"] = sum(1 for output in outputs if output is not None and not output.finished)
+            return outputs
+
+    def generate_streaming(self, engine, prompts, sampling_params, on_update):
+        request_ids = []
+        for prompt, prompt_params in zip(prompts, per_prompt(sampling_params, len(prompts))):
+            request_id = f"stream-{next(self._request_counter)}"
+            engine.add_request(request_id, prompt, prompt_params)
+            request_ids.append(request_id)
+        index_of = {request_id: i for i, request_id in enumerate(request_ids)}
+        results = [None] * len(prompts)
+        active = set(request_ids)
+        while active and engine.has_unfinished_requests():
+            for output in engine.step():
+                if output.request_id not in active:
+                    continue
+                i = index_of[output.request_id]
+                results[i] = output
+                if output.finished:
+                    active.discard(output.request_id)
+                to_abort = [request_ids[j] for j in (on_update(i, output) or []) if request_ids[j] in active]
+                if to_abort:
+                    engine.abort_request(to_abort)
+                    active.difference_update(to_abort)
+        self.record_metrics(results)
+        return results
 
-    def generate(self, prompts, sampling_params):
-        return self.llm.generate(prompts=prompts, sampling_params=sampling_params)
+    def generate_then_replay(self, prompts, sampling_params, on_update):
+        """后端不支持逐步解码时（如 HTTP 服务）：整批生成后按顺序回放完整输出，被中止的请求不再回放。"""
+        outputs = self.backend.generate(prompts, sampling_params)
+        self.record_metrics(outputs)
+        aborted = set()
+        for i, output in enumerate(outputs):
+            if i not in aborted:
+                aborted.update(on_update(i, output) or [])
+        return outputs
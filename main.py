@@ -1,20 +1,188 @@
 # main.py
+import os
 import shutil
 
-import pandas as pd
-import polars as pl
 import argparse
 from predictor import Predictor
+from llm_provider import LLMProvider, MAX_MODEL_LEN, MAX_NUM_SEQS, llm_model_pth
+from pipeline_scheduler import PipelineScheduler
+from utils import Utils
+from response_cache import CACHE_BYPASS, CACHE_REFRESH
+from env_manager import EnvManager
+from execution_verifier import TestVerifier
+from retrieval_index import RetrievalIndex
+from blob_store import BlobStore
+from run_journal import RunJournal
+from generation_policy import THINKING_BUDGETS
+import tracing
+
+
+def load_instances(batch_path, archive_dir):
+    """
+    读取 parquet/jsonl 实例文件；缺少 archive 列时使用 archive_dir/<instance_id>.tar。
+    其余列（repo、version、test_patch、FAIL_TO_PASS 等）原样保留，供测试验证使用。
+    """
+    import pandas as pd
+    if batch_path.endswith(".parquet"):
+        df = pd.read_parquet(batch_path)
+    else:
+        df = pd.read_json(batch_path, lines=True)
+    instances = []
+    for record in df.to_dict(orient="records"):
+        archive = record.get("archive") or os.path.join(archive_dir, f"{record['instance_id']}.tar")
+        record["archive"] = archive
+        instances.append(record)
+    return instances
+
+
+def parse_thinking_budgets(values):
+    """--thinking-budget 的取值：N 作用于所有阶段，stage=N 只作用于该阶段；0 表示不限制。"""
+    budgets = {}
+    for value in values:
+        stage, _, tokens = value.rpartition("=")
+        for name in ([stage] if stage else THINKING_BUDGETS):
+            budgets[name] = int(tokens) or None
+    return budgets
+
 
 def main():
     parser = argparse.ArgumentParser(description="ChainPatch: 自动生成 Git 补丁")
-    parser.add_argument("--problem", type=str, required=True, help="问题描述（问题语句）")
-    parser.add_argument("--archive", type=str, required=True, help="代码仓库压缩包路径（.tar 文件）")
-    parser.add_argument("--model", type=str, default="deepseek-r1", help="模型路径或名称")
+    parser.add_argument("--problem", type=str, help="问题描述（问题语句）")
+    parser.add_argument("--archive", type=str, help="代码仓库压缩包路径（.tar 文件）")
+    parser.add_argument("--batch", type=str, help="批量模式：实例文件（.parquet 或 .jsonl）")
+    parser.add_argument("--archive-dir", type=str, default=".", help="批量模式下压缩包目录（<instance_id>.tar）")
+    parser.add_argument("--batch-size", type=int, default=16, help="批量模式下同时处理的实例数")
+    parser.add_argument("--output", type=str, default="predictions.jsonl", help="批量模式下的预测结果文件")
+    parser.add_argument("--num-candidates", type=int, default=None,
+                        help="并行模式：一次采样的候选补丁数，全部被拒绝时不再重新采样（不设置则逐个生成并验证，最多 3 轮）")
+    parser.add_argument("--wave-size", type=int, default=1,
+                        help="非流式验证时每波验证的每实例候选数（每个候选 4 个投票请求）")
+    parser.add_argument("--early-exit", action="store_true",
+                        help="流式验证：出现 No 票即中止该候选的其余投票")
+    parser.add_argument("--no-validate", action="store_true",
+                        help="跳过验证前的本地补丁应用与语法检查")
+    parser.add_argument("--no-cluster", action="store_true",
+                        help="不对候选做规范化与语义聚类（默认每个不同的修复只验证一个代表，簇大小计为额外赞成票）")
+    parser.add_argument("--test-verify", action="store_true",
+                        help="并行模式下执行测试为候选排序（需要实例的 repo/version/测试信息）")
+    parser.add_argument("--env-dir", type=str, default="./envs", help="测试环境缓存目录")
+    parser.add_argument("--env-pool-size", type=int, default=2, help="每个测试环境预热的副本数（批量模式下实例载入后即在后台构建环境并准备副本）")
+    parser.add_argument("--env-quota-gb", type=float, default=50, help="测试环境缓存的磁盘配额（GB）")
+    parser.add_argument("--wheel-dir", type=str, default=None,
+                        help="离线 wheel 缓存目录，设置后 pip 只从该目录安装（--no-index --find-links）")
+    parser.add_argument("--localization", choices=["flat", "lazy"], default="flat",
+                        help="文件定位方式：flat 一次给出完整目录，lazy 分多轮逐层展开目录")
+    parser.add_argument("--cache", type=str, default=None, help="LLM 回复缓存文件（SQLite）")
+    parser.add_argument("--cache-bypass", action="append", default=[],
+                        help="不使用缓存的阶段（file_query / patch_generator / patch_verifier），可重复")
+    parser.add_argument("--cache-refresh", action="append", default=[],
+                        help="忽略已有缓存、重新生成并覆盖的阶段，可重复")
+    parser.add_argument("--model", type=str, default="deepseek-r1",
+                        help="模型名称：写入预测文件，HTTP 后端请求时作为 model 字段")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="批量模式下使用异步多阶段流水线，CPU 工作与 GPU 解码重叠")
+    parser.add_argument("--queue-size", type=int, default=8, help="流水线每个阶段的队列长度")
+    parser.add_argument("--backend", choices=["vllm", "openai", "fake"], default="vllm",
+                        help="推理后端：进程内 vLLM、OpenAI 兼容 HTTP 服务，或返回固定回复的本地替身（CPU 测试用）")
+    parser.add_argument("--model-path", type=str, default=llm_model_pth, help="vLLM 模型路径 / HTTP 后端的分词器路径")
+    parser.add_argument("--tensor-parallel-size", type=int, default=1, help="vLLM 张量并行的 GPU 数")
+    parser.add_argument("--endpoint", action="append", default=[],
+                        help="OpenAI 兼容服务地址（如 http://host:8000），可重复以在多个副本间负载均衡")
+    parser.add_argument("--max-concurrency", type=int, default=16, help="HTTP 后端的最大并发请求数")
+    parser.add_argument("--retry-backoff", type=float, default=1.0,
+                        help="HTTP 后端所有副本都在冷却时的初始重试退避（秒），之后每次翻倍")
+    parser.add_argument("--fake-latency", type=float, default=0.0, help="替身后端每次 generate 调用的延迟（秒）")
+    parser.add_argument("--retrieval-index", type=str, default=None,
+                        help="持久化 BM25 检索索引文件（SQLite），按 (repo, base_commit) 复用、按文件差异增量更新")
+    parser.add_argument("--retrieval", choices=["seed", "replace"], default="seed",
+                        help="检索结果的用法：seed 在目录渲染中优先保留（flat 模式），replace 直接作为文件查询结果")
+    parser.add_argument("--retrieval-top-k", type=int, default=10, help="检索返回的文件数")
+    parser.add_argument("--blob-store", type=str, default=None,
+                        help="内容寻址的仓库文件存储目录：压缩包按文件内容去重导入，实例之间共享相同的文件")
+    parser.add_argument("--blob-quota-gb", type=float, default=20, help="仓库文件存储的磁盘配额（GB）")
+    parser.add_argument("--blob-link", choices=["auto", "reflink", "hardlink", "copy"], default="auto",
+                        help="从存储物化文件到工作目录的方式：auto 优先 reflink、不支持时复制；"
+                             "hardlink 最快但测试原地修改文件会破坏存储")
+    parser.add_argument("--thinking-budget", action="append", default=[],
+                        help="思考过程的 token 预算，超出时强制模型给出回答：N 作用于所有阶段，"
+                             "stage=N（file_query / patch_generator / patch_verifier）只作用于该阶段，0 表示不限制；可重复")
+    parser.add_argument("--journal", type=str, default=None,
+                        help="批量模式的运行日志（SQLite）：记录各阶段结果，中断后用同一文件重跑时"
+                             "跳过已完成的实例、从未完成实例最后完成的阶段继续")
+    parser.add_argument("--trace", type=str, default=None,
+                        help="把各阶段 span（耗时、token 数、接受/拒绝）追加写入该 JSONL 文件，"
+                             "用 python tracing.py <文件> 汇总")
     args = parser.parse_args()
+    if not args.batch and not (args.problem and args.archive):
+        parser.error("需要提供 --batch，或同时提供 --problem 与 --archive")
+    if args.backend == "openai" and not args.endpoint:
+        parser.error("--backend openai 需要至少一个 --endpoint")
+
+    if args.trace:
+        tracing.configure(args.trace)
+    cache_policy = {stage: CACHE_BYPASS for stage in args.cache_bypass}
+    cache_policy.update({stage: CACHE_REFRESH for stage in args.cache_refresh})
+    if args.backend == "openai":
+        from llm_backends import OpenAIBackend
+        backend = OpenAIBackend(
+            args.endpoint, args.model, tokenizer_path=args.model_path, max_concurrency=args.max_concurrency,
+            backoff=args.retry_backoff,
+        )
+    elif args.backend == "fake":
+        from llm_backends import FakeBackend
+        backend = FakeBackend(latency=args.fake_latency)
+    else:
+        from llm_backends import VLLMBackend
+        backend = VLLMBackend(
+            model_path=args.model_path, max_num_seqs=MAX_NUM_SEQS, max_model_len=MAX_MODEL_LEN,
+            tensor_parallel_size=args.tensor_parallel_size,
+        )
+    llm_provider = LLMProvider(
+        backend, cache_path=args.cache, cache_policy=cache_policy,
+        thinking_budgets=parse_thinking_budgets(args.thinking_budget),
+    )
+    predictor = Predictor(
+        model_path=args.model,
+        num_candidates=args.num_candidates,
+        early_exit=args.early_exit,
+        cache_path=args.cache,
+        cache_policy=cache_policy,
+        localization=args.localization,
+        validate_patches=not args.no_validate,
+        cluster_candidates=not args.no_cluster,
+        wave_size=args.wave_size,
+        test_verifier=TestVerifier(EnvManager(
+            env_dir=args.env_dir,
+            pool_size=args.env_pool_size,
+            quota_bytes=int(args.env_quota_gb * 1024 ** 3),
+            wheel_dir=args.wheel_dir,
+        )) if args.test_verify else None,
+        llm_provider=llm_provider,
+        retrieval_index=RetrievalIndex(args.retrieval_index) if args.retrieval_index else None,
+        retrieval_mode=args.retrieval,
+        retrieval_top_k=args.retrieval_top_k,
+        blob_store=BlobStore(
+            args.blob_store, quota_bytes=int(args.blob_quota_gb * 1024 ** 3), link=args.blob_link,
+        ) if args.blob_store else None,
+        journal=RunJournal(args.journal) if args.journal and args.batch else None,
+    )
+    if args.batch:
+        instances = load_instances(args.batch, args.archive_dir)
+        if args.pipeline:
+            scheduler = PipelineScheduler(predictor, queue_size=args.queue_size, max_batch=args.batch_size)
+            predictions = scheduler.run(instances)
+        else:
+            predictions = predictor.predict_batch(instances, batch_size=args.batch_size)
+        if predictor.journal is not None:
+            predictor.journal.close()
+        Utils.write_predictions(predictions, args.output, args.model)
+        resolved = sum(1 for patch in predictions.values() if patch)
+        print(f"Wrote {len(predictions)} predictions ({resolved} with patches) to {args.output}")
+        llm_provider.policy.report()
+        return
 
-    predictor = Predictor(model_path=args.model)
     patch = predictor.predict(args.problem, args.archive)
+    llm_provider.policy.report()
     if patch:
         print("Generated Patch:\n", patch)
     else:
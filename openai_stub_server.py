@@ -0,0 +1,67 @@
+# openai_stub_server.py
+# 本地 OpenAI 兼容 /v1/completions 替身服务，回复与 FakeBackend 相同，用于测试 HTTP 后端：
+#   python openai_stub_server.py --port 8001 --latency 0.5
+import argparse
+import itertools
+import json
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from llm_backends import canned_response
+
+
+def make_handler(latency, failure_rate):
+    ids = itertools.count()
+
+    class Handler(BaseHTTPRequestHandler):
+        # HTTP/1.1 以支持长连接
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if self.path.rstrip("/") != "/v1/completions":
+                return self.reply(404, {"error": f"unknown path {self.path}"})
+            if random.random() < failure_rate:
+                return self.reply(503, {"error": "injected failure"})
+            time.sleep(latency)
+            prompt = body.get("prompt", "")
+            text = canned_response(prompt)
+            self.reply(200, {
+                "id": f"cmpl-{next(ids)}",
+                "object": "text_completion",
+                "model": body.get("model"),
+                "choices": [
+                    {"index": i, "text": text, "finish_reason": "stop"} for i in range(body.get("n", 1))
+                ],
+                "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(text) // 4},
+            })
+
+        def reply(self, status, payload):
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI 兼容替身服务")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0.0, help="每个请求的延迟（秒）")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="随机返回 503 的比例，用于测试重试")
+    args = parser.parse_args()
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(args.latency, args.failure_rate))
+    print(f"Serving on http://{args.host}:{args.port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
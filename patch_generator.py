@@ -1,73 +1,76 @@
 # patch_generator.py
 import re
 from llm_provider import LLMProvider
+from prompts import FEW_SHOT_PROMPT, FILE_CONTENT_PROMPT
 
 class PatchGenerator:
+    STAGE = "patch_generator"
+
     def __init__(self, llm_provider: LLMProvider):
         self.llm_provider = llm_provider
         self.tokenizer = llm_provider.tokenizer
-        self.patching_prompt = """
-You will be implementing a git diff patch to solve an issue with the code repository.
-Before writing the patch, carefully reason through the problem with the following example:
-
-Example:
-Problem Statement: "Pylint reports a TypeError in a.py because a NoneType is being formatted in astroid's _infer_from_values."
-Relevant file snippet from repo/astroid/nodes/node_classes.py might show:
-    formatted = format(value.value, format_spec.value)
-Chain of Thought:
-1. The error occurs because value.value is None.
-2. A possible fix is to check if value.value is None and substitute a default (e.g., 0) or skip formatting.
-3. Therefore, modify the code to use: formatted = format(value.value if value.value is not None else 0, format_spec.value)
-Final Patch Example:
-<patch>
---- a/astroid/nodes/node_classes.py
-+++ b/astroid/nodes/node_classes.py
-@@ -X,Y +X,Y @@
--    formatted = format(value.value, format_spec.value)
-+    formatted = format(value.value if value.value is not None else 0, format_spec.value)
-</patch>
-
-Now, generate a patch for the following:
-
-This is the problem statement.
-
-{problem_statement}
-
-These are the files that are thought to be relevant
-
-{file_content_string}
-
+        self.budget = llm_provider.budget
+        self.policy = llm_provider.policy
+        self.patching_prompt = FEW_SHOT_PROMPT + FILE_CONTENT_PROMPT + """
 Write a git diff within <patch> and </patch> that fixes the problem.
-""".strip()
+""".rstrip()
 
-    def get_patch(self, problem_statement, file_content_string):
-        from vllm import SamplingParams
-        sampling_params = SamplingParams(
-            temperature=1.0,
-            min_p=0.01,
-            skip_special_tokens=True,
-            max_tokens=32768,
-        )
+    def build_prompt(self, problem_statement, file_content_string):
         prompt = self.patching_prompt.format(
             problem_statement=problem_statement,
             file_content_string=file_content_string
         )
-        list_of_messages = [[{"role": "user", "content": prompt}]]
-        list_of_texts = [
-            self.tokenizer.apply_chat_template(
-                conversation=messages,
-                tokenize=False,
-                add_generation_prompt=True
-            )
-            for messages in list_of_messages
+        messages = [{"role": "user", "content": prompt}]
+        return self.tokenizer.apply_chat_template(
+            conversation=messages,
+            tokenize=False,
+            add_generation_prompt=True
+        )
+
+    def fit_prompt(self, problem_statement, file_content_string):
+        """按预算裁剪问题描述与文件内容，返回 (提示词, 估算的 token 数)。"""
+        problem_statement = self.budget.fit_problem(problem_statement)
+        static = self.budget.static_part(self.patching_prompt)
+        file_content_string = self.budget.fit_file_content(
+            file_content_string, problem_statement,
+            self.budget.input_limit - self.budget.prompt_tokens(static, problem_statement),
+        )
+        return (
+            self.build_prompt(problem_statement, file_content_string),
+            self.budget.prompt_tokens(static, problem_statement, file_content_string),
+        )
+
+    def sample_patches(self, requests, num_candidates=1):
+        """
+        批量生成候选补丁：requests 为 (problem_statement, file_content_string) 列表，
+        每个提示词通过 SamplingParams.n 一次采样 num_candidates 个候选，所有实例合并为一次 generate 调用。
+        按输入顺序返回候选列表，每项为 [(patch_string, response_text), ...]。
+        """
+        if not requests:
+            return []
+        prompts = [
+            self.fit_prompt(problem_statement, file_content_string)
+            for problem_statement, file_content_string in requests
         ]
-        print("PatchGenerator token lengths:", [len(self.tokenizer.encode(text)) for text in list_of_texts])
-        response = self.llm_provider.generate(prompts=list_of_texts, sampling_params=sampling_params)
-        if not response:
-            return "", ""
-        response_text = response[0].outputs[0].text
-        patch_string = self.extract_patch_string(response_text)
-        return patch_string, response_text
+        list_of_texts = [text for text, _ in prompts]
+        prompt_tokens = [tokens for _, tokens in prompts]
+        print("PatchGenerator token lengths:", prompt_tokens)
+        # 停止串、max_tokens（思考预算与窗口剩余空间）与强制收尾由 GenerationPolicy 设置
+        responses = self.policy.generate(
+            list_of_texts, prompt_tokens, self.STAGE,
+            n=num_candidates,
+            temperature=1.0,
+            min_p=0.01,
+            skip_special_tokens=True,
+        )
+        if not responses:
+            return [[("", "")] for _ in requests]
+        results = []
+        for resp in responses:
+            results.append([
+                (self.extract_patch_string(output.text), output.text) for output in resp.outputs
+            ])
+        return results
 
     @staticmethod
     def extract_patch_string(text):
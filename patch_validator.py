@@ -0,0 +1,284 @@
+# patch_validator.py
+import os
+import re
+
+
+class Hunk:
+    def __init__(self):
+        # (标记, 文本)，标记为 " "、"-"、"+"
+        self.lines = []
+
+    @property
+    def old_lines(self):
+        return [text for tag, text in self.lines if tag != "+"]
+
+    @property
+    def new_lines(self):
+        return [text for tag, text in self.lines if tag != "-"]
+
+
+class FilePatch:
+    def __init__(self, old_path, new_path):
+        self.old_path = old_path
+        self.new_path = new_path
+        self.hunks = []
+
+
+class PatchError(Exception):
+    pass
+
+
+def normalize_line(text):
+    return " ".join(text.split())
+
+
+# git diff 中文件之间的扩展头行，出现时结束当前 hunk
+GIT_HEADER = re.compile(
+    r"^(diff --git |index [0-9a-f]+\.\.[0-9a-f]+|new file mode |deleted file mode |old mode |new mode |"
+    r"similarity index |dissimilarity index |rename from |rename to |copy from |copy to |Binary files )"
+)
+HUNK_HEADER = re.compile(r"^@@ -\d+(?:,(\d+))? \+\d+(?:,(\d+))? @@")
+
+
+def hunk_length(lines, start, header):
+    """
+    @@ 头中的行数与其后的 hunk 内容恰好吻合时返回 hunk 占用的行数，否则返回 None
+    （模型常写成 @@ -X,Y +X,Y @@ 或给出错误的行数，此时按宽松规则解析）。
+    """
+    match = HUNK_HEADER.match(header)
+    if match is None:
+        return None
+    old_count = int(match.group(1) or 1)
+    new_count = int(match.group(2) or 1)
+    i = start
+    while old_count > 0 or new_count > 0:
+        if i >= len(lines):
+            return None
+        line = lines[i]
+        i += 1
+        if line.startswith("\\"):
+            continue
+        tag = line[:1] or " "
+        if tag == " ":
+            old_count -= 1
+            new_count -= 1
+        elif tag == "-":
+            old_count -= 1
+        elif tag == "+":
+            new_count -= 1
+        else:
+            return None
+        if old_count < 0 or new_count < 0:
+            return None
+    while i < len(lines) and lines[i].startswith("\\"):
+        i += 1
+    # 之后仍是 hunk 内容行（而不是下一个文件头）时说明行数少写了，行数不可信
+    if i < len(lines) and lines[i][:1] in (" ", "-", "+") and not (
+        lines[i].startswith("--- ") and i + 1 < len(lines) and lines[i + 1].startswith("+++ ")
+    ):
+        return None
+    return i - start
+
+
+def parse_patch(patch_string):
+    """
+    宽松地解析统一 diff：@@ 头中的行数与内容吻合时按行数划分 hunk，否则忽略行号
+    （模型常写成 @@ -X,Y +X,Y @@），hunk 内的空行视为空的上下文行；
+    git 的扩展头行（diff --git、index、new file mode 等）结束当前 hunk。
+    """
+    file_patches = []
+    current = None
+    hunk = None
+    # 按 @@ 头行数划分时 hunk 剩余的行数
+    remaining = None
+    lines = patch_string.splitlines()
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        if remaining is not None:
+            if not line.startswith("\\"):
+                hunk.lines.append((line[:1] or " ", line[1:]))
+            remaining -= 1
+            if remaining == 0:
+                hunk, remaining = None, None
+            i += 1
+            continue
+        if line.startswith("--- ") and i + 1 < len(lines) and lines[i + 1].startswith("+++ "):
+            current = FilePatch(line[4:].split("\t")[0].strip(), lines[i + 1][4:].split("\t")[0].strip())
+            file_patches.append(current)
+            hunk = None
+            i += 2
+            continue
+        if GIT_HEADER.match(line):
+            hunk = None
+        elif line.startswith("@@") and current is not None:
+            hunk = Hunk()
+            current.hunks.append(hunk)
+            remaining = hunk_length(lines, i + 1, line) or None
+        elif hunk is not None and not line.startswith("\\"):
+            if line[:1] in (" ", "-", "+"):
+                hunk.lines.append((line[0], line[1:]))
+            else:
+                hunk.lines.append((" ", line))
+        i += 1
+    for fp in file_patches:
+        for hunk in fp.hunks:
+            # 补丁末尾多余的空行不作为上下文
+            while hunk.lines and hunk.lines[-1] == (" ", ""):
+                hunk.lines.pop()
+    return [fp for fp in file_patches if fp.hunks]
+
+
+class PatchValidator:
+    """
+    在 CPU 上快速校验候选补丁：
+    1. 解析 diff，将每个 hunk 的上下文与删除行在仓库文件中定位（精确 -> 忽略空白 -> 模糊匹配）；
+    2. 按实际位置重写 hunk 头，并用文件中的真实文本替换上下文行；
+    3. 在内存中应用补丁，对涉及的 Python 文件做 compile() 语法检查。
+    """
+    def __init__(self, repo_index, fuzzy_ratio=0.8):
+        self.repo_index = repo_index
+        self.fuzzy_ratio = fuzzy_ratio
+
+    def resolve(self, path):
+        """补丁中的路径 -> 仓库相对路径；/dev/null 返回 None。"""
+        if path == "/dev/null":
+            return None
+        for prefix in ("a/", "b/"):
+            if path.startswith(prefix):
+                path = path[len(prefix):]
+                break
+        path = os.path.normpath(path)
+        root = os.path.normpath(self.repo_index.root)
+        # 模型有时会照抄提示词中带 repo/ 前缀的路径
+        if path.startswith(root + os.sep) and not self.exists(path):
+            path = path[len(root) + 1:]
+        return path
+
+    def exists(self, relpath):
+        return self.repo_index.is_file(os.path.join(self.repo_index.root, relpath))
+
+    def locate(self, file_lines, old_lines, start):
+        """返回 old_lines 在 file_lines 中的起始下标，依次尝试精确、忽略空白与模糊匹配。"""
+        n = len(old_lines)
+        if n == 0:
+            return None
+        positions = list(range(start, len(file_lines) - n + 1)) + list(range(0, min(start, len(file_lines) - n + 1)))
+        for i in positions:
+            if file_lines[i:i + n] == old_lines:
+                return i
+        normalized = [normalize_line(line) for line in old_lines]
+        normalized_file = [normalize_line(line) for line in file_lines]
+        for i in positions:
+            if normalized_file[i:i + n] == normalized:
+                return i
+        best, best_score = None, 0.0
+        for i in positions:
+            window = normalized_file[i:i + n]
+            score = sum(1 for a, b in zip(window, normalized) if a == b) / n
+            if score > best_score:
+                best, best_score = i, score
+        if best_score >= self.fuzzy_ratio:
+            return best
+        return None
+
+    def apply(self, patch_string):
+        """
+        在内存中应用补丁。返回 (修复后的补丁字符串, {相对路径: 新文本或 None（删除）})；
+        无法应用时抛出 PatchError。
+        """
+        file_patches = parse_patch(patch_string)
+        if not file_patches:
+            raise PatchError("no file diffs found in patch")
+        output = []
+        results = {}
+        for fp in file_patches:
+            old_rel = self.resolve(fp.old_path)
+            new_rel = self.resolve(fp.new_path or fp.old_path)
+            if old_rel is not None and not self.exists(old_rel):
+                if fp.hunks and all(not hunk.old_lines for hunk in fp.hunks):
+                    # 把不存在文件的修改当作新建文件
+                    old_rel = None
+                else:
+                    raise PatchError(f"file does not exist: {old_rel}")
+            rel = new_rel if new_rel is not None else old_rel
+            if old_rel is None:
+                file_lines = []
+            else:
+                file_lines = [line.rstrip("\n") for line in
+                              self.repo_index.read_lines(os.path.join(self.repo_index.root, old_rel))]
+
+            placed = []
+            cursor = 0
+            for number, hunk in enumerate(fp.hunks, start=1):
+                old_lines = hunk.old_lines
+                if not old_lines:
+                    if file_lines:
+                        raise PatchError(f"hunk {number} in {rel} has no context to anchor it")
+                    position = 0
+                else:
+                    position = self.locate(file_lines, old_lines, cursor)
+                    if position is None:
+                        raise PatchError(f"hunk {number} does not apply to {rel}")
+                # 上下文与删除行替换为文件中的真实文本
+                actual = iter(file_lines[position:position + len(old_lines)])
+                repaired = [(tag, next(actual)) if tag != "+" else (tag, text) for tag, text in hunk.lines]
+                placed.append((position, len(old_lines), repaired))
+                cursor = position + len(old_lines)
+            placed.sort(key=lambda item: item[0])
+            for (pos_a, len_a, _), (pos_b, _, _) in zip(placed, placed[1:]):
+                if pos_a + len_a > pos_b:
+                    raise PatchError(f"overlapping hunks in {rel}")
+
+            new_lines = []
+            last = 0
+            offset = 0
+            headers = []
+            for position, length, repaired in placed:
+                new_lines.extend(file_lines[last:position])
+                added = [text for tag, text in repaired if tag != "-"]
+                headers.append((position, length, position + offset, len(added), repaired))
+                new_lines.extend(added)
+                offset += len(added) - length
+                last = position + length
+            new_lines.extend(file_lines[last:])
+
+            deleted = fp.new_path == "/dev/null"
+            output.append(f"--- {'a/' + old_rel if old_rel is not None else '/dev/null'}")
+            output.append(f"+++ {'/dev/null' if deleted else 'b/' + rel}")
+            for old_pos, old_len, new_pos, new_len, repaired in headers:
+                old_start = old_pos + 1 if old_len else old_pos
+                new_start = new_pos + 1 if new_len else new_pos
+                output.append(f"@@ -{old_start},{old_len} +{new_start},{new_len} @@")
+                output.extend(tag + text for tag, text in repaired)
+            results[rel] = None if deleted else "\n".join(new_lines) + ("\n" if new_lines else "")
+        return "\n".join(output) + "\n", results
+
+    def validate(self, patch_string):
+        """返回 (修复后的补丁, None)，或 (None, 错误原因)。"""
+        try:
+            fixed_patch, contents = self.apply(patch_string)
+        except PatchError as e:
+            return None, str(e)
+        for rel, text in contents.items():
+            if text is None or not rel.endswith(".py"):
+                continue
+            try:
+                compile(text, rel, "exec")
+            except SyntaxError as e:
+                if self.original_compiles(rel):
+                    return None, f"syntax error in {rel} after patch: {e}"
+            except ValueError:
+                continue
+        return fixed_patch, None
+
+    def original_compiles(self, rel):
+        """原文件本身能否编译；原本就无法编译的文件不因补丁而拒绝。"""
+        if not self.exists(rel):
+            return True
+        path = os.path.join(self.repo_index.root, rel)
+        try:
+            compile("".join(self.repo_index.read_lines(path)), rel, "exec")
+        except (SyntaxError, ValueError):
+            return False
+        return True
@@ -1,41 +1,19 @@
 # patch_verifier.py
 from llm_provider import LLMProvider
+from prompts import FEW_SHOT_PROMPT, FILE_CONTENT_PROMPT
 
 class PatchVerifier:
+    STAGE = "patch_verifier"
+    # 每个候选补丁的投票数
+    NUM_VOTES = 4
+    SAMPLING = {"temperature": 1.0, "min_p": 0.01, "skip_special_tokens": True}
+
     def __init__(self, llm_provider: LLMProvider):
         self.llm_provider = llm_provider
         self.tokenizer = llm_provider.tokenizer
-        self.verifying_prompt = """
-Before evaluating the following patch, consider this example:
-
-Example:
-Problem Statement: "Pylint reports a TypeError due to formatting a None value."
-Relevant file snippet:
-    formatted = format(value.value, format_spec.value)
-Proposed Patch Example:
-<patch>
---- a/astroid/nodes/node_classes.py
-+++ b/astroid/nodes/node_classes.py
-@@ -X,Y +X,Y @@
--    formatted = format(value.value, format_spec.value)
-+    formatted = format(value.value if value.value is not None else 0, format_spec.value)
-</patch>
-Chain of Thought:
-1. The patch checks if value.value is None before formatting.
-2. This should prevent the TypeError.
-Observation: The patch appears to address the issue by substituting a default value.
-Expected final evaluation: <label>Yes</label>, this fixes the problem.
-
-Now, evaluate the following patch:
-
-This is the problem statement.
-
-{problem_statement}
-
-These are the files that are thought to be relevant, which may not be complete.
-
-{file_content_string}
-
+        self.budget = llm_provider.budget
+        self.policy = llm_provider.policy
+        self.verifying_prompt = FEW_SHOT_PROMPT + FILE_CONTENT_PROMPT + """
 This is the proposed patch to fix the problem.
 
 {patch_string}
@@ -50,38 +28,173 @@ End your response with exactly either of:
 Note:
 - Only evaluate; do not provide suggestions on how to fix.
 - End with exactly either <label>Yes</label> or <label>No</label>.
-""".strip()
+""".rstrip()
 
-    def verify_patch(self, problem_statement, file_content_string, patch_string):
-        from vllm import SamplingParams
-        sampling_params = SamplingParams(
-            temperature=1.0,
-            min_p=0.01,
-            skip_special_tokens=True,
-            max_tokens=32768,
-        )
+    def build_prompt(self, problem_statement, file_content_string, patch_string):
         prompt = self.verifying_prompt.format(
             problem_statement=problem_statement,
             file_content_string=file_content_string,
             patch_string=patch_string
         )
+        messages = [{"role": "user", "content": prompt}]
+        return self.tokenizer.apply_chat_template(
+            conversation=messages,
+            tokenize=False,
+            add_generation_prompt=True
+        )
+
+    def fit_prompt(self, problem_statement, file_content_string, patch_string):
+        """按预算裁剪问题描述与文件内容（补丁保持完整），返回 (提示词, 估算的 token 数)。"""
+        problem_statement = self.budget.fit_problem(problem_statement)
+        fixed = (self.budget.static_part(self.verifying_prompt), problem_statement, patch_string)
+        file_content_string = self.budget.fit_file_content(
+            file_content_string, problem_statement, self.budget.input_limit - self.budget.prompt_tokens(*fixed)
+        )
+        return (
+            self.build_prompt(problem_statement, file_content_string, patch_string),
+            self.budget.prompt_tokens(*fixed, file_content_string),
+        )
+
+    def build_requests(self, requests):
+        """每个候选展开为 NUM_VOTES 个请求，返回 (提示词列表, 逐条的估算 token 数)。"""
+        list_of_texts, prompt_tokens = [], []
+        for problem_statement, file_content_string, patch_string in requests:
+            text, tokens = self.fit_prompt(problem_statement, file_content_string, patch_string)
+            list_of_texts.extend([text] * self.NUM_VOTES)
+            prompt_tokens.extend([tokens] * self.NUM_VOTES)
+            print("PatchVerifier token length:", tokens)
+        return list_of_texts, prompt_tokens
+
+    def verify_patches(self, requests, support=None):
+        """
+        批量验证：requests 为 (problem_statement, file_content_string, patch_string) 列表，
+        每个候选补丁生成 NUM_VOTES 个回复，全部候选合并为一次 generate 调用。
+        support[i] 为候选的额外赞成票（如同一修复被采样到多次），可抵消等量的否决票。
+        按输入顺序返回 (verified_patch 或 None, response_text) 列表。
+        """
+        if not requests:
+            return []
         # 生成多个回复，进行投票判断
-        list_of_messages = [[{"role": "user", "content": prompt}] for _ in range(4)]
-        list_of_texts = [
-            self.tokenizer.apply_chat_template(
-                conversation=messages,
-                tokenize=False,
-                add_generation_prompt=True
-            )
-            for messages in list_of_messages
-        ]
-        print("PatchVerifier token lengths:", [len(self.tokenizer.encode(text)) for text in list_of_texts])
-        responses = self.llm_provider.generate(prompts=list_of_texts, sampling_params=sampling_params)
+        list_of_texts, prompt_tokens = self.build_requests(requests)
+        responses = self.policy.generate(list_of_texts, prompt_tokens, self.STAGE, **self.SAMPLING)
         if not responses:
-            return None, ""
-        response_texts = [resp.outputs[0].text for resp in responses]
-        # 如果所有回复均包含 <label>Yes</label>，则认为补丁有效
-        for text in response_texts:
-            if "<label>Yes</label>" not in text:
-                return None, text
-        return patch_string, response_texts[-1]
+            return [(None, "") for _ in requests]
+        support = support or [0] * len(requests)
+        results = []
+        for i, (_, _, patch_string) in enumerate(requests):
+            votes = responses[i * self.NUM_VOTES:(i + 1) * self.NUM_VOTES]
+            results.append(self.count_votes(patch_string, [resp.outputs[0].text for resp in votes], support[i]))
+        return results
+
+    def verify_patch(self, problem_statement, file_content_string, patch_string):
+        return self.verify_patches([(problem_statement, file_content_string, patch_string)])[0]
+
+    def verify_patches_early_exit(self, requests, groups=None, support=None):
+        """
+        流式验证：所有候选的投票请求一次性提交给引擎，边解码边判定。
+        - 否决票（<label>No</label> 或结束时没有 Yes）超过 support[i] 张时，立即中止该候选的其余投票；
+        - 赞成票加 support[i] 达到 NUM_VOTES 时接受该候选，中止其余投票；
+        - 某一票给出标签后即停止该票的解码；
+        - groups[i] 为候选所属实例，同组有候选获得全部 Yes 票时中止同组其余候选的验证；
+        - 思考超出预算或标签出现在思考中的票不立即判定，流式生成结束后由 GenerationPolicy 续写再计票。
+        返回值与 verify_patches 相同，被取消的候选返回 (None, "")。
+        """
+        if not requests:
+            return []
+        if groups is None:
+            groups = list(range(len(requests)))
+        support = support or [0] * len(requests)
+        list_of_texts, prompt_tokens = self.build_requests(requests)
+        sampling_params = [
+            self.policy.sampling_params(self.STAGE, tokens, **self.SAMPLING) for tokens in prompt_tokens
+        ]
+        deferred = []
+
+        votes = [[None] * self.NUM_VOTES for _ in requests]
+        rejections = [0] * len(requests)
+        texts = [[""] * self.NUM_VOTES for _ in requests]
+        verdicts = [None] * len(requests)
+
+        def request_indices(candidates):
+            return [c * self.NUM_VOTES + v for c in candidates for v in range(self.NUM_VOTES)]
+
+        def on_update(index, output):
+            candidate, vote_index = divmod(index, self.NUM_VOTES)
+            if verdicts[candidate] is not None:
+                return []
+            if output.finished and self.policy.needs_continuation(
+                self.STAGE, list_of_texts[index], prompt_tokens[index], output.outputs[0]
+            ):
+                deferred.append(index)
+                return []
+            return record_vote(index, output)
+
+        def record_vote(index, output):
+            candidate, vote_index = divmod(index, self.NUM_VOTES)
+            if verdicts[candidate] is not None:
+                return []
+            text = output.outputs[0].text
+            texts[candidate][vote_index] = text
+            vote = self.parse_vote(text) if ("</think>" in text or output.finished) else None
+            if vote is None and not output.finished:
+                return []
+            votes[candidate][vote_index] = vote or "No"
+            if vote != "Yes":
+                rejections[candidate] += 1
+                if rejections[candidate] <= support[candidate]:
+                    return [index]
+                # 否决票超过额外赞成票，中止该候选的其余投票
+                verdicts[candidate] = False
+                return request_indices([candidate])
+            if votes[candidate].count("Yes") + support[candidate] >= self.NUM_VOTES:
+                verdicts[candidate] = True
+                # 同组其余候选不再需要验证
+                siblings = [
+                    c for c in range(len(requests))
+                    if c != candidate and groups[c] == groups[candidate] and verdicts[c] is None
+                ]
+                for c in siblings:
+                    verdicts[c] = False
+                return [index] + request_indices(siblings)
+            # 标签已给出，停止这一票的解码
+            return [index]
+
+        outputs = self.llm_provider.generate_with_abort(list_of_texts, sampling_params, on_update, stage=self.STAGE)
+        deferred = [index for index in deferred if verdicts[index // self.NUM_VOTES] is None]
+        if deferred:
+            continued = self.policy.complete(
+                [list_of_texts[index] for index in deferred], [prompt_tokens[index] for index in deferred],
+                [outputs[index] for index in deferred], self.STAGE, **self.SAMPLING,
+            )
+            for index, output in zip(deferred, continued):
+                record_vote(index, output)
+        results = []
+        for (_, _, patch_string), verdict, candidate_texts, candidate_votes in zip(requests, verdicts, texts, votes):
+            if verdict:
+                # 返回最后一张实际记录的赞成票（其后的投票可能已被中止，文本为空）
+                accepted = [text for text, vote in zip(candidate_texts, candidate_votes) if vote == "Yes"]
+                results.append((patch_string, accepted[-1]))
+            else:
+                rejected = [text for text in candidate_texts if text and self.parse_vote(text) != "Yes"]
+                results.append((None, rejected[0] if rejected else ""))
+        return results
+
+    @staticmethod
+    def parse_vote(text):
+        """解析一次投票：只看思考过程之后的最终回答，返回 "Yes"、"No" 或 None。"""
+        answer = text.split("</think>")[-1]
+        if "<label>Yes</label>" in answer:
+            return "Yes"
+        if "<label>No</label>" in answer:
+            return "No"
+        return None
+
+    @staticmethod
+    def count_votes(patch_string, response_texts, support=0):
+        # 如果所有回复的最终回答均为 <label>Yes</label>，则认为补丁有效；support 张额外赞成票可抵消等量的否决票
+        # （与 early exit 相同，用 parse_vote 判定，思考过程中的草稿标签不计）
+        rejected = [text for text in response_texts if PatchVerifier.parse_vote(text) != "Yes"]
+        if len(rejected) > support:
+            return None, rejected[0]
+        accepted = [text for text in response_texts if PatchVerifier.parse_vote(text) == "Yes"]
+        return patch_string, accepted[-1] if accepted else response_texts[-1]
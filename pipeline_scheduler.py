@@ -0,0 +1,214 @@
+# pipeline_scheduler.py
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from predictor import Predictor
+
+STAGES = ("extract", "index", "query", "fetch", "generate", "validate", "verify")
+# 调用推理引擎的阶段：每次从队列中取出一批实例，合并为一次 generate 调用
+LLM_STAGES = {"query", "generate", "verify"}
+DEFAULT_CONCURRENCY = {
+    "extract": 2, "index": 2, "query": 1, "fetch": 4, "generate": 1, "validate": 2, "verify": 1,
+}
+
+
+class PipelineScheduler:
+    """
+    基于 asyncio 的多阶段流水线：extract -> index -> query -> fetch -> generate -> validate -> verify。
+    - 每个阶段有一个有界队列（queue_size），下游积压时上游的 put 会等待，形成背压；
+    - 每个阶段启动 concurrency[stage] 个工作协程；CPU 阶段在线程池中执行，
+      LLM 阶段一次取出最多 max_batch 个实例合并提交，所有引擎调用在同一个线程中串行执行（共享一个引擎）；
+    - 线程池在每次运行开始时创建、结束时关闭；
+    - 验证未通过且仍有候选或尝试次数时，实例回流到 verify / generate 队列；
+    这样解压、建索引、取内容与日志等 CPU 工作可以和 GPU 解码重叠。
+    """
+    def __init__(self, predictor: Predictor, queue_size=8, concurrency=None, max_batch=16, cpu_workers=8):
+        self.predictor = predictor
+        self.queue_size = queue_size
+        self.concurrency = dict(DEFAULT_CONCURRENCY, **(concurrency or {}))
+        self.max_batch = max_batch
+        self.cpu_workers = cpu_workers
+        self.cpu_executor = None
+        self.llm_executor = None
+        # 并行模式只采样一次；逐个模式最多 max_attempts 轮
+        self.max_attempts = 1 if predictor.num_candidates else predictor.max_attempts
+        # {阶段: [处理实例数, 累计耗时（秒）]}
+        self.stats = {stage: [0, 0.0] for stage in STAGES}
+        self.verify_batches = 0
+
+    def run(self, instances):
+        """instances 为字典列表（instance_id、problem_statement、archive），返回 {instance_id: 补丁或 None}。"""
+        return asyncio.run(self.run_async(instances))
+
+    async def run_async(self, instances):
+        self.cpu_executor = ThreadPoolExecutor(max_workers=self.cpu_workers, thread_name_prefix="pipeline-cpu")
+        self.llm_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pipeline-llm")
+        try:
+            return await self.run_stages(instances)
+        finally:
+            self.cpu_executor.shutdown(wait=True)
+            self.llm_executor.shutdown(wait=True)
+            self.cpu_executor = self.llm_executor = None
+
+    async def run_stages(self, instances):
+        all_instances = list(instances)
+        instances, completed = self.predictor.resume_instances(all_instances)
+        self.queues = {stage: asyncio.Queue(maxsize=self.queue_size) for stage in STAGES}
+        self.predictions = dict(completed)
+        self.remaining = len(instances)
+        self.finished = asyncio.Event()
+        self.background = set()
+        if not instances:
+            return {instance["instance_id"]: self.predictions.get(instance["instance_id"]) for instance in all_instances}
+        start = time.time()
+        workers = [asyncio.create_task(self.feed(instances))]
+        for stage in STAGES:
+            for _ in range(self.concurrency[stage]):
+                workers.append(asyncio.create_task(
+                    self.llm_worker(stage) if stage in LLM_STAGES else self.cpu_worker(stage)
+                ))
+        await self.finished.wait()
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        self.print_stats(time.time() - start)
+        return {instance["instance_id"]: self.predictions.get(instance["instance_id"]) for instance in all_instances}
+
+    async def feed(self, instances):
+        for instance in instances:
+            await self.queues["extract"].put(instance)
+
+    async def cpu_worker(self, stage):
+        handler = getattr(self, f"run_{stage}")
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self.queues[stage].get()
+            start = time.time()
+            try:
+                task, next_stage = await loop.run_in_executor(self.cpu_executor, handler, item)
+            except Exception as e:
+                task, next_stage = self.fail(stage, item, e), None
+            self.record(stage, 1, start)
+            await self.forward(stage, task, next_stage)
+
+    async def llm_worker(self, stage):
+        handler = getattr(self, f"run_{stage}")
+        loop = asyncio.get_running_loop()
+        queue = self.queues[stage]
+        while True:
+            tasks = [await queue.get()]
+            while len(tasks) < self.max_batch and not queue.empty():
+                tasks.append(queue.get_nowait())
+            start = time.time()
+            try:
+                routes = await loop.run_in_executor(self.llm_executor, handler, tasks)
+            except Exception as e:
+                routes = [(self.fail(stage, task, e), None) for task in tasks]
+            self.record(stage, len(tasks), start)
+            for task, next_stage in routes:
+                await self.forward(stage, task, next_stage)
+
+    async def forward(self, stage, task, next_stage):
+        if task is None:
+            return
+        if next_stage is None:
+            await asyncio.get_running_loop().run_in_executor(self.cpu_executor, self.finish, task)
+            self.remaining -= 1
+            if self.remaining == 0:
+                self.finished.set()
+        elif STAGES.index(next_stage) > STAGES.index(stage):
+            await self.queues[next_stage].put(task)
+        else:
+            # 回流到上游队列时不阻塞当前工作协程，避免与上游互相等待
+            put = asyncio.create_task(self.queues[next_stage].put(task))
+            self.background.add(put)
+            put.add_done_callback(self.background.discard)
+
+    def fail(self, stage, item, error):
+        instance_id = item["instance_id"] if isinstance(item, dict) else item.instance_id
+        print(f"[{instance_id}] Stage {stage} failed: {error!r}")
+        if isinstance(item, dict):
+            self.predictions[instance_id] = None
+            self.remaining -= 1
+            if self.remaining == 0:
+                self.finished.set()
+            return None
+        # 出错的实例不写入 done 记录，重启后从已完成的阶段继续
+        item.failed = True
+        return item
+
+    def finish(self, task):
+        self.predictions[task.instance_id] = task.patch
+        self.predictor.finish_task(task)
+        Predictor.close_task(task)
+
+    def record(self, stage, count, start):
+        self.stats[stage][0] += count
+        self.stats[stage][1] += time.time() - start
+
+    def print_stats(self, elapsed):
+        print(f"Pipeline finished in {elapsed:.1f}s")
+        for stage in STAGES:
+            count, seconds = self.stats[stage]
+            print(f"  {stage:<8} {count:5d} item(s) {seconds:8.1f}s elapsed")
+
+    # ---- 各阶段处理函数：CPU 阶段处理单个实例，LLM 阶段处理一批；返回 (task, 下一阶段或 None) ----
+
+    def run_extract(self, instance):
+        task = Predictor.open_task(
+            instance["instance_id"], instance["problem_statement"], instance["archive"], instance,
+            self.predictor.blob_store,
+        )
+        self.predictor.restore(task)
+        self.predictor.warm_environment(task)
+        return task, "index"
+
+    def run_index(self, task):
+        if task.done:
+            # 日志中已有被接受的补丁（只差 done 记录）或查询为空
+            return task, None
+        self.predictor.prepare_directory(task)
+        # 日志中已有查询结果时跳过查询
+        return task, "fetch" if task.file_query else "query"
+
+    def run_query(self, tasks):
+        queries = self.predictor.localize(tasks)
+        return [
+            (task, "fetch" if self.predictor.accept_query(task, file_query, query_response) else None)
+            for task, (file_query, query_response) in zip(tasks, queries)
+        ]
+
+    def run_fetch(self, task):
+        self.predictor.fetch_contents(task)
+        # 从日志恢复的未验证候选直接进入校验；尝试次数已用尽时结束
+        return task, "validate" if task.sampled else self.retry_stage(task)
+
+    def run_generate(self, tasks):
+        num_candidates = self.predictor.num_candidates or 1
+        print(f"Sampling {num_candidates} candidate patch(es) for {len(tasks)} instance(s)")
+        sampled = self.predictor.sample_candidates(tasks, num_candidates)
+        for task, candidates in zip(tasks, sampled):
+            task.sampled = candidates
+        return [(task, "validate") for task in tasks]
+
+    def run_validate(self, task):
+        self.predictor.receive_candidates(task, task.sampled)
+        task.sampled = []
+        return task, "verify" if task.candidates else self.retry_stage(task)
+
+    def run_verify(self, tasks):
+        self.verify_batches += 1
+        self.predictor.verify_candidates(self.predictor.next_wave(tasks), f"verify batch {self.verify_batches}")
+        routes = []
+        for task in tasks:
+            if task.done:
+                routes.append((task, None))
+            elif task.candidates:
+                routes.append((task, "verify"))
+            else:
+                routes.append((task, self.retry_stage(task)))
+        return routes
+
+    def retry_stage(self, task):
+        return "generate" if task.attempts < self.max_attempts else None
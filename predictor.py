@@ -1,60 +1,536 @@
 # predictor.py
+import hashlib
 import os
 import shutil
+import tempfile
+import time
+import tracing
 from utils import Utils
+from repo_index import RepoIndex
+from virtual_repo import open_repo_source
+from snippet_extractor import SnippetExtractor
+from patch_validator import PatchValidator
+from candidate_clusters import CandidateCluster, CandidateClusterer
 from file_query import FileQuery
 from patch_generator import PatchGenerator
 from patch_verifier import PatchVerifier
 from llm_provider import LLMProvider
+from run_journal import freeze
 
 REPO_PATH = "repo"
+# 检索索引排在前面的文件在目录渲染中的加分
+RETRIEVAL_BOOST = 5
+# 同一修复被采样到多次时，最多计入的额外赞成票
+CLUSTER_VOTES = 1
+
+
+class PredictionTask:
+    """单个实例在流水线中的状态。"""
+    def __init__(self, instance_id, problem_statement, repo_index, workspace=None, instance=None):
+        self.instance_id = instance_id
+        # 数据集中的实例元数据（repo、version、test_patch、FAIL_TO_PASS 等），可选
+        self.instance = instance or {}
+        self.problem_statement = problem_statement
+        # 每个压缩包只建一次索引，在各阶段与各次尝试之间复用
+        self.repo_index = repo_index
+        # 该预测独立的工作目录，只存放按需物化的文件
+        self.workspace = workspace
+        self.directory_string = None
+        # 检索索引给出的 [(相对路径, 得分, 搜索串列表), ...]
+        self.retrieved = None
+        self.file_query = None
+        self.file_content_string = None
+        self.sampled = []
+        # 待验证的 CandidateCluster 列表
+        self.candidates = []
+        # 已被验证拒绝的簇（语义键），之后采样到相同的修复不再验证
+        self.rejected = set()
+        self.attempts = 0
+        self.patch = None
+        self.done = False
+        # 某个阶段抛出异常（流水线模式），不写入 done 记录，重启后重新处理
+        self.failed = False
+        # 从运行日志恢复的文件内容哈希，重新提取后用于核对
+        self.fetch_digest = None
+        # 后台预热测试环境的 Future（见 TestVerifier.warm），清理工作目录前等待其结束
+        self.warming = None
+        self.created = time.time()
+
 
 class Predictor:
-    def __init__(self, model_path="deepseek-r1"):
-        self.llm_provider = LLMProvider()
+    def __init__(self, model_path="deepseek-r1", max_attempts=3, num_candidates=None,
+                 early_exit=False, cache_path=None, cache_policy=None, localization="flat",
+                 validate_patches=True, test_verifier=None, llm_provider=None,
+                 retrieval_index=None, retrieval_mode="seed", retrieval_top_k=10, blob_store=None,
+                 cluster_candidates=True, journal=None, wave_size=1):
+        # 可传入共享的 LLMProvider 或使用其他推理后端的 LLMProvider（见 llm_backends.py）
+        self.llm_provider = llm_provider or LLMProvider(cache_path=cache_path, cache_policy=cache_policy)
         self.file_query = FileQuery(self.llm_provider)
         self.patch_generator = PatchGenerator(self.llm_provider)
         self.patch_verifier = PatchVerifier(self.llm_provider)
+        self.snippet_extractor = SnippetExtractor(count_tokens=self.llm_provider.budget.count)
+        self.max_attempts = max_attempts
+        # 设置 num_candidates 时改为并行模式：一次采样 K 个候选，再分波验证；
+        # 与逐个模式不同，K 个候选全部被拒绝后不再重新采样
+        self.num_candidates = num_candidates
+        # 非流式验证时每波验证的每实例候选数（每个候选 NUM_VOTES 个请求）；
+        # 越大批次越满，但同一实例在已接受之后多验证的候选也越多
+        self.wave_size = wave_size
+        # 流式验证：出现 No 票即中止该候选，实例有候选被接受即中止其余候选
+        self.early_exit = early_exit
+        # 文件定位方式：flat 一次给出完整目录；lazy 分多轮逐层展开目录
+        self.localization = localization
+        # 验证前先在 CPU 上应用补丁并做语法检查，无法应用的候选不进入 LLM 验证
+        self.validate_patches = validate_patches
+        # 候选规范化后按语义聚类，每簇只验证一个代表，簇大小计为额外的赞成票
+        self.cluster_candidates = cluster_candidates
+        # 可选的基于测试执行的候选排序（execution_verifier.TestVerifier）
+        self.test_verifier = test_verifier
+        # 可选的持久化 BM25 检索索引（retrieval_index.RetrievalIndex）：
+        # seed 模式下检索结果在目录渲染中优先保留；replace 模式下直接作为文件查询结果，跳过 LLM 查询
+        self.retrieval_index = retrieval_index
+        self.retrieval_mode = retrieval_mode
+        self.retrieval_top_k = retrieval_top_k
+        # 可选的内容寻址仓库文件存储（blob_store.BlobStore），同一仓库的多个实例共享相同的文件
+        self.blob_store = blob_store
+        # 可选的批量运行日志（run_journal.RunJournal）：记录各阶段结果，重启后跳过已完成的工作
+        self.journal = journal
 
-    def predict_inner(self, problem_statement: str, directory: str) -> str:
-        # 获取目录字符串
-        directory_string = Utils.stringify_directory(directory)
-        # 获取文件查询结果（即哪些文件需要检查以及搜索关键字）
-        file_query, query_response = self.file_query.get_query(directory_string, problem_statement)
-        print("File Query Response:\n", query_response)
-        print("Extracted File Query:", file_query)
+    def run_tasks(self, tasks):
+        """
+        对一组已解压的实例执行 查询 -> 取内容 -> 生成 -> 验证 流程，
+        每个阶段把所有未完成实例的提示词合并为一次 generate 调用。
+        """
+        pending = self.query_tasks(tasks)
+        self.verify_restored(pending)
+        if self.num_candidates:
+            self.generate_parallel(pending)
+        else:
+            self.generate_serial(pending)
+        return tasks
+
+    def query_tasks(self, tasks):
+        """文件查询与内容提取，返回查询成功、需要生成补丁的实例；已从运行日志恢复查询结果的实例跳过查询。"""
+        to_query = [task for task in tasks if not task.done and task.file_query is None]
+        if to_query:
+            for task, (file_query, query_response) in zip(to_query, self.localize(to_query)):
+                self.accept_query(task, file_query, query_response)
+        pending = []
+        for task in tasks:
+            if task.done or not task.file_query:
+                continue
+            self.fetch_contents(task)
+            if task.sampled:
+                # 日志中已采样但尚未全部验证的候选
+                self.receive_candidates(task, task.sampled)
+                task.sampled = []
+            pending.append(task)
+        return pending
+
+    def verify_restored(self, pending):
+        """先分波验证从运行日志恢复的候选，再进入正常的生成流程。"""
+        wave = 0
+        restored = [task for task in pending if task.candidates]
+        while restored:
+            wave += 1
+            self.verify_candidates(self.next_wave(restored), f"resumed wave {wave}")
+            restored = [task for task in restored if not task.done and task.candidates]
+
+    def prepare_directory(self, task):
+        """CPU 侧准备：扫描仓库，flat 模式下预先渲染目录字符串。"""
+        if self.retrieval_index is not None and task.retrieved is None:
+            self.retrieve(task)
+        if self.retrieval_mode == "replace" and task.retrieved:
+            return
+        with tracing.span("directory", task.instance_id, localization=self.localization):
+            if self.localization == "lazy":
+                task.repo_index.tree
+            elif task.directory_string is None:
+                boost = {
+                    os.path.join(task.repo_index.root, relpath): RETRIEVAL_BOOST
+                    for relpath, _, _ in task.retrieved or []
+                }
+                task.directory_string = self.file_query.render_directory(
+                    task.repo_index, task.problem_statement, boost=boost
+                )
+
+    def retrieve(self, task):
+        """在 (repo, base_commit) 的检索快照上按问题描述检索文件；没有这两项元数据时不持久化快照。"""
+        repo, revision = task.instance.get("repo"), task.instance.get("base_commit")
+        if not (repo and revision):
+            repo = revision = None
+        with tracing.span("retrieve", task.instance_id) as attributes:
+            snapshot = self.retrieval_index.snapshot(task.repo_index, repo=repo, revision=revision)
+            task.retrieved = snapshot.search(task.problem_statement, top_k=self.retrieval_top_k)
+            attributes["files"] = len(snapshot.manifest)
+            attributes["hits"] = len(task.retrieved)
+        print(f"[{task.instance_id}] Retrieved files:", [(relpath, score) for relpath, score, _ in task.retrieved])
+
+    def retrieval_query(self, task):
+        """检索结果转换为与 FileQuery 相同格式的文件查询 {路径: [搜索串, ...]}。"""
+        return {
+            os.path.join(task.repo_index.root, relpath): strings or ["def "]
+            for relpath, _, strings in task.retrieved or []
+        }
+
+    def localize(self, tasks):
+        """
+        获取文件查询结果（即哪些文件需要检查以及搜索关键字），所有实例合并为一次（每轮）generate 调用。
+        replace 模式下有检索结果的实例直接使用检索结果，其余实例仍由 LLM 查询。
+        """
+        if self.localization != "lazy" or self.retrieval_index is not None:
+            for task in tasks:
+                self.prepare_directory(task)
+        results = {}
+        if self.retrieval_mode == "replace":
+            for task in tasks:
+                if task.retrieved:
+                    results[id(task)] = (self.retrieval_query(task), "(lexical retrieval, no LLM query)")
+        remaining = [task for task in tasks if id(task) not in results]
+        if remaining:
+            for task, query in zip(remaining, self.query_files(remaining)):
+                results[id(task)] = query
+        return [results[id(task)] for task in tasks]
+
+    def query_files(self, tasks):
+        with tracing.span("query", instances=[task.instance_id for task in tasks]) as attributes:
+            if self.localization == "lazy":
+                queries = self.file_query.get_queries_lazy([
+                    (task.repo_index, task.problem_statement) for task in tasks
+                ])
+            else:
+                queries = self.file_query.get_queries([
+                    (task.directory_string, task.problem_statement) for task in tasks
+                ])
+            attributes["found"] = sum(1 for file_query, _ in queries if file_query)
+            return queries
+
+    def accept_query(self, task, file_query, query_response):
+        print(f"[{task.instance_id}] File Query Response:\n", query_response)
+        print(f"[{task.instance_id}] Extracted File Query:", file_query)
+        self.record(task, "query", {"file_query": file_query or {}})
         if not file_query:
-            return None
-        # 根据文件查询结果提取文件内容
-        file_content_string = Utils.fetch_file_contents(file_query, repo_path=REPO_PATH)
-        print("Fetched File Contents:\n", file_content_string)
-        # 多阶段候选生成与验证
-        max_attempts = 3
-        for attempt in range(max_attempts):
-            print(f"Generating candidate patch, attempt {attempt + 1}")
-            candidate_patch, patch_response = self.patch_generator.get_patch(problem_statement, file_content_string)
-            print("Candidate Patch Response:\n", patch_response)
-            print("Candidate Patch:\n", candidate_patch)
-            if not candidate_patch:
+            task.done = True
+            return False
+        task.file_query = file_query
+        return True
+
+    def fetch_contents(self, task):
+        """根据文件查询结果提取文件内容。"""
+        with tracing.span("fetch", task.instance_id, files=len(task.file_query)) as attributes:
+            task.file_content_string = Utils.fetch_file_contents(
+                task.file_query, repo_path=task.repo_index.root, repo_index=task.repo_index,
+                snippet_extractor=self.snippet_extractor,
+            )
+            attributes["chars"] = len(task.file_content_string)
+        digest = hashlib.sha1(task.file_content_string.encode("utf-8")).hexdigest()
+        if task.fetch_digest is None:
+            self.record(task, "fetch", {"sha1": digest, "chars": len(task.file_content_string)})
+        elif task.fetch_digest != digest:
+            print(f"[{task.instance_id}] Warning: fetched contents differ from the journaled run; "
+                  f"resumed candidates were generated from different context")
+        task.fetch_digest = digest
+        print(f"[{task.instance_id}] Fetched File Contents:\n", task.file_content_string)
+
+    def generate_serial(self, pending):
+        """多阶段候选生成与验证：每轮为每个实例生成一个候选并验证，每个实例最多 max_attempts 次（含恢复前的尝试）。"""
+        attempt = 0
+        while True:
+            pending = [task for task in pending if not task.done and task.attempts < self.max_attempts]
+            if not pending:
+                break
+            attempt += 1
+            print(f"Generating candidate patches for {len(pending)} instance(s), attempt {attempt}")
+            to_verify = []
+            for task, candidates in zip(pending, self.sample_candidates(pending, 1)):
+                self.receive_candidates(task, candidates)
+                to_verify.extend((task, cluster) for cluster in task.candidates)
+                task.candidates = []
+            self.verify_candidates(to_verify, f"attempt {attempt}")
+
+    def generate_parallel(self, pending):
+        """
+        并行候选：一次 generate 为每个实例采样 num_candidates 个候选，
+        然后分波验证；某实例一旦有候选获得全部 Yes 票，其剩余候选不再验证。
+        全部候选被拒绝的实例不再重新采样（逐个模式最多尝试 max_attempts 轮），需要更多机会时增大 num_candidates。
+        """
+        # 从运行日志恢复的实例已经采样过，不再重复采样
+        to_sample = [task for task in pending if not task.done and not task.attempts]
+        if not to_sample:
+            return
+        print(f"Sampling {self.num_candidates} candidate patches for {len(to_sample)} instance(s)")
+        sampled = self.sample_candidates(to_sample, self.num_candidates)
+        for task, candidates in zip(to_sample, sampled):
+            self.receive_candidates(task, candidates)
+
+        wave = 0
+        pending = [task for task in to_sample if task.candidates]
+        while pending:
+            wave += 1
+            self.verify_candidates(self.next_wave(pending), f"wave {wave}")
+            pending = [task for task in pending if not task.done and task.candidates]
+
+    def sample_candidates(self, tasks, num_candidates):
+        """为每个实例采样 num_candidates 个候选（一次 generate 调用），返回 [[(patch, response), ...], ...]。"""
+        for task in tasks:
+            task.attempts += 1
+        with tracing.span(
+            "generate", instances=[task.instance_id for task in tasks], candidates=num_candidates,
+            attempts=[task.attempts for task in tasks],
+        ) as attributes:
+            sampled = self.patch_generator.sample_patches(
+                [(task.problem_statement, task.file_content_string) for task in tasks],
+                num_candidates=num_candidates,
+            )
+            attributes["extracted"] = sum(1 for candidates in sampled for patch, _ in candidates if patch)
+        for task, candidates in zip(tasks, sampled):
+            self.record(task, "candidates", {"attempt": task.attempts, "patches": [patch for patch, _ in candidates]})
+        self.flush_journal()
+        return sampled
+
+    def receive_candidates(self, task, candidates):
+        """记录采样得到的 [(patch, response), ...]，校验、聚类并按测试结果排序后存入 task.candidates。"""
+        for candidate_patch, patch_response in candidates:
+            print(f"[{task.instance_id}] Candidate Patch Response:\n", patch_response)
+            print(f"[{task.instance_id}] Candidate Patch:\n", candidate_patch)
+        task.candidates = self.rank_by_tests(task, self.cluster(task, [
+            patch for patch in (self.validate_candidate(task, patch) for patch, _ in candidates) if patch
+        ]))
+
+    def cluster(self, task, patches):
+        """规范化并聚类候选，去掉与已被拒绝的修复语义相同的簇；返回 CandidateCluster 列表（大簇在前）。"""
+        if not self.cluster_candidates:
+            return [CandidateCluster(("raw", patch), patch, size=1) for patch in patches]
+        with tracing.span("cluster", task.instance_id, candidates=len(patches)) as attributes:
+            clusters = [
+                cluster for cluster in CandidateClusterer(task.repo_index).cluster(patches)
+                if cluster.key not in task.rejected
+            ]
+            attributes["clusters"] = len(clusters)
+        if patches:
+            print(f"[{task.instance_id}] {len(patches)} candidate(s) -> {len(clusters)} distinct fix(es) to verify "
+                  f"(sizes {[cluster.size for cluster in clusters]})")
+        return clusters
+
+    def next_wave(self, pending):
+        """
+        从各实例剩余候选中取出下一波待验证的 (task, 候选) 列表：
+        流式验证时一次取出全部候选，否则每个实例取 wave_size 个。
+        """
+        if self.early_exit:
+            # 流式验证可在解码中途取消，所有候选一次提交
+            per_task = len(max((task.candidates for task in pending), key=len))
+        else:
+            per_task = max(1, self.wave_size)
+        to_verify = []
+        for task in pending:
+            to_verify.extend((task, patch) for patch in task.candidates[:per_task])
+            task.candidates = task.candidates[per_task:]
+        return to_verify
+
+    def validate_candidate(self, task, candidate_patch):
+        """CPU 侧校验：修复 hunk 头后返回补丁；无法应用或语法错误时返回 None。"""
+        if not candidate_patch or not self.validate_patches:
+            return candidate_patch
+        with tracing.span("validate", task.instance_id) as attributes:
+            fixed_patch, error = PatchValidator(task.repo_index).validate(candidate_patch)
+            attributes["valid"] = fixed_patch is not None
+            if fixed_patch is None:
+                attributes["reason"] = error
+                print(f"[{task.instance_id}] Candidate patch failed local validation: {error}")
+            return fixed_patch
+
+    def rank_by_tests(self, task, candidates):
+        """有测试信息时执行各簇代表的测试，按通过数排序，丢弃自身补丁无法应用的候选；实例无法排序时保持原顺序。"""
+        if self.test_verifier is None or len(candidates) < 2 or "repo" not in task.instance:
+            return candidates
+        by_patch = {cluster.patch: cluster for cluster in candidates}
+        results = self.test_verifier.rank(task, [cluster.patch for cluster in candidates])
+        if results is None:
+            return candidates
+        return [by_patch[result.patch] for result in results if result.error is None]
+
+    def verify_candidates(self, to_verify, label):
+        """验证 (task, CandidateCluster) 列表，接受的候选写入 task.patch。"""
+        with tracing.span(
+            "verify", instances=sorted({task.instance_id for task, _ in to_verify}), label=label,
+            candidates=len(to_verify), early_exit=self.early_exit,
+        ) as attributes:
+            attributes["accepted"], attributes["rejected"] = self.verify_and_record(to_verify, label)
+
+    def verify_and_record(self, to_verify, label):
+        """返回 (接受数, 拒绝数)；同一实例已接受后其余候选不计入。"""
+        requests = [
+            (task.problem_statement, task.file_content_string, cluster.patch)
+            for task, cluster in to_verify
+        ]
+        support = [min(cluster.size - 1, CLUSTER_VOTES) for _, cluster in to_verify]
+        accepted = rejected = 0
+        if self.early_exit:
+            verdicts = self.patch_verifier.verify_patches_early_exit(
+                requests, groups=[id(task) for task, _ in to_verify], support=support
+            )
+        else:
+            verdicts = self.patch_verifier.verify_patches(requests, support=support)
+        for (task, cluster), (verified_patch, verify_response) in zip(to_verify, verdicts):
+            if task.done:
                 continue
-            verified_patch, verify_response = self.patch_verifier.verify_patch(problem_statement, file_content_string, candidate_patch)
+            self.record(task, "verify", {
+                "key": cluster.key, "patch": cluster.patch, "accepted": verified_patch is not None,
+                "response": verify_response,
+            })
             if verified_patch is not None:
-                print(f"Candidate patch accepted on attempt {attempt + 1}")
-                return verified_patch
+                print(f"[{task.instance_id}] Candidate patch accepted on {label}")
+                task.patch = verified_patch
+                task.done = True
+                accepted += 1
             else:
-                print(f"Candidate patch rejected on attempt {attempt + 1}")
+                print(f"[{task.instance_id}] Candidate patch rejected on {label}")
+                task.rejected.add(cluster.key)
                 print("Verification Response:\n", verify_response)
-        return None
+                rejected += 1
+        self.flush_journal()
+        return accepted, rejected
+
+    # ---- 运行日志：记录各阶段结果，重启后恢复 ----
+
+    def record(self, task, stage, payload):
+        if self.journal is not None:
+            self.journal.append(task.instance_id, stage, payload)
+
+    def flush_journal(self):
+        """每次 LLM 调用的结果写入后立即提交，避免重跑昂贵的解码。"""
+        if self.journal is not None:
+            self.journal.flush()
+
+    def resume_instances(self, instances):
+        """返回 (需要处理的实例, {instance_id: 补丁})，后者为日志中已完成的实例。"""
+        if self.journal is None:
+            return instances, {}
+        completed = self.journal.completed()
+        remaining = [instance for instance in instances if instance["instance_id"] not in completed]
+        if len(remaining) < len(instances):
+            print(f"Resuming from journal: {len(instances) - len(remaining)} instance(s) already completed, "
+                  f"{len(remaining)} remaining")
+        return remaining, {
+            instance["instance_id"]: completed[instance["instance_id"]]
+            for instance in instances if instance["instance_id"] in completed
+        }
+
+    def restore(self, task):
+        """
+        按日志恢复未完成实例的状态：文件查询结果、文件内容哈希、尝试次数、
+        尚未验证的候选与已被拒绝的簇；已有候选被接受的实例直接完成。
+        """
+        if self.journal is None:
+            return
+        events = self.journal.load(task.instance_id)
+        if not events:
+            return
+        sampled = []
+        for stage, payload in events:
+            if stage == "query":
+                task.file_query = payload["file_query"] or None
+                task.done = not payload["file_query"]
+            elif stage == "fetch":
+                task.fetch_digest = payload["sha1"]
+            elif stage == "candidates":
+                task.attempts = max(task.attempts, payload["attempt"])
+                sampled = [(patch, "(restored from journal)") for patch in payload["patches"]]
+            elif stage == "verify":
+                if payload["accepted"]:
+                    task.patch = payload["patch"]
+                    task.done = True
+                else:
+                    task.rejected.add(freeze(payload["key"]))
+        # 最近一次采样的候选；已验证过的簇在聚类时按 task.rejected 去掉
+        task.sampled = [] if task.done else sampled
+        print(f"[{task.instance_id}] Restored from journal: {[stage for stage, _ in events]}")
+
+    def finish_task(self, task):
+        """实例正常结束（接受补丁或用尽尝试）时写入 done 记录并立即提交。"""
+        if self.journal is not None and not task.failed:
+            self.journal.append(task.instance_id, "done", {"patch": task.patch}, commit=True)
+
+    def predict_inner(self, problem_statement: str, directory: str) -> str:
+        task = PredictionTask(os.path.basename(directory), problem_statement, RepoIndex(directory))
+        self.run_tasks([task])
+        self.trace_instance(task)
+        return task.patch
+
+    @staticmethod
+    def open_task(instance_id, problem_statement, repo_archive_path, instance=None, blob_store=None):
+        """
+        为一次预测建立独立工作目录与虚拟仓库：tar 包只读取成员索引、按需读取文件，
+        提示词中的路径统一以 REPO_PATH 为前缀，多个预测可在同一进程中并存。
+        """
+        with tracing.span("extract", instance_id):
+            workspace = tempfile.mkdtemp(prefix="chainpatch-")
+            source = open_repo_source(repo_archive_path, workspace, blob_store)
+            return PredictionTask(instance_id, problem_statement, RepoIndex(REPO_PATH, source), workspace, instance)
+
+    def warm_environment(self, task):
+        """启用测试排序时，实例载入后即在后台构建其测试环境并准备副本池，与 LLM 阶段重叠。"""
+        if self.test_verifier is not None and not task.done and "repo" in task.instance:
+            task.warming = self.test_verifier.warm(task)
+
+    @staticmethod
+    def close_task(task):
+        if task.warming is not None:
+            # 预热仍在读取工作目录中的基础树
+            task.warming.result()
+        with tracing.span("cleanup", task.instance_id):
+            task.repo_index.source.close()
+            shutil.rmtree(task.workspace, ignore_errors=True)
+        Predictor.trace_instance(task)
+
+    @staticmethod
+    def trace_instance(task):
+        """实例从打开到清理完成的整体 span，汇总报告据此统计被接受的补丁数。"""
+        tracing.emit(
+            "instance", task.created, task.instance_id,
+            accepted=task.patch is not None, attempts=task.attempts,
+        )
 
     def predict(self, problem_statement: str, repo_archive_path: str) -> str:
         """
-        1. 将 repo_archive_path 解压到 REPO_PATH。
-        2. 调用 predict_inner 获取补丁。
-        3. 清理解压目录，返回生成的补丁字符串（或 None）。
+        1. 以 repo_archive_path 建立虚拟仓库（不整体解压）。
+        2. 执行查询、生成与验证流程获取补丁。
+        3. 清理工作目录，返回生成的补丁字符串（或 None）。
+        """
+        task = self.open_task(REPO_PATH, problem_statement, repo_archive_path, blob_store=self.blob_store)
+        try:
+            self.run_tasks([task])
+        finally:
+            self.close_task(task)
+        return task.patch
+
+    def predict_batch(self, instances, batch_size=16):
+        """
+        批量预测。instances 为字典列表，每项包含 instance_id、problem_statement、archive。
+        每 batch_size 个实例同时打开各自的虚拟仓库，共享每个阶段的 generate 调用。
+        返回 {instance_id: 补丁字符串或 None}。
         """
-        if os.path.exists(REPO_PATH):
-            shutil.rmtree(REPO_PATH)
-        shutil.unpack_archive(repo_archive_path, extract_dir=REPO_PATH)
-        patch_string = self.predict_inner(problem_statement, REPO_PATH)
-        shutil.rmtree(REPO_PATH)
-        return patch_string
+        all_instances = list(instances)
+        instances, completed = self.resume_instances(all_instances)
+        predictions = dict(completed)
+        for start in range(0, len(instances), batch_size):
+            tasks = []
+            try:
+                for instance in instances[start:start + batch_size]:
+                    tasks.append(self.open_task(
+                        instance["instance_id"], instance["problem_statement"], instance["archive"], instance,
+                        self.blob_store,
+                    ))
+                    self.restore(tasks[-1])
+                    self.warm_environment(tasks[-1])
+                self.run_tasks(tasks)
+                for task in tasks:
+                    self.finish_task(task)
+            finally:
+                for task in tasks:
+                    self.close_task(task)
+            for task in tasks:
+                predictions[task.instance_id] = task.patch
+        # 按输入顺序返回，恢复运行与全新运行写出的预测文件顺序相同
+        return {instance["instance_id"]: predictions.get(instance["instance_id"]) for instance in all_instances}
@@ -0,0 +1,157 @@
+# prompt_budget.py
+import re
+import threading
+from collections import OrderedDict
+
+from directory_renderer import split_identifiers
+
+FILE_SEPARATOR = "=" * 60
+OMITTED_NOTE = "  ... {n} match(es) omitted to fit the context window\n\n"
+TRUNCATED_NOTE = "\n\n[... {n} characters of the problem statement omitted ...]\n\n"
+
+
+class BlankFields(dict):
+    def __missing__(self, key):
+        return ""
+
+
+class PromptBudget:
+    """
+    各阶段共用的提示词预算：
+    - 按段（模板静态部分、问题描述、目录、文件内容、补丁）分别计数并缓存，不再对整条提示词重复编码；
+    - 提示词 token 数 = 聊天模板开销 + 各段之和 + 安全余量（分段计数与整体编码可能相差几个 token）；
+    - 放不下时依次裁剪：文件内容按与问题描述的相关度删去匹配片段、目录删去末尾行、问题描述截去中段；
+    - max_tokens 按窗口剩余空间逐条设置，保证每个请求都至少有 min_output_tokens 的输出空间。
+    """
+    def __init__(self, tokenizer, max_model_len, max_output_tokens, min_output_tokens=8192,
+                 max_problem_tokens=None, margin=64, max_cached=65536):
+        self.tokenizer = tokenizer
+        self.max_model_len = max_model_len
+        self.max_output_tokens = max_output_tokens
+        self.min_output_tokens = min_output_tokens
+        # 问题描述最多占窗口的四分之一；各阶段截断结果相同，前缀缓存不受影响
+        self.max_problem_tokens = max_problem_tokens or max_model_len // 4
+        self.margin = margin
+        self.max_cached = max_cached
+        self._counts = OrderedDict()
+        self._lock = threading.Lock()
+        self._overhead = None
+
+    def count(self, text):
+        """text 的 token 数（不含特殊 token），结果做 LRU 缓存。"""
+        with self._lock:
+            if text in self._counts:
+                self._counts.move_to_end(text)
+                return self._counts[text]
+        n = len(self.tokenizer.encode(text, add_special_tokens=False))
+        with self._lock:
+            self._counts[text] = n
+            if len(self._counts) > self.max_cached:
+                self._counts.popitem(last=False)
+        return n
+
+    @property
+    def overhead(self):
+        """聊天模板（角色标记、生成提示等）本身的 token 数。"""
+        if self._overhead is None:
+            empty = self.tokenizer.apply_chat_template(
+                conversation=[{"role": "user", "content": ""}], tokenize=False, add_generation_prompt=True
+            )
+            self._overhead = len(self.tokenizer.encode(empty, add_special_tokens=False))
+        return self._overhead
+
+    def prompt_tokens(self, *sections):
+        total = self.overhead + sum(self.count(section) for section in sections)
+        return total + self.margin + total // 100
+
+    @property
+    def input_limit(self):
+        """提示词最多可用的 token 数。"""
+        return self.max_model_len - self.min_output_tokens
+
+    def max_tokens(self, prompt_tokens):
+        return max(1, min(self.max_output_tokens, self.max_model_len - prompt_tokens))
+
+    @staticmethod
+    def static_part(template):
+        """模板去掉所有占位内容后的静态文本，用于计数。"""
+        return template.format_map(BlankFields())
+
+    def fit_problem(self, problem_statement):
+        """超过 max_problem_tokens 的问题描述保留开头与结尾，截去中段。"""
+        total = self.count(problem_statement)
+        if total <= self.max_problem_tokens:
+            return problem_statement
+        keep = int(len(problem_statement) * self.max_problem_tokens / total)
+        while True:
+            head = problem_statement[:keep * 2 // 3]
+            tail = problem_statement[len(problem_statement) - keep // 3:]
+            text = head + TRUNCATED_NOTE.format(n=len(problem_statement) - len(head) - len(tail)) + tail
+            if self.count(text) <= self.max_problem_tokens or keep == 0:
+                return text
+            keep = int(keep * 0.9)
+
+    def fit_lines(self, text, token_budget):
+        """逐行文本（目录列表）放不下时从末尾删行。"""
+        if self.count(text) <= token_budget:
+            return text
+        lines = text.split("\n")
+        keep = max(0, int(len(lines) * token_budget / self.count(text)))
+        while keep > 0 and self.count("\n".join(lines[:keep])) > token_budget:
+            keep = int(keep * 0.9)
+        return "\n".join(lines[:keep])
+
+    def fit_file_content(self, file_content_string, problem_statement, token_budget):
+        """
+        文件内容放不下时，按匹配片段与问题描述的标识符重叠度（靠前的文件略优先）
+        从低到高删去片段，被删去片段的文件注明省略数量；文件标题始终保留。
+        """
+        if self.count(file_content_string) <= token_budget:
+            return file_content_string
+        header, files = parse_file_content(file_content_string)
+        problem_words = split_identifiers(problem_statement)
+        blocks = []
+        for file_index, (_, matches) in enumerate(files):
+            for match_index, match in enumerate(matches):
+                overlap = len(split_identifiers(match) & problem_words)
+                blocks.append((overlap / (1 + 0.1 * file_index), file_index, match_index))
+        order = [(file_index, match_index) for _, file_index, match_index in sorted(blocks)]
+        removed = set()
+        fixed = self.count(header) + sum(self.count(file_header) for file_header, _ in files) + 16 * len(files)
+        used = fixed + sum(self.count(match) for _, matches in files for match in matches)
+        # 先按分段计数估算要删去的片段，再以拼接结果的实际计数为准继续删
+        while order and used > token_budget:
+            file_index, match_index = order.pop(0)
+            removed.add((file_index, match_index))
+            used -= self.count(files[file_index][1][match_index])
+        text = assemble(header, files, removed)
+        while order and self.count(text) > token_budget:
+            removed.add(order.pop(0))
+            text = assemble(header, files, removed)
+        return text
+
+
+def assemble(header, files, removed):
+    parts = [header]
+    for file_index, (file_header, matches) in enumerate(files):
+        parts.append(file_header)
+        kept = [match for match_index, match in enumerate(matches) if (file_index, match_index) not in removed]
+        parts.extend(kept)
+        if len(kept) < len(matches):
+            parts.append(OMITTED_NOTE.format(n=len(matches) - len(kept)))
+        parts.append(FILE_SEPARATOR + "\n\n")
+    return "".join(parts)
+
+
+def parse_file_content(file_content_string):
+    """
+    解析 Utils.fetch_file_contents 的输出：返回 (开头说明, [(文件标题, [匹配片段文本, ...]), ...])。
+    文件标题包括 FILE 行与分隔线（或 No matches found 行）。
+    """
+    sections = re.split(r"(?m)^(?=FILE: )", file_content_string)
+    header, files = sections[0], []
+    for section in sections[1:]:
+        body = section.rsplit(FILE_SEPARATOR, 1)[0]
+        pieces = re.split(r"(?m)^(?=Match #\d+, lines )", body)
+        files.append((pieces[0], pieces[1:]))
+    return header, files
@@ -0,0 +1,75 @@
+# prompts.py
+# 三个阶段共用的提示词前缀。
+# 顺序固定为：静态示例 -> 问题描述 -> 文件内容 -> 阶段相关的尾部，
+# 使得同一实例在 FileQuery / PatchGenerator / PatchVerifier 之间以及多次尝试之间
+# 共享尽可能长的相同前缀，命中 vLLM 的自动前缀缓存（prefix caching）。
+
+FEW_SHOT_PROMPT = """
+You will be solving an issue with a code repository in three steps: selecting the files to inspect, writing a git diff patch, and evaluating whether a patch fixes the problem.
+At every step, think carefully about the problem and determine which parts of the code are most likely causing the issue.
+Below is an example demonstrating the chain-of-thought process for each step:
+
+Example:
+Problem Statement: "When running pylint on a.py, a TypeError occurs due to an unsupported format string on a NoneType value. The error originates in astroid's _infer_from_values."
+
+Step 1, selecting the files to inspect.
+File Directory:
+<directory>
+repo/astroid/nodes/node_classes.py
+repo/astroid/transform.py
+repo/astroid/context.py
+repo/astroid/nodes/_base_nodes.py
+repo/astroid/nodes/scoped_nodes/scoped_nodes.py
+</directory>
+Chain of Thought:
+1. The error message indicates that a None value is being formatted, which is not allowed.
+2. The file "repo/astroid/nodes/node_classes.py" contains the function _infer_from_values where "format(value.value, format_spec.value)" is called.
+3. To pinpoint the problem, search for the strings "format_spec.value" and "value.value" in that file.
+Final Selection:
+<root>
+    <entry>
+        <filepath>repo/astroid/nodes/node_classes.py</filepath>
+        <strings_to_search>
+            <string_to_search>format_spec.value</string_to_search>
+            <string_to_search>value.value</string_to_search>
+        </strings_to_search>
+    </entry>
+</root>
+
+Step 2, writing the patch.
+Relevant file snippet from repo/astroid/nodes/node_classes.py might show:
+    formatted = format(value.value, format_spec.value)
+Chain of Thought:
+1. The error occurs because value.value is None.
+2. A possible fix is to check if value.value is None and substitute a default (e.g., 0) or skip formatting.
+3. Therefore, modify the code to use: formatted = format(value.value if value.value is not None else 0, format_spec.value)
+Final Patch Example:
+<patch>
+--- a/astroid/nodes/node_classes.py
++++ b/astroid/nodes/node_classes.py
+@@ -X,Y +X,Y @@
+-    formatted = format(value.value, format_spec.value)
++    formatted = format(value.value if value.value is not None else 0, format_spec.value)
+</patch>
+
+Step 3, evaluating the patch.
+Chain of Thought:
+1. The patch checks if value.value is None before formatting.
+2. This should prevent the TypeError.
+Observation: The patch appears to address the issue by substituting a default value.
+Expected final evaluation: <label>Yes</label>, this fixes the problem.
+
+Now, process the following:
+
+This is the problem statement.
+
+{problem_statement}
+""".strip()
+
+# PatchGenerator 与 PatchVerifier 共用的文件内容段，紧跟在问题描述之后
+FILE_CONTENT_PROMPT = """
+
+These are the files that are thought to be relevant, which may not be complete.
+
+{file_content_string}
+"""
@@ -0,0 +1,186 @@
+# repo_index.py
+import ast
+import os
+import re
+from bisect import bisect_right
+from collections import OrderedDict
+
+from virtual_repo import DirectorySource
+
+# 不进入的目录：版本控制、缓存、虚拟环境与第三方安装目录
+SKIP_DIRS = {
+    ".git", ".hg", ".svn", "__pycache__", "node_modules", ".tox", ".nox", ".venv", "venv",
+    ".eggs", ".mypy_cache", ".pytest_cache", ".ruff_cache", ".idea", ".vscode", "site-packages",
+}
+# 二进制及数据文件扩展名
+BINARY_EXTENSIONS = {
+    ".pyc", ".pyo", ".so", ".dll", ".dylib", ".exe", ".o", ".a", ".lib", ".class", ".jar", ".whl",
+    ".png", ".jpg", ".jpeg", ".gif", ".bmp", ".ico", ".tiff", ".webp", ".svg", ".pdf", ".psd",
+    ".zip", ".tar", ".gz", ".bz2", ".xz", ".7z", ".rar", ".tgz", ".zst",
+    ".mp3", ".mp4", ".wav", ".ogg", ".flac", ".avi", ".mov", ".webm",
+    ".ttf", ".otf", ".woff", ".woff2", ".eot",
+    ".npy", ".npz", ".pkl", ".pickle", ".h5", ".hdf5", ".parquet", ".arrow", ".db", ".sqlite",
+    ".pt", ".pth", ".ckpt", ".onnx", ".bin", ".safetensors", ".mo",
+}
+LANGUAGES = {
+    ".py": "python", ".pyi": "python", ".pyx": "cython", ".pxd": "cython",
+    ".c": "c", ".h": "c", ".cc": "cpp", ".cpp": "cpp", ".hpp": "cpp",
+    ".js": "javascript", ".ts": "typescript", ".java": "java", ".go": "go", ".rs": "rust",
+    ".sh": "shell", ".md": "markdown", ".rst": "rst", ".txt": "text",
+    ".toml": "toml", ".cfg": "ini", ".ini": "ini", ".yml": "yaml", ".yaml": "yaml", ".json": "json",
+    ".html": "html", ".css": "css", ".xml": "xml",
+}
+# 超过该大小的文件视为数据文件，不进入目录列表
+MAX_FILE_SIZE = 1024 * 1024
+
+
+class RepoIndex:
+    """
+    仓库索引，每个压缩包构建一次，在多次尝试和各阶段之间复用。
+    - root 为提示词中展示的路径前缀，source 为实际的文件来源（磁盘目录或 tar 包），
+      未指定 source 时 root 即磁盘目录；
+    - files：过滤后的 (路径, 字节数, 语言) 列表，路径形如 os.path.join(root, 相对路径)；
+    - 文件内容与行偏移按需读取并做 LRU 缓存；
+    - 多个搜索串合并为一个正则，一次扫描即可得到所有命中行。
+    """
+    def __init__(self, root, source=None, max_cached_files=256):
+        self.root = root
+        self.source = source if source is not None else DirectorySource(root)
+        self.max_cached_files = max_cached_files
+        self._files = None
+        self._tree = None
+        self._file_cache = OrderedDict()
+        self._search_cache = {}
+        self._span_cache = {}
+
+    @property
+    def files(self):
+        if self._files is None:
+            self._files = self._scan()
+        return self._files
+
+    def _scan(self):
+        files = []
+        skip_dir = lambda d: d in SKIP_DIRS or d.endswith(".egg-info")
+        for relpath, size in self.source.list_files(skip_dir=skip_dir):
+            ext = os.path.splitext(relpath)[1].lower()
+            if ext in BINARY_EXTENSIONS or size > MAX_FILE_SIZE:
+                continue
+            files.append((os.path.join(self.root, relpath), size, LANGUAGES.get(ext, "other")))
+        return files
+
+    def relpath(self, path):
+        """展示路径 -> 仓库内相对路径；不在仓库内时返回 None。"""
+        relpath = os.path.normpath(os.path.relpath(path, self.root))
+        if relpath.startswith(".."):
+            return None
+        return relpath
+
+    def is_file(self, path):
+        relpath = self.relpath(path)
+        return relpath is not None and self.source.is_file(relpath)
+
+    @property
+    def tree(self):
+        """{相对目录: (子目录列表, 文件完整路径列表, 子树文件总数)}，根目录为 ""。"""
+        if self._tree is None:
+            subdirs = {"": set()}
+            files = {"": []}
+            counts = {"": 0}
+            for path, _, _ in self.files:
+                parts = os.path.relpath(path, self.root).split(os.sep)
+                counts[""] += 1
+                for depth in range(1, len(parts)):
+                    parent = os.sep.join(parts[:depth - 1])
+                    directory = os.sep.join(parts[:depth])
+                    subdirs[parent].add(directory)
+                    subdirs.setdefault(directory, set())
+                    files.setdefault(directory, [])
+                    counts[directory] = counts.get(directory, 0) + 1
+                files[os.sep.join(parts[:-1])].append(path)
+            self._tree = {
+                directory: (sorted(subdirs[directory]), files[directory], counts[directory])
+                for directory in subdirs
+            }
+        return self._tree
+
+    def directory_string(self):
+        """返回过滤后所有文件的完整路径（每行一个）。"""
+        return "\n".join(path for path, _, _ in self.files)
+
+    def _load(self, path):
+        """读取文件，返回 (文本, 每行起始偏移)；结果做 LRU 缓存。"""
+        if path in self._file_cache:
+            self._file_cache.move_to_end(path)
+            return self._file_cache[path]
+        data = self.source.read_bytes(self.relpath(path))
+        # 与文本模式读取一致：统一换行符
+        text = data.decode("utf-8", errors="replace").replace("\r\n", "\n").replace("\r", "\n")
+        line_starts = [0] + [m.end() for m in re.finditer("\n", text)]
+        if line_starts[-1] == len(text) and len(line_starts) > 1:
+            line_starts.pop()
+        entry = (text, line_starts)
+        self._file_cache[path] = entry
+        if len(self._file_cache) > self.max_cached_files:
+            self._file_cache.popitem(last=False)
+        return entry
+
+    def read_lines(self, path):
+        """与 f.readlines() 相同的按行列表（保留换行符）。"""
+        text, line_starts = self._load(path)
+        if not text:
+            return []
+        ends = line_starts[1:] + [len(text)]
+        return [text[start:end] for start, end in zip(line_starts, ends)]
+
+    def search(self, path, terms):
+        """返回包含任一搜索串的行号（从 1 开始，升序）。"""
+        key = (path, tuple(terms))
+        if key in self._search_cache:
+            return self._search_cache[key]
+        text, line_starts = self._load(path)
+        terms = [t for t in terms if "\n" not in t]
+        if not terms or not text:
+            hits = []
+        elif "" in terms:
+            hits = list(range(1, len(line_starts) + 1))
+        else:
+            pattern = re.compile("|".join(re.escape(t) for t in sorted(set(terms), key=len, reverse=True)))
+            hits = []
+            pos = 0
+            while True:
+                match = pattern.search(text, pos)
+                if match is None:
+                    break
+                line_no = bisect_right(line_starts, match.start())
+                hits.append(line_no)
+                # 一行只需命中一次，直接跳到下一行
+                if line_no >= len(line_starts):
+                    break
+                pos = line_starts[line_no]
+        self._search_cache[key] = hits
+        return hits
+
+    def definition_spans(self, path):
+        """
+        Python 文件中函数与类定义的行范围 [(起始行, 结束行), ...]，起始行包含装饰器；
+        非 Python 文件或语法错误时返回 None。结果按文件缓存。
+        """
+        if path in self._span_cache:
+            return self._span_cache[path]
+        spans = None
+        if path.endswith((".py", ".pyi")):
+            text, _ = self._load(path)
+            try:
+                tree = ast.parse(text)
+            except (SyntaxError, ValueError):
+                tree = None
+            if tree is not None:
+                spans = []
+                for node in ast.walk(tree):
+                    if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                        start = min([node.lineno] + [d.lineno for d in node.decorator_list])
+                        spans.append((start, node.end_lineno))
+                spans.sort()
+        self._span_cache[path] = spans
+        return spans
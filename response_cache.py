@@ -0,0 +1,75 @@
+# response_cache.py
+import hashlib
+import json
+import sqlite3
+import time
+
+from llm_outputs import CompletionOutput, RequestOutput
+
+# 各阶段的缓存策略
+CACHE_USE = "use"          # 命中则直接返回，未命中则生成并写入
+CACHE_BYPASS = "bypass"    # 不读也不写
+CACHE_REFRESH = "refresh"  # 不读，重新生成后覆盖写入
+
+
+class ResponseCache:
+    """
+    基于 SQLite 的持久化 LLM 回复缓存（内容寻址）。
+    键为 (模型路径, 渲染后的提示词, SamplingParams, 种子, 出现序号) 的哈希；
+    出现序号区分同一进程中对同一提示词的第 n 次请求（如 4 次投票、多次尝试），
+    使重跑时能按相同顺序逐一回放。超过 max_bytes 时按最近访问时间做 LRU 淘汰。
+    """
+    def __init__(self, path, model_path, seed=None, max_bytes=2 * 1024 ** 3):
+        self.path = path
+        self.model_path = model_path
+        self.seed = seed
+        self.max_bytes = max_bytes
+        # 流水线模式下在专用的引擎线程中访问（同一时刻只有一个线程使用）
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, stage TEXT, outputs TEXT, size INTEGER, last_access REAL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses(last_access)")
+        self.conn.commit()
+
+    def make_key(self, prompt, sampling_params, occurrence=0):
+        payload = json.dumps(
+            [self.model_path, prompt, repr(sampling_params), self.seed, occurrence],
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key, prompt):
+        row = self.conn.execute("SELECT outputs FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        self.conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+        outputs = [CompletionOutput(text, finish_reason) for text, finish_reason in json.loads(row[0])]
+        return RequestOutput(key, prompt, outputs)
+
+    def put(self, key, stage, request_output):
+        outputs = json.dumps(
+            [[output.text, output.finish_reason] for output in request_output.outputs],
+            ensure_ascii=False,
+        )
+        self.conn.execute(
+            "INSERT OR REPLACE INTO responses (key, stage, outputs, size, last_access) VALUES (?, ?, ?, ?, ?)",
+            (key, stage, outputs, len(outputs.encode("utf-8")), time.time()),
+        )
+
+    def commit(self):
+        """提交本次调用的读写，总大小超过 max_bytes 时删除最久未访问的记录。"""
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            self.conn.commit()
+            return
+        rows = self.conn.execute("SELECT key, size FROM responses ORDER BY last_access").fetchall()
+        stale = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            stale.append((key,))
+            total -= size
+        self.conn.executemany("DELETE FROM responses WHERE key = ?", stale)
+        self.conn.commit()
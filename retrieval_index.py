@@ -0,0 +1,246 @@
+# retrieval_index.py
+import ast
+import hashlib
+import json
+import math
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+from directory_renderer import split_identifiers
+
+# 路径中的词比文件内的定义名更能说明文件职责
+PATH_WEIGHT = 3
+MAX_SYMBOLS = 500
+MAX_DOCSTRING_CHARS = 2000
+# 非 Python 文件的定义行：def / class / function / func / fn / struct / interface
+DEFINITION_PATTERN = re.compile(
+    r"^\s*(?:export\s+)?(?:async\s+)?(?:def|class|function|func|fn|struct|interface|type)\s+([A-Za-z_]\w*)",
+    re.MULTILINE,
+)
+
+
+def extract_document(relpath, data):
+    """文件的检索文档：返回 ({词: 词频}, [定义名])，词来自路径、函数/类名与文档字符串。"""
+    terms = Counter()
+    for word in split_identifiers(relpath):
+        terms[word] += PATH_WEIGHT
+    text = data.decode("utf-8", errors="replace")
+    symbols = []
+    tree = None
+    if relpath.endswith((".py", ".pyi")):
+        try:
+            tree = ast.parse(text)
+        except (SyntaxError, ValueError):
+            tree = None
+    if tree is not None:
+        docstrings = [ast.get_docstring(tree) or ""]
+        for node in ast.walk(tree):
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                symbols.append(node.name)
+                docstrings.append(ast.get_docstring(node) or "")
+        for docstring in docstrings:
+            terms.update(split_identifiers(docstring[:MAX_DOCSTRING_CHARS]))
+    else:
+        symbols = DEFINITION_PATTERN.findall(text)
+    for symbol in symbols:
+        terms.update(split_identifiers(symbol))
+    return terms, symbols[:MAX_SYMBOLS]
+
+
+class RepoSnapshot:
+    """某个 (仓库, 提交) 的文件清单与 BM25 统计：manifest 为 {相对路径: 内容哈希}，df 为 {词: 文档数}。"""
+    def __init__(self, index, manifest, df, total_length):
+        self.index = index
+        self.manifest = manifest
+        self.df = df
+        self.total_length = total_length
+
+    def search(self, problem_statement, top_k=10, k1=1.2, b=0.75):
+        """
+        按 BM25 对文件排序，返回 [(相对路径, 得分, 建议的搜索串列表), ...]。
+        搜索串优先取问题描述中出现的定义名，没有时取命中的词中 idf 最高的一个。
+        """
+        query = split_identifiers(problem_statement)
+        num_docs = len(self.manifest)
+        if not query or not num_docs:
+            return []
+        average = self.total_length / num_docs or 1.0
+        idf = {
+            term: math.log(1 + (num_docs - self.df[term] + 0.5) / (self.df[term] + 0.5))
+            for term in query if term in self.df
+        }
+        documents = self.index.documents(set(self.manifest.values()))
+        scored = []
+        for relpath, digest in self.manifest.items():
+            terms, length, _ = documents[digest]
+            score = 0.0
+            for term, weight in idf.items():
+                tf = terms.get(term)
+                if tf:
+                    score += weight * tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / average))
+            if score > 0:
+                scored.append((score, relpath))
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        results = []
+        for score, relpath in scored[:top_k]:
+            terms, _, symbols = documents[self.manifest[relpath]]
+            strings = [
+                symbol for symbol in dict.fromkeys(symbols)
+                if symbol in problem_statement or symbol.lower() in query
+            ][:3]
+            if not strings:
+                matched = [term for term in idf if term in terms]
+                strings = [max(matched, key=idf.get)] if matched else []
+            results.append((relpath, round(score, 3), strings))
+        return results
+
+
+class RetrievalIndex:
+    """
+    持久化的文件级 BM25 检索索引（SQLite）：
+    - documents 表按文件内容哈希存储检索文档，不同提交、不同实例之间内容相同的文件只解析一次；
+    - snapshots 表按 (仓库, 提交) 存储文件清单与词的文档频率；
+    - 同一仓库的新提交以最近使用的快照为基础，按清单差异增减文档频率，只解析新增或改动的文件。
+    """
+    def __init__(self, path, max_cached_documents=200000):
+        self.path = path
+        self.max_cached_documents = max_cached_documents
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS documents (hash TEXT PRIMARY KEY, terms TEXT, length INTEGER, symbols TEXT)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS snapshots ("
+            "repo TEXT, revision TEXT, manifest TEXT, df TEXT, total_length INTEGER, last_access REAL, "
+            "PRIMARY KEY (repo, revision))"
+        )
+        self.conn.commit()
+        # 流水线模式下多个 CPU 线程同时建索引
+        self._lock = threading.RLock()
+        self._documents = {}
+
+    def documents(self, digests):
+        """{哈希: (词频字典, 文档长度, 定义名列表)}，从内存缓存或数据库读取。"""
+        with self._lock:
+            missing = [digest for digest in digests if digest not in self._documents]
+            for start in range(0, len(missing), 500):
+                chunk = missing[start:start + 500]
+                rows = self.conn.execute(
+                    f"SELECT hash, terms, length, symbols FROM documents WHERE hash IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+                for digest, terms, length, symbols in rows:
+                    self._documents[digest] = (json.loads(terms), length, json.loads(symbols))
+            if len(self._documents) > self.max_cached_documents:
+                keep = set(digests)
+                self._documents = {digest: doc for digest, doc in self._documents.items() if digest in keep}
+            return {digest: self._documents[digest] for digest in digests if digest in self._documents}
+
+    def snapshot(self, repo_index, repo=None, revision=None):
+        """
+        返回仓库当前文件的 RepoSnapshot。提供 repo 与 revision 时持久化并复用；
+        否则只复用按内容哈希存储的文档，不保存快照。
+        """
+        if repo is not None and revision is not None:
+            with self._lock:
+                row = self.conn.execute(
+                    "SELECT manifest, df, total_length FROM snapshots WHERE repo = ? AND revision = ?",
+                    (repo, revision),
+                ).fetchone()
+                if row is not None:
+                    self.conn.execute(
+                        "UPDATE snapshots SET last_access = ? WHERE repo = ? AND revision = ?",
+                        (time.time(), repo, revision),
+                    )
+                    self.conn.commit()
+                    return RepoSnapshot(self, json.loads(row[0]), json.loads(row[1]), row[2])
+        start = time.time()
+        manifest, parsed = self.scan(repo_index)
+        base = self.latest(repo) if repo is not None else None
+        if base is None:
+            df, total_length = self.statistics(manifest)
+            changed = len(manifest)
+        else:
+            df, total_length, changed = self.apply_diff(base, manifest)
+        snapshot = RepoSnapshot(self, manifest, df, total_length)
+        if repo is not None and revision is not None:
+            with self._lock:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO snapshots (repo, revision, manifest, df, total_length, last_access) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (repo, revision, json.dumps(manifest), json.dumps(df), total_length, time.time()),
+                )
+                self.conn.commit()
+        print(f"Retrieval index for {repo or repo_index.root}@{revision or '-'}: {len(manifest)} files, "
+              f"{parsed} parsed, {changed} changed vs {'base snapshot' if base else 'empty'} "
+              f"in {time.time() - start:.2f}s")
+        return snapshot
+
+    def scan(self, repo_index):
+        """读取所有文件计算内容哈希，解析数据库中还没有的文档；返回 (清单, 新解析的文件数)。"""
+        manifest = {}
+        for path, _, _ in repo_index.files:
+            relpath = repo_index.relpath(path)
+            manifest[relpath] = hashlib.sha1(repo_index.source.read_bytes(relpath)).hexdigest()
+        known = self.documents(set(manifest.values()))
+        new_documents = {}
+        for relpath, digest in manifest.items():
+            if digest in known or digest in new_documents:
+                continue
+            terms, symbols = extract_document(relpath, repo_index.source.read_bytes(relpath))
+            new_documents[digest] = (dict(terms), sum(terms.values()), symbols)
+        if new_documents:
+            with self._lock:
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO documents (hash, terms, length, symbols) VALUES (?, ?, ?, ?)",
+                    [
+                        (digest, json.dumps(terms), length, json.dumps(symbols))
+                        for digest, (terms, length, symbols) in new_documents.items()
+                    ],
+                )
+                self.conn.commit()
+                self._documents.update(new_documents)
+        return manifest, len(new_documents)
+
+    def latest(self, repo):
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT manifest, df, total_length FROM snapshots WHERE repo = ? ORDER BY last_access DESC LIMIT 1",
+                (repo,),
+            ).fetchone()
+        if row is None:
+            return None
+        return RepoSnapshot(self, json.loads(row[0]), json.loads(row[1]), row[2])
+
+    def statistics(self, manifest):
+        documents = self.documents(set(manifest.values()))
+        df = Counter()
+        total_length = 0
+        for digest in manifest.values():
+            terms, length, _ = documents[digest]
+            df.update(terms.keys())
+            total_length += length
+        return dict(df), total_length
+
+    def apply_diff(self, base, manifest):
+        """在基础快照的统计上减去删除/改动的文件、加上新增/改动的文件，返回 (df, 总长度, 变化文件数)。"""
+        removed = [digest for relpath, digest in base.manifest.items() if manifest.get(relpath) != digest]
+        added = [digest for relpath, digest in manifest.items() if base.manifest.get(relpath) != digest]
+        documents = self.documents(set(removed) | set(added))
+        df = Counter(base.df)
+        total_length = base.total_length
+        for digest in removed:
+            terms, length, _ = documents[digest]
+            df.subtract(terms.keys())
+            total_length -= length
+        for digest in added:
+            terms, length, _ = documents[digest]
+            df.update(terms.keys())
+            total_length += length
+        return {term: count for term, count in df.items() if count > 0}, total_length, len(added) + len(removed)
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,82 @@
+# run_journal.py
+import json
+import sqlite3
+import threading
+import time
+
+
+def freeze(value):
+    """JSON 读回的列表还原为元组（簇的语义键需要可哈希）。"""
+    if isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+class RunJournal:
+    """
+    批量运行的追加写入日志（SQLite，WAL 模式），每条记录为 (实例, 阶段, JSON 内容)：
+    - query：文件查询结果；fetch：文件内容的哈希；candidates：一次采样得到的候选补丁；
+      verify：一个候选簇代表的验证结果（接受/拒绝、语义键与回复）；done：实例的最终补丁。
+    - 记录先写入未提交的事务，每 commit_every 条或 commit_interval 秒提交一次（一次 fsync）；
+      每次 LLM 调用之后与实例完成时立即提交，崩溃或被抢占时最多丢失尚未提交的 CPU 阶段结果。
+    - 重启后 completed() 给出已完成实例的补丁，load(instance_id) 给出未完成实例已有的各阶段记录。
+    """
+    def __init__(self, path, commit_every=64, commit_interval=5.0):
+        self.path = path
+        self.commit_every = commit_every
+        self.commit_interval = commit_interval
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # WAL 模式下 FULL 在每次提交时 fsync，提交已按批合并
+        self.conn.execute("PRAGMA synchronous=FULL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS events ("
+            "seq INTEGER PRIMARY KEY AUTOINCREMENT, instance_id TEXT, stage TEXT, payload TEXT, created REAL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS events_instance ON events(instance_id, seq)")
+        self.conn.commit()
+        # 流水线模式下 CPU 线程与引擎线程都会写入
+        self._lock = threading.Lock()
+        self._uncommitted = 0
+        self._last_commit = time.time()
+
+    def append(self, instance_id, stage, payload, commit=False):
+        with self._lock:
+            self.conn.execute(
+                "INSERT INTO events (instance_id, stage, payload, created) VALUES (?, ?, ?, ?)",
+                (instance_id, stage, json.dumps(payload, ensure_ascii=False), time.time()),
+            )
+            self._uncommitted += 1
+            if (commit or self._uncommitted >= self.commit_every
+                    or time.time() - self._last_commit >= self.commit_interval):
+                self.commit()
+
+    def flush(self):
+        with self._lock:
+            if self._uncommitted:
+                self.commit()
+
+    def commit(self):
+        self.conn.commit()
+        self._uncommitted = 0
+        self._last_commit = time.time()
+
+    def completed(self):
+        """{instance_id: 最终补丁或 None}，只包含已写入 done 记录的实例。"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT instance_id, payload FROM events WHERE stage = 'done' ORDER BY seq"
+            ).fetchall()
+        return {instance_id: json.loads(payload)["patch"] for instance_id, payload in rows}
+
+    def load(self, instance_id):
+        """该实例按写入顺序的 [(阶段, 内容), ...]。"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT stage, payload FROM events WHERE instance_id = ? ORDER BY seq", (instance_id,)
+            ).fetchall()
+        return [(stage, json.loads(payload)) for stage, payload in rows]
+
+    def close(self):
+        self.flush()
+        self.conn.close()
@@ -0,0 +1,74 @@
+# snippet_extractor.py
+import math
+
+
+class SnippetExtractor:
+    """
+    结构化片段提取：
+    - Python 文件中，每个命中行扩展为包含它的最内层函数或类（过长时退回固定窗口）；
+    - 其他文件或无法解析时，沿用命中行上下 context_lines 行的窗口；
+    - 片段按命中的搜索串打分（命中行越多的常见搜索串权重越低），去重后按分数填充单文件 token 预算。
+    """
+    def __init__(self, count_tokens=None, context_lines=10, max_span_lines=150, file_token_budget=4000):
+        self.count_tokens = count_tokens or (lambda text: len(text) // 4)
+        self.context_lines = context_lines
+        self.max_span_lines = max_span_lines
+        self.file_token_budget = file_token_budget
+
+    def enclosing_span(self, spans, line_no):
+        """包含 line_no 且不超过 max_span_lines 的最内层定义范围。"""
+        best = None
+        for start, end in spans:
+            if start > line_no:
+                break
+            if end >= line_no and end - start + 1 <= self.max_span_lines:
+                if best is None or end - start < best[1] - best[0]:
+                    best = (start, end)
+        return best
+
+    def extract(self, repo_index, path, terms, token_budget=None):
+        """返回按行号排序的片段列表，每个片段为 [(行号, 文本), ...]。"""
+        lines = repo_index.read_lines(path)
+        num_lines = len(lines)
+        spans = repo_index.definition_spans(path) or []
+        token_budget = token_budget if token_budget is not None else self.file_token_budget
+
+        # 每个搜索串的权重：命中行越多越常见，权重越低
+        weights = {}
+        for term in set(terms):
+            hits = repo_index.search(path, [term])
+            if hits:
+                weights[term] = (1.0 + len(term) / 20.0) / math.log(2 + len(hits))
+
+        candidates = {}
+        for term, weight in weights.items():
+            for line_no in repo_index.search(path, [term]):
+                span = self.enclosing_span(spans, line_no) if spans else None
+                if span is None:
+                    span = (max(1, line_no - self.context_lines), min(num_lines, line_no + self.context_lines))
+                terms_hit = candidates.setdefault(span, {})
+                terms_hit[term] = terms_hit.get(term, 0) + 1
+
+        def score(span):
+            terms_hit = candidates[span]
+            return sum(weights[t] * (1 + math.log(n)) for t, n in terms_hit.items())
+
+        selected = {}
+        for span in sorted(candidates, key=lambda s: (-score(s), s[1] - s[0], s[0])):
+            # 已被选中片段完整覆盖的不再重复
+            if any(start <= span[0] and span[1] <= end for start, end in selected):
+                continue
+            snippet = [(no, lines[no - 1].rstrip("\n")) for no in range(span[0], span[1] + 1)]
+            tokens = self.count_tokens("\n".join(f"  {no:3d} | {text}" for no, text in snippet))
+            inner = [s for s in selected if span[0] <= s[0] and s[1] <= span[1]]
+            used = sum(t for s, t in selected.items() if s not in inner)
+            # 至少保留得分最高的一个片段
+            if selected and used + tokens > token_budget:
+                continue
+            for s in inner:
+                del selected[s]
+            selected[span] = tokens
+        return [
+            [(no, lines[no - 1].rstrip("\n")) for no in range(start, end + 1)]
+            for start, end in sorted(selected)
+        ]
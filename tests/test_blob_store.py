@@ -0,0 +1,48 @@
+# tests/test_blob_store.py
+import io
+import os
+import tarfile
+
+import pytest
+
+from blob_store import BlobStore
+
+
+def make_tar(path, files):
+    with tarfile.open(path, "w") as tar:
+        for name, data in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    return str(path)
+
+
+def test_archives_share_identical_files(tmp_path):
+    store = BlobStore(str(tmp_path / "store"))
+    first = make_tar(tmp_path / "r1.tar", {"a.py": b"A = 1\n", "b.py": b"B = 1\n"})
+    second = make_tar(tmp_path / "r2.tar", {"a.py": b"A = 1\n", "b.py": b"B = 2\n"})
+    store.open(first).close()
+    source = store.open(second)
+    assert store.conn.execute("SELECT COUNT(*) FROM blobs").fetchone()[0] == 3
+    assert source.read_bytes("b.py") == b"B = 2\n"
+    source.materialize(["a.py"], str(tmp_path / "work"))
+    with open(tmp_path / "work" / "a.py", "ab") as f:
+        f.write(b"# edited\n")
+    # 物化的文件与存储相互独立
+    assert source.read_bytes("a.py") == b"A = 1\n"
+    source.close()
+
+
+def test_quota_evicts_unused_manifests(tmp_path):
+    store = BlobStore(str(tmp_path / "store"), quota_bytes=15)
+    old = store.open(make_tar(tmp_path / "r1.tar", {"a.py": b"x" * 10}))
+    old.close()
+    store.open(make_tar(tmp_path / "r2.tar", {"a.py": b"y" * 10})).close()
+    assert store.disk_usage() == 10
+    assert not os.path.exists(store.blob_path(next(iter(old.files.values()))[0]))
+
+
+def test_non_tar_input_raises_read_error(tmp_path):
+    (tmp_path / "not.tar").write_bytes(b"plain text")
+    with pytest.raises(tarfile.ReadError):
+        BlobStore(str(tmp_path / "store")).open(str(tmp_path / "not.tar"))
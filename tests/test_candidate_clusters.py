@@ -0,0 +1,50 @@
+# tests/test_candidate_clusters.py
+import subprocess
+
+from candidate_clusters import CandidateClusterer
+from repo_index import RepoIndex
+
+SOURCE = "def f(x):\n    return x + 1\n\n\ndef g():\n    pass\n"
+
+
+def make_clusterer(tmp_path):
+    (tmp_path / "repo").mkdir()
+    (tmp_path / "repo" / "m.py").write_text(SOURCE)
+    return CandidateClusterer(RepoIndex(str(tmp_path / "repo")))
+
+
+def patch(old, new, header="@@ -1,2 +1,2 @@"):
+    return f"--- a/m.py\n+++ b/m.py\n{header}\n def f(x):\n-{old}\n+{new}\n"
+
+
+def test_formatting_variants_share_a_cluster(tmp_path):
+    clusterer = make_clusterer(tmp_path)
+    clusters = clusterer.cluster([
+        patch("    return x + 1", "    return x + 2"),
+        # 占位的 hunk 头、多余空格与行尾注释不改变语义
+        patch("    return x + 1", "    return x  +  2  # fixed", header="@@ -X,Y +X,Y @@"),
+        patch("    return x + 1", "    return x - 1"),
+        patch("    return x + 1", "    return x + 2"),
+    ])
+    assert [cluster.size for cluster in clusters] == [3, 1]
+    assert "+    return x + 2\n" in clusters[0].patch
+    # 规范化补丁使用标准的 3 行上下文
+    assert clusters[0].patch.startswith("--- a/m.py\n+++ b/m.py\n@@ -1,5 +1,5 @@\n")
+
+
+def test_unappliable_patches_get_raw_clusters_and_no_ops_are_dropped(tmp_path):
+    clusterer = make_clusterer(tmp_path)
+    bad = patch("    return y", "    return y + 2")
+    clusters = clusterer.cluster([bad, patch("    return x + 1", "    return x + 1"), bad])
+    assert [(cluster.key, cluster.size) for cluster in clusters] == [(("raw", bad), 2)]
+
+
+def test_canonical_patch_applies_with_git(tmp_path):
+    clusterer = make_clusterer(tmp_path)
+    [cluster] = clusterer.cluster([patch("    return x + 1", "    return x * 2", header="@@ -7,9 +7,9 @@")])
+    (tmp_path / "fix.patch").write_text(cluster.patch)
+    result = subprocess.run(
+        ["git", "apply", "--check", str(tmp_path / "fix.patch")], cwd=tmp_path / "repo",
+        capture_output=True, text=True,
+    )
+    assert result.returncode == 0, result.stderr
@@ -0,0 +1,28 @@
+# tests/test_directory_renderer.py
+import os
+
+from file_query import FileQuery
+from llm_backends import FakeBackend
+from llm_provider import LLMProvider
+from repo_index import RepoIndex
+
+
+def test_render_reuses_cached_path_counts(tmp_path):
+    for i in range(30):
+        path = tmp_path / "repo" / f"pkg{i % 3}" / f"mod{i}.py"
+        os.makedirs(path.parent, exist_ok=True)
+        path.write_text("")
+    backend = FakeBackend()
+    encoded = []
+    encode = backend.tokenizer.encode
+    backend.tokenizer.encode = lambda text, **kwargs: encoded.append(text) or encode(text, **kwargs)
+    file_query = FileQuery(LLMProvider(backend))
+    repo_index = RepoIndex(str(tmp_path / "repo"))
+
+    first = file_query.directory_renderer.render(repo_index, "bug in mod3", 10 ** 6)
+    assert len(first.splitlines()) == 30
+    encoded.clear()
+    second = file_query.directory_renderer.render(repo_index, "bug in mod4", 10 ** 6)
+    assert second.splitlines() == first.splitlines()
+    # 路径逐行计数命中缓存，只剩整体文本的一次编码
+    assert encoded == [second]
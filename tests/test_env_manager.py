@@ -0,0 +1,94 @@
+# tests/test_env_manager.py
+import json
+import os
+
+import pytest
+
+import env_manager
+from env_manager import EnvBuildError, EnvManager
+
+
+@pytest.fixture
+def install_map(monkeypatch):
+    # constants 的映射按需从 swebench 导入，直接写入模块字典
+    specs = {}
+    monkeypatch.setitem(vars(env_manager.constants), "MAP_VERSION_TO_INSTALL", specs)
+    return specs
+
+
+def make_source(tmp_path):
+    source = tmp_path / "source"
+    source.mkdir()
+    (source / "setup.py").write_text("")
+    return str(source)
+
+
+def test_failed_install_step_is_not_cached(tmp_path, install_map):
+    install_map["o/r"] = {"1.0": {"pre_install": ["true"], "install": "exit 3"}}
+    manager = EnvManager(env_dir=str(tmp_path / "envs"))
+    key = manager.env_key("o/r", "1.0")
+    with pytest.raises(EnvBuildError, match="exit code 3"):
+        manager.build(key, "o/r", "1.0", make_source(tmp_path))
+    assert not os.path.exists(manager.build_dir(key))
+
+
+def test_failing_pre_install_is_best_effort(tmp_path, install_map):
+    # 离线机器上 apt 等系统包安装会失败，环境仍然可用
+    install_map["o/r"] = {"1.0": {"pre_install": ["exit 100"], "install": "true"}}
+    manager = EnvManager(env_dir=str(tmp_path / "envs"), pool_size=2)
+    source = make_source(tmp_path)
+    manager.warm("o/r", "1.0", "", source)
+    # 预热后池中已有 pool_size 份就绪副本，acquire 直接取用
+    ready = sorted(os.listdir(manager.pool_dir(manager.env_key("o/r", "1.0"))))
+    assert len(ready) == 2
+    env_path = manager.acquire("o/r", "1.0", "", source)
+    assert os.path.basename(env_path) in ready
+    result = env_manager.run_command(
+        f"{os.path.join(env_path, 'bin', 'python')} -c 'import sys; print(sys.prefix)'",
+        str(tmp_path), env_manager.venv_env(env_path), 60,
+    )
+    assert result.returncode == 0
+    manager.release(env_path)
+
+
+def test_successful_build_records_size(tmp_path, install_map):
+    install_map["o/r"] = {"1.0": {"pre_install": ["true"]}}
+    manager = EnvManager(env_dir=str(tmp_path / "envs"))
+    key = manager.env_key("o/r", "1.0")
+    build_dir = manager.build(key, "o/r", "1.0", make_source(tmp_path))
+    with open(os.path.join(build_dir, "meta.json")) as f:
+        meta = json.load(f)
+    assert meta["size"] == env_manager.disk_usage(build_dir) - os.path.getsize(os.path.join(build_dir, "meta.json"))
+
+
+def write_build(manager, key, size, last_used, with_size=True):
+    os.makedirs(manager.build_dir(key))
+    meta = {"repo": "o/r", "version": "1.0", "last_used": last_used}
+    if with_size:
+        meta["size"] = size
+    with open(os.path.join(manager.build_dir(key), "meta.json"), "w") as f:
+        json.dump(meta, f)
+
+
+def test_evict_uses_recorded_sizes(tmp_path, monkeypatch):
+    manager = EnvManager(env_dir=str(tmp_path / "envs"), quota_bytes=250)
+    write_build(manager, "old", 100, 1)
+    write_build(manager, "busy", 100, 2)
+    write_build(manager, "new", 100, 3)
+    manager._in_use["pool/busy/0"] = "busy"
+
+    def walk_forbidden(path):
+        raise AssertionError(f"walked {path}")
+    monkeypatch.setattr(env_manager, "disk_usage", walk_forbidden)
+    manager.evict()
+    assert sorted(os.listdir(os.path.join(manager.env_dir, "builds"))) == ["busy", "new"]
+
+
+def test_builds_backfills_missing_size_once(tmp_path):
+    manager = EnvManager(env_dir=str(tmp_path / "envs"))
+    write_build(manager, "legacy", 0, 1, with_size=False)
+    (tmp_path / "envs" / "builds" / "legacy" / "blob").write_bytes(b"x" * 1000)
+    [(_, key, size)] = manager.builds()
+    assert key == "legacy" and size >= 1000
+    with open(os.path.join(manager.build_dir("legacy"), "meta.json")) as f:
+        assert json.load(f)["size"] == size
@@ -0,0 +1,112 @@
+# tests/test_execution_verifier.py
+import os
+import tarfile
+
+import execution_verifier
+from candidate_clusters import CandidateCluster
+from execution_verifier import TestResult, TestVerifier
+from llm_backends import FakeBackend
+from llm_provider import LLMProvider
+from predictor import PredictionTask, Predictor
+from repo_index import RepoIndex
+
+GOOD_PATCH = "--- a/m.py\n+++ b/m.py\n@@ -1,1 +1,1 @@\n-A = 1\n+A = 2\n"
+OTHER_PATCH = "--- a/m.py\n+++ b/m.py\n@@ -1,1 +1,1 @@\n-A = 1\n+A = 3\n"
+BAD_PATCH = "--- a/m.py\n+++ b/m.py\n@@ -1,1 +1,1 @@\n-B = 1\n+B = 2\n"
+
+
+class RecordingVerifier(TestVerifier):
+    """不真正运行测试：记录调用，按补丁给出固定结果。"""
+    def __init__(self, scores=None):
+        super().__init__(env_manager=object())
+        self.scores = scores or {}
+        self.ran = []
+
+    def run_candidate(self, task, base, test_contents, test_files, index, patch):
+        self.ran.append((patch, sorted(test_contents), test_files))
+        if patch == BAD_PATCH:
+            return TestResult(patch, error="does not apply")
+        return TestResult(patch, *self.scores.get(patch, (0, 0)))
+
+
+def make_task(tmp_path, **instance):
+    (tmp_path / "repo").mkdir()
+    (tmp_path / "repo" / "m.py").write_text("A = 1\n")
+    (tmp_path / "repo" / "test_m.py").write_text("def test_a():\n    pass\n")
+    instance = dict({"repo": "o/r", "version": "1.0", "FAIL_TO_PASS": '["test_m.py::test_a"]'}, **instance)
+    return PredictionTask("i0", "bug", RepoIndex(str(tmp_path / "repo")), str(tmp_path / "work"), instance)
+
+
+def test_rank_skips_instance_without_selected_tests(tmp_path):
+    verifier = RecordingVerifier()
+    task = make_task(tmp_path, FAIL_TO_PASS="[]", PASS_TO_PASS=None)
+    assert verifier.rank(task, [GOOD_PATCH, OTHER_PATCH]) is None
+    assert verifier.ran == []
+
+
+def test_rank_skips_instance_when_test_patch_does_not_apply(tmp_path):
+    verifier = RecordingVerifier()
+    task = make_task(tmp_path, test_patch="--- a/test_m.py\n+++ b/test_m.py\n@@ -1 +1 @@\n-missing\n+x\n")
+    assert verifier.rank(task, [GOOD_PATCH, OTHER_PATCH]) is None
+    assert verifier.ran == []
+
+
+def test_rank_applies_test_patch_once_and_drops_only_bad_candidates(tmp_path):
+    verifier = RecordingVerifier({OTHER_PATCH: (1, 0)})
+    test_patch = "--- a/test_m.py\n+++ b/test_m.py\n@@ -1,2 +1,2 @@\n def test_a():\n-    pass\n+    assert True\n"
+    task = make_task(tmp_path, test_patch=test_patch)
+    predictor = Predictor(llm_provider=LLMProvider(FakeBackend()), test_verifier=verifier)
+    clusters = [CandidateCluster(("raw", patch), patch, 1) for patch in (GOOD_PATCH, BAD_PATCH, OTHER_PATCH)]
+    ranked = predictor.rank_by_tests(task, clusters)
+    assert [cluster.patch for cluster in ranked] == [OTHER_PATCH, GOOD_PATCH]
+    assert all(contents == ["test_m.py"] and files == ["test_m.py"] for _, contents, files in verifier.ran)
+
+
+def test_rank_by_tests_keeps_candidates_when_instance_cannot_be_ranked(tmp_path):
+    task = make_task(tmp_path, FAIL_TO_PASS="[]")
+    predictor = Predictor(llm_provider=LLMProvider(FakeBackend()), test_verifier=RecordingVerifier())
+    clusters = [CandidateCluster(("raw", patch), patch, 1) for patch in (GOOD_PATCH, OTHER_PATCH)]
+    assert predictor.rank_by_tests(task, clusters) == clusters
+
+
+def test_parse_test_log_uses_installed_swebench_signature(monkeypatch):
+    calls = []
+    # constants 的映射按需从 swebench 导入，直接写入模块字典
+    monkeypatch.setitem(vars(execution_verifier.constants), "MAP_REPO_TO_PARSER", {
+        "o/r": lambda log, *test_spec: calls.append(test_spec) or {},
+    })
+    for installed, expected in (("2.0.13", ()), ("2.1.0", (None,)), ("4.0.3", (None,))):
+        execution_verifier.parser_takes_test_spec.cache_clear()
+        monkeypatch.setattr(execution_verifier.metadata, "version", lambda name, installed=installed: installed)
+        execution_verifier.parse_test_log("o/r", "")
+        assert calls.pop() == expected
+    execution_verifier.parser_takes_test_spec.cache_clear()
+
+
+class RecordingEnvManager:
+    """只记录预热请求，不构建环境。"""
+    def __init__(self):
+        self.warmed = []
+
+    env_key = staticmethod(lambda repo, version, commit="": f"{repo}@{version}@{commit}")
+
+    def warm(self, repo, version, environment_setup_commit, source_dir):
+        self.warmed.append((repo, version, sorted(os.listdir(source_dir))))
+
+
+def test_predict_batch_warms_each_environment_once(tmp_path):
+    (tmp_path / "src").mkdir()
+    (tmp_path / "src" / "m.py").write_text("def f():\n    return 1\n")
+    archive = str(tmp_path / "repo.tar")
+    with tarfile.open(archive, "w") as tar:
+        tar.add(str(tmp_path / "src" / "m.py"), arcname="m.py")
+    instances = [
+        {"instance_id": f"i{i}", "problem_statement": "bug in def f", "archive": archive,
+         "repo": "o/r", "version": version}
+        for i, version in enumerate(["1.0", "1.0", "2.0"])
+    ]
+    env_manager = RecordingEnvManager()
+    verifier = TestVerifier(env_manager=env_manager)
+    predictor = Predictor(llm_provider=LLMProvider(FakeBackend()), test_verifier=verifier)
+    predictor.predict_batch(instances, batch_size=3)
+    assert sorted(env_manager.warmed) == [("o/r", "1.0", ["m.py"]), ("o/r", "2.0", ["m.py"])]
@@ -0,0 +1,18 @@
+# tests/test_file_query.py
+import os
+
+from file_query import FileQuery
+from repo_index import RepoIndex
+
+
+def test_extract_expand_dirs_strips_only_whole_root_prefix(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for relpath in ("repo/repository/a.py", "repo/pkg/sub/b.py"):
+        os.makedirs(os.path.dirname(relpath), exist_ok=True)
+        open(relpath, "w").close()
+    response = (
+        "<expand><dir>repository/ (1 files)</dir><dir>repo/pkg/sub/</dir>"
+        "<dir>repo/repository</dir><dir>other/x</dir></expand>"
+    )
+    dirs = FileQuery.extract_expand_dirs(response, RepoIndex("repo"))
+    assert dirs == ["repository", os.path.join("pkg", "sub")]
@@ -0,0 +1,82 @@
+# tests/test_fine_tune_data.py
+import pytest
+
+from fine_tune_data import flatten_batch, length_summary, pad_batch, tokenize_batch
+
+BOS, EOS = 1, 2
+
+
+class CharTokenizer:
+    """每个字符一个 token。"""
+    bos_token_id = BOS
+    eos_token_id = EOS
+
+    def __call__(self, texts, add_special_tokens=False):
+        return {"input_ids": [[ord(c) for c in text] for text in texts]}
+
+
+def decode(ids):
+    return "".join(chr(i) for i in ids if i not in (BOS, EOS, -100))
+
+
+def test_prompt_is_masked_and_patch_is_labelled():
+    result = tokenize_batch({"problem_statement": ["bug"], "patch": ["diff"]}, CharTokenizer(), 1000)
+    input_ids, labels = result["input_ids"][0], result["labels"][0]
+    prompt_len = len("Problem: bug Patch: ")
+    assert input_ids[0] == BOS and input_ids[-1] == EOS
+    assert decode(input_ids) == "Problem: bug Patch: diff"
+    assert labels[:1 + prompt_len] == [-100] * (1 + prompt_len)
+    assert labels[1 + prompt_len:] == [ord(c) for c in "diff"] + [EOS]
+    assert len(labels) == len(input_ids) == result["length"][0]
+    assert result["target_length"][0] == len("diff") + 1
+
+
+def test_long_prompt_keeps_head_and_tail():
+    problem = "H" * 300 + "M" * 2000 + "T" * 300
+    result = tokenize_batch({"problem_statement": [problem], "patch": ["p" * 50]}, CharTokenizer(), 1000)
+    input_ids = result["input_ids"][0]
+    assert len(input_ids) == 1000
+    text = decode(input_ids)
+    assert text.startswith("Problem: HHH")
+    assert text.endswith("TTT Patch: " + "p" * 50)
+    # 补丁保持完整
+    assert result["target_length"][0] == 51
+
+
+def test_patch_too_long_is_dropped():
+    batch = {"problem_statement": ["x" * 500, "short"], "patch": ["p" * 900, "ok"]}
+    result = tokenize_batch(batch, CharTokenizer(), 1000)
+    assert result["length"] == [0, len("Problem: short Patch: ok") + 2]
+    assert result["input_ids"][0] == [] and result["labels"][0] == []
+    assert result["target_length"][0] == 0
+
+
+def test_pad_batch_aligns_labels_and_mask():
+    batch = [
+        {"input_ids": [5, 6, 7], "labels": [-100, 6, 7]},
+        {"input_ids": [5] * 10, "labels": [-100] * 5 + [5] * 5},
+    ]
+    padded = pad_batch(batch, pad_id=0)
+    assert all(len(row) == 16 for key in padded for row in padded[key])
+    assert padded["input_ids"][0] == [5, 6, 7] + [0] * 13
+    assert padded["labels"][0] == [-100, 6, 7] + [-100] * 13
+    assert padded["attention_mask"][0] == [1] * 3 + [0] * 13
+    assert padded["attention_mask"][1] == [1] * 10 + [0] * 6
+    assert padded["labels"][1][:10] == batch[1]["labels"]
+
+
+def test_flatten_batch_resets_positions_and_masks_boundaries():
+    batch = [
+        {"input_ids": [5, 6, 7], "labels": [-100, 6, 7]},
+        {"input_ids": [8, 9], "labels": [8, 9]},
+    ]
+    flat = flatten_batch(batch)
+    assert flat["input_ids"] == [[5, 6, 7, 8, 9]]
+    assert flat["labels"] == [[-100, 6, 7, -100, 9]]
+    assert flat["position_ids"] == [[0, 1, 2, 0, 1]]
+
+
+def test_length_summary_rejects_empty_dataset():
+    with pytest.raises(ValueError, match="All 3 examples were dropped"):
+        length_summary(3, [], [], 1000)
+    assert "mean length 15" in length_summary(3, [10, 20], [5, 5], 1000)
@@ -0,0 +1,39 @@
+# tests/test_generation_policy.py
+from generation_policy import FORCE_CONCLUSION
+from llm_backends import FakeBackend
+from llm_provider import LLMProvider
+
+STAGE = "patch_verifier"
+
+
+def generate(responder, **budgets):
+    provider = LLMProvider(FakeBackend(responder=responder), thinking_budgets=budgets or None)
+    outputs = provider.policy.generate(["<|user|>check<|assistant|>"], [10], STAGE)
+    return outputs[0].outputs[0], provider.policy.stats[STAGE]
+
+
+def test_stop_sequence_ends_the_answer():
+    completion, stats = generate(lambda prompt: "<think>\nfine\n</think>\n<label>Yes</label> trailing text")
+    assert completion.text.endswith("<label>Yes</label>")
+    assert stats["completions"] == 1 and stats["continued"] == 0
+
+
+def test_thinking_over_budget_is_forced_to_conclude():
+    def responder(prompt):
+        if prompt.endswith(FORCE_CONCLUSION):
+            return "<label>No</label>"
+        return "<think>\n" + "still thinking " * 200
+    completion, stats = generate(responder, patch_verifier=32)
+    assert FORCE_CONCLUSION in completion.text
+    assert completion.text.endswith("<label>No</label>")
+    assert stats["forced"] == 1 and stats["completed"] == 1
+
+
+def test_label_drafted_in_thinking_is_resumed():
+    def responder(prompt):
+        if prompt.endswith("<label>Yes</label>"):
+            return " wait, no\n</think>\n<label>No</label>"
+        return "<think>\ndraft <label>Yes</label>"
+    completion, stats = generate(responder)
+    assert completion.text == "<think>\ndraft <label>Yes</label> wait, no\n</think>\n<label>No</label>"
+    assert stats["continued"] == 1 and stats["forced"] == 0
@@ -0,0 +1,54 @@
+# tests/test_llm_backends.py
+import socket
+import threading
+import time
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from llm_backends import GenerationParams, OpenAIBackend
+from openai_stub_server import make_handler
+
+
+@pytest.fixture
+def stub_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(0.0, 0.0))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def dead_url():
+    # 绑定后立即关闭，得到一个无人监听的端口
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    return f"http://127.0.0.1:{port}"
+
+
+def test_n_returns_n_outputs_per_request(stub_url):
+    backend = OpenAIBackend([stub_url], "stub", max_concurrency=4, backoff=0.01)
+    try:
+        outputs = backend.generate(["<|user|>hello", "<|user|>world"], GenerationParams(n=3, max_tokens=64))
+    finally:
+        backend.close()
+    assert len(outputs) == 2
+    assert all(len(output.outputs) == 3 for output in outputs)
+    assert [output.prompt for output in outputs] == ["<|user|>hello", "<|user|>world"]
+
+
+def test_dead_endpoint_is_cooled_down_without_failing_batch(stub_url):
+    backend = OpenAIBackend([stub_url, dead_url()], "stub", max_concurrency=4, cooldown=60.0, backoff=0.01)
+    live, dead = backend.replicas
+    start = time.time()
+    try:
+        outputs = backend.generate([f"<|user|>prompt {i}" for i in range(8)], GenerationParams(max_tokens=64))
+    finally:
+        backend.close()
+    assert len(outputs) == 8
+    assert all(len(output.outputs) == 1 for output in outputs)
+    assert dead.unhealthy_until > time.time()
+    assert live.unhealthy_until == 0.0
+    assert time.time() - start < 5
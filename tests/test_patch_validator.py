@@ -0,0 +1,82 @@
+# tests/test_patch_validator.py
+import os
+
+from patch_validator import PatchValidator, parse_patch
+from repo_index import RepoIndex
+
+X_PY = "def f():\n    return 1\n\n\ndef g():\n    return 2\n"
+Y_PY = "A = 1\nB = 2\n"
+
+TWO_FILE_GIT_DIFF = """diff --git a/pkg/x.py b/pkg/x.py
+index 3b18e51..a1c2d3e 100644
+--- a/pkg/x.py
++++ b/pkg/x.py
+@@ -1,2 +1,2 @@
+ def f():
+-    return 1
++    return 10
+diff --git a/pkg/y.py b/pkg/y.py
+index 1234567..89abcde 100644
+--- a/pkg/y.py
++++ b/pkg/y.py
+@@ -1,2 +1,3 @@
+ A = 1
+ B = 2
++C = 3
+"""
+
+
+def make_repo(tmp_path):
+    os.makedirs(tmp_path / "repo" / "pkg")
+    (tmp_path / "repo" / "pkg" / "x.py").write_text(X_PY)
+    (tmp_path / "repo" / "pkg" / "y.py").write_text(Y_PY)
+    return RepoIndex(str(tmp_path / "repo"))
+
+
+def test_parse_two_file_git_diff_skips_extended_headers():
+    file_patches = parse_patch(TWO_FILE_GIT_DIFF)
+    assert [fp.new_path for fp in file_patches] == ["b/pkg/x.py", "b/pkg/y.py"]
+    assert file_patches[0].hunks[0].lines == [(" ", "def f():"), ("-", "    return 1"), ("+", "    return 10")]
+    assert file_patches[1].hunks[0].new_lines == ["A = 1", "B = 2", "C = 3"]
+
+
+def test_apply_two_file_git_diff(tmp_path):
+    validator = PatchValidator(make_repo(tmp_path))
+    fixed_patch, error = validator.validate(TWO_FILE_GIT_DIFF)
+    assert error is None
+    _, contents = validator.apply(fixed_patch)
+    assert contents[os.path.join("pkg", "x.py")] == X_PY.replace("return 1", "return 10")
+    assert contents[os.path.join("pkg", "y.py")] == Y_PY + "C = 3\n"
+
+
+def test_hunk_counts_bound_the_hunk():
+    # 行数吻合时，hunk 之后的普通文本不作为上下文
+    patch = "--- a/pkg/y.py\n+++ b/pkg/y.py\n@@ -1,1 +1,1 @@\n-A = 1\n+A = 5\ntrailing note\n"
+    hunk = parse_patch(patch)[0].hunks[0]
+    assert hunk.lines == [("-", "A = 1"), ("+", "A = 5")]
+
+
+def test_placeholder_hunk_header_is_parsed_leniently(tmp_path):
+    # 模型常写出占位的行号，按宽松规则解析并重写 hunk 头
+    patch = "--- a/pkg/x.py\n+++ b/pkg/x.py\n@@ -X,Y +X,Y @@\n def g():\n-    return 2\n+    return 20\n"
+    fixed_patch, error = PatchValidator(make_repo(tmp_path)).validate(patch)
+    assert error is None
+    assert "@@ -5,2 +5,2 @@" in fixed_patch
+
+
+def test_undercounted_hunk_header_keeps_following_lines():
+    # 行数少写时不截断 hunk
+    patch = "--- a/pkg/y.py\n+++ b/pkg/y.py\n@@ -1,1 +1,1 @@\n-A = 1\n+A = 5\n+A2 = 6\n"
+    hunk = parse_patch(patch)[0].hunks[0]
+    assert hunk.new_lines == ["A = 5", "A2 = 6"]
+
+
+def test_apply_git_diff_with_new_file(tmp_path):
+    patch = (
+        "diff --git a/pkg/z.py b/pkg/z.py\nnew file mode 100644\nindex 0000000..e69de29\n"
+        "--- /dev/null\n+++ b/pkg/z.py\n@@ -0,0 +1,1 @@\n+Z = 1\n"
+        + TWO_FILE_GIT_DIFF
+    )
+    _, contents = PatchValidator(make_repo(tmp_path)).apply(patch)
+    assert contents[os.path.join("pkg", "z.py")] == "Z = 1\n"
+    assert len(contents) == 3
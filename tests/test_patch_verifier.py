@@ -0,0 +1,39 @@
+# tests/test_patch_verifier.py
+from llm_backends import FakeBackend
+from llm_provider import LLMProvider
+from patch_verifier import PatchVerifier
+
+REQUEST = ("problem", "contents", "--- a/m.py\n+++ b/m.py\n@@ -1 +1 @@\n-A = 1\n+A = 2\n")
+YES = "<think>\nlooks right\n</think>\n<label>Yes</label>"
+# 思考过程中起草了 Yes，最终回答为 No
+DRAFTED_YES = "<think>\nmaybe <label>Yes</label> but the edge case fails\n</think>\n<label>No</label>"
+
+
+def drafted_yes_responder(prompt):
+    # 第一轮在思考中的 </label> 处停止，续写时给出剩余部分
+    if prompt.endswith("<label>Yes</label>"):
+        return DRAFTED_YES.split("<label>Yes</label>", 1)[1]
+    return DRAFTED_YES
+
+
+def make_verifier(responder):
+    return PatchVerifier(LLMProvider(FakeBackend(responder=responder)))
+
+
+def test_count_votes_ignores_labels_inside_thinking():
+    assert PatchVerifier.count_votes("p", [YES, YES, YES, DRAFTED_YES]) == (None, DRAFTED_YES)
+    assert PatchVerifier.count_votes("p", [YES, YES, YES, DRAFTED_YES], support=1) == ("p", YES)
+
+
+def test_batch_and_early_exit_agree_on_drafted_yes():
+    batch = make_verifier(drafted_yes_responder).verify_patches([REQUEST])
+    streamed = make_verifier(drafted_yes_responder).verify_patches_early_exit([REQUEST])
+    assert batch[0][0] is None
+    assert streamed[0][0] is None
+
+
+def test_early_exit_returns_a_recorded_yes_vote():
+    verdicts = make_verifier(lambda prompt: YES).verify_patches_early_exit([REQUEST], support=[1])
+    patch, response = verdicts[0]
+    assert patch == REQUEST[2]
+    assert PatchVerifier.parse_vote(response) == "Yes"
@@ -0,0 +1,35 @@
+# tests/test_pipeline_bench.py
+import importlib.util
+import os
+
+spec = importlib.util.spec_from_file_location(
+    "pipeline_bench", os.path.join(os.path.dirname(os.path.dirname(__file__)), "bench", "pipeline_bench.py")
+)
+pipeline_bench = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(pipeline_bench)
+
+PARAMS = {"sample": 16, "repeat": 5, "max_regression": 0.2, "noise_floor_ms": 2.0}
+
+
+def results(ms, stringify_ms, fetch_ms, params=PARAMS):
+    return {
+        "params": dict(params),
+        "pipeline": {"seconds_per_instance": ms / 1000, "peak_mb": 10.0},
+        "hot_paths": {"100/dir": {"stringify_ms": stringify_ms, "fetch_ms": fetch_ms}},
+    }
+
+
+def test_comparison_requires_same_params_and_enough_repeats():
+    assert pipeline_bench.comparison_errors(PARAMS, {"params": dict(PARAMS, max_regression=0.5)}) == []
+    errors = pipeline_bench.comparison_errors(dict(PARAMS, sample=8), {"params": PARAMS})
+    assert errors == ["parameters differ from the baseline: sample=16 -> 8"]
+    errors = pipeline_bench.comparison_errors(dict(PARAMS, repeat=1), {"params": dict(PARAMS, repeat=1)})
+    assert errors == ["--repeat must be at least 3 in both runs to compare"]
+    assert pipeline_bench.comparison_errors(PARAMS, {}) == ["baseline has no recorded parameters"]
+
+
+def test_slowdown_below_noise_floor_is_not_a_regression():
+    baseline = results(ms=8.0, stringify_ms=1.0, fetch_ms=20.0)
+    # 1.0 -> 1.8 ms 比值 1.8 倍但低于噪声下限；20 -> 30 ms 是回归
+    current = results(ms=9.0, stringify_ms=1.8, fetch_ms=30.0)
+    assert pipeline_bench.compare(current, baseline, 0.2, 2.0) == ["100/dir.fetch_ms"]
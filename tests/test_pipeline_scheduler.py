@@ -0,0 +1,52 @@
+# tests/test_pipeline_scheduler.py
+import tarfile
+import threading
+
+from llm_backends import FakeBackend
+from llm_provider import LLMProvider
+from pipeline_scheduler import PipelineScheduler
+from predictor import Predictor
+
+
+def make_instances(tmp_path, count):
+    instances = []
+    for i in range(count):
+        source = tmp_path / f"src{i}"
+        source.mkdir()
+        (source / f"mod_{i}.py").write_text(f"def f{i}():\n    return {i}\n")
+        archive = str(tmp_path / f"repo{i}.tar")
+        with tarfile.open(archive, "w") as tar:
+            tar.add(str(source / f"mod_{i}.py"), arcname=f"mod_{i}.py")
+        instances.append({"instance_id": f"i{i}", "problem_statement": f"bug in def f{i}", "archive": archive})
+    return instances
+
+
+def record_batches(predictor, method, sizes):
+    original = getattr(predictor, method)
+
+    def wrapper(tasks, *args, **kwargs):
+        sizes.append(len(tasks))
+        return original(tasks, *args, **kwargs)
+    setattr(predictor, method, wrapper)
+
+
+def test_llm_stages_batch_instances_and_keep_input_order(tmp_path):
+    instances = make_instances(tmp_path, 6)
+    # 每次 generate 调用有延迟，期间上游的实例在队列中积压，下一次调用合并提交
+    predictor = Predictor(llm_provider=LLMProvider(FakeBackend(latency=0.2)))
+    batches = {"localize": [], "sample_candidates": [], "verify_candidates": []}
+    for method, sizes in batches.items():
+        record_batches(predictor, method, sizes)
+    scheduler = PipelineScheduler(predictor, queue_size=16, max_batch=8)
+    # 结果按输入顺序返回，每个实例的补丁改动的是它自己仓库中的文件
+    predictions = scheduler.run(instances)
+
+    assert list(predictions) == [instance["instance_id"] for instance in instances]
+    for i in range(6):
+        assert f"mod_{i}.py" in predictions[f"i{i}"]
+    for method, sizes in batches.items():
+        assert sum(sizes) >= 6, method
+        assert max(sizes) > 1 and len(sizes) < 6, (method, sizes)
+    # 线程池随运行结束关闭
+    assert not [t for t in threading.enumerate() if t.name.startswith("pipeline-")]
+    assert scheduler.cpu_executor is None and scheduler.llm_executor is None
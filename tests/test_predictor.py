@@ -0,0 +1,29 @@
+# tests/test_predictor.py
+from llm_backends import FakeBackend
+from llm_provider import LLMProvider
+from predictor import PredictionTask, Predictor
+
+
+def make_predictor(**kwargs):
+    return Predictor(llm_provider=LLMProvider(FakeBackend()), **kwargs)
+
+
+def make_tasks(count, candidates):
+    tasks = [PredictionTask(f"i{i}", "bug", None) for i in range(count)]
+    for task in tasks:
+        task.candidates = [f"{task.instance_id}-c{j}" for j in range(candidates)]
+    return tasks
+
+
+def test_next_wave_takes_wave_size_candidates_per_instance():
+    tasks = make_tasks(2, 5)
+    wave = make_predictor(wave_size=2).next_wave(tasks)
+    assert [candidate for _, candidate in wave] == ["i0-c0", "i0-c1", "i1-c0", "i1-c1"]
+    assert [len(task.candidates) for task in tasks] == [3, 3]
+    assert len(make_predictor().next_wave(tasks)) == 2
+
+
+def test_next_wave_with_early_exit_takes_all_candidates():
+    tasks = make_tasks(2, 3)
+    assert len(make_predictor(early_exit=True).next_wave(tasks)) == 6
+    assert all(not task.candidates for task in tasks)
@@ -0,0 +1,66 @@
+# tests/test_prompt_budget.py
+from file_query import FileQuery
+from llm_backends import FakeBackend, SimpleTokenizer
+from llm_provider import LLMProvider
+from patch_generator import PatchGenerator
+from prompt_budget import FILE_SEPARATOR, PromptBudget
+
+
+def small_budget(tokenizer=None):
+    # SimpleTokenizer 约 4 个字符一个 token
+    return PromptBudget(tokenizer or SimpleTokenizer(), 4096, 2048, min_output_tokens=1024,
+                        max_problem_tokens=512)
+
+
+def file_content(num_files, num_matches):
+    parts = ["Sample files created successfully.\n\n"]
+    for i in range(num_files):
+        parts.append(f"FILE: pkg/module_{i}.py\n" + "-" * 60 + "\n")
+        for j in range(num_matches):
+            body = "".join(f"  {k:3d} | value_{i}_{j} = compute_{k}(argument)\n" for k in range(20))
+            parts.append(f"Match #{j + 1}, lines 1 to 20:\n{body}\n")
+        parts.append(FILE_SEPARATOR + "\n\n")
+    return "".join(parts)
+
+
+def test_fit_problem_under_budget_is_unchanged():
+    budget = small_budget()
+    problem = "Short problem statement.\n" * 20
+    assert budget.fit_problem(problem) is problem
+
+
+def test_fit_problem_keeps_head_and_tail():
+    budget = small_budget()
+    problem = "HEAD " + "middle words " * 2000 + " TAIL"
+    fitted = budget.fit_problem(problem)
+    assert budget.count(fitted) <= budget.max_problem_tokens
+    assert fitted.startswith("HEAD ") and fitted.endswith(" TAIL")
+    assert "characters of the problem statement omitted" in fitted
+
+
+def test_fit_lines_drops_trailing_lines():
+    budget = small_budget()
+    text = "\n".join(f"repo/pkg/file_{i}.py" for i in range(1000))
+    assert budget.fit_lines(text, 100000) is text
+    fitted = budget.fit_lines(text, 300)
+    assert budget.count(fitted) <= 300
+    assert text.startswith(fitted) and fitted.endswith(".py")
+    assert budget.fit_lines(text, 0) == ""
+
+
+def test_static_part_blanks_placeholders():
+    assert PromptBudget.static_part("Problem: {problem_statement}\nFiles: {file_content_string}!") == \
+        "Problem: \nFiles: !"
+
+
+def test_trimmed_prompts_stay_within_input_limit():
+    provider = LLMProvider(FakeBackend())
+    provider.budget = budget = small_budget(provider.tokenizer)
+    problem = "The parser crashes on nested brackets. " * 800
+    patch_prompt, patch_tokens = PatchGenerator(provider).fit_prompt(problem, file_content(10, 20))
+    directory = "\n".join(f"repo/pkg/sub_{i}/file_{i}.py" for i in range(5000))
+    query_prompt, query_tokens = FileQuery(provider).fit_prompt(directory, problem)
+    for prompt, estimated in ((patch_prompt, patch_tokens), (query_prompt, query_tokens)):
+        actual = len(provider.tokenizer.encode(prompt, add_special_tokens=False))
+        assert actual <= estimated <= budget.input_limit
+    assert "match(es) omitted to fit the context window" in patch_prompt
@@ -0,0 +1,31 @@
+# tests/test_response_cache.py
+from llm_outputs import CompletionOutput, RequestOutput
+from response_cache import ResponseCache
+
+
+def output(text):
+    return RequestOutput("r", "prompt", [CompletionOutput(text, "stop")])
+
+
+def test_round_trip_and_occurrences(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.db"), "model", seed=1)
+    first, second = cache.make_key("prompt", "params", 0), cache.make_key("prompt", "params", 1)
+    assert first != second
+    cache.put(first, "patch_verifier", output("<label>Yes</label>"))
+    cache.commit()
+
+    reopened = ResponseCache(str(tmp_path / "cache.db"), "model", seed=1)
+    assert [o.text for o in reopened.get(first, "prompt").outputs] == ["<label>Yes</label>"]
+    assert reopened.get(second, "prompt") is None
+    # 模型或种子不同时键不同
+    assert ResponseCache(str(tmp_path / "other.db"), "model", seed=2).make_key("prompt", "params") != first
+
+
+def test_commit_evicts_least_recently_used(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.db"), "model", max_bytes=40)
+    keys = [cache.make_key(f"prompt {i}", "params") for i in range(3)]
+    for key in keys:
+        cache.put(key, "file_query", output("x" * 10))
+        cache.commit()
+    assert cache.get(keys[0], "prompt 0") is None
+    assert cache.get(keys[2], "prompt 2") is not None
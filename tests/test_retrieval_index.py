@@ -0,0 +1,40 @@
+# tests/test_retrieval_index.py
+from repo_index import RepoIndex
+from retrieval_index import RetrievalIndex
+
+FILES = {
+    "pkg/parser.py": 'def parse_header(text):\n    """Parse an HTTP header line."""\n',
+    "pkg/render.py": "class Renderer:\n    def render_page(self):\n        pass\n",
+    "pkg/util.py": "def clamp(value):\n    return value\n",
+}
+
+
+def write_repo(root, files):
+    for relpath, text in files.items():
+        path = root / relpath
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(text)
+    return RepoIndex(str(root))
+
+
+def test_incremental_snapshot_matches_full_statistics(tmp_path):
+    index = RetrievalIndex(str(tmp_path / "index.db"))
+    index.snapshot(write_repo(tmp_path / "v1", FILES), repo="o/r", revision="v1")
+    changed = dict(FILES)
+    del changed["pkg/util.py"]
+    changed["pkg/render.py"] = "class Renderer:\n    def render_template(self):\n        pass\n"
+    changed["pkg/cache.py"] = "def evict_entries():\n    pass\n"
+    incremental = index.snapshot(write_repo(tmp_path / "v2", changed), repo="o/r", revision="v2")
+
+    df, total_length = index.statistics(incremental.manifest)
+    assert incremental.df == df
+    assert incremental.total_length == total_length
+    assert "clamp" not in incremental.df and incremental.df["evict"] == 1
+
+
+def test_search_ranks_matching_file_first(tmp_path):
+    index = RetrievalIndex(str(tmp_path / "index.db"))
+    snapshot = index.snapshot(write_repo(tmp_path / "repo", FILES))
+    results = snapshot.search("parse_header fails on HTTP header lines")
+    assert results[0][0] == "pkg/parser.py"
+    assert results[0][2] == ["parse_header"]
@@ -0,0 +1,105 @@
+# tests/test_run_journal.py
+import sqlite3
+import tarfile
+
+import pytest
+
+from llm_backends import FakeBackend, canned_response
+from llm_provider import LLMProvider
+from pipeline_scheduler import PipelineScheduler
+from predictor import PredictionTask, Predictor
+from run_journal import RunJournal, freeze
+
+
+def test_journal_round_trip(tmp_path):
+    journal = RunJournal(str(tmp_path / "journal.db"), commit_every=2)
+    journal.append("i0", "query", {"file_query": {"a.py": ["def "]}})
+    journal.append("i0", "verify", {"key": [["a.py", "abc"]], "accepted": False})
+    journal.append("i1", "done", {"patch": "p1"}, commit=True)
+    journal.close()
+
+    journal = RunJournal(str(tmp_path / "journal.db"))
+    assert journal.completed() == {"i1": "p1"}
+    (_, query), (_, verify) = journal.load("i0")
+    assert query == {"file_query": {"a.py": ["def "]}}
+    assert freeze(verify["key"]) == (("a.py", "abc"),)
+    journal.close()
+
+
+def test_restore_half_finished_task(tmp_path):
+    journal = RunJournal(str(tmp_path / "journal.db"))
+    for stage, payload in [
+        ("query", {"file_query": {"a.py": ["def "]}}),
+        ("fetch", {"sha1": "0" * 40, "chars": 10}),
+        ("candidates", {"attempt": 1, "patches": ["p1", "p2"]}),
+        ("verify", {"key": ["raw", "p1"], "patch": "p1", "accepted": False, "response": "No"}),
+    ]:
+        journal.append("i0", stage, payload)
+    predictor = Predictor(llm_provider=LLMProvider(FakeBackend()), journal=journal)
+    task = PredictionTask("i0", "bug", None)
+    predictor.restore(task)
+    assert task.file_query == {"a.py": ["def "]}
+    assert task.fetch_digest == "0" * 40
+    assert task.attempts == 1
+    assert [patch for patch, _ in task.sampled] == ["p1", "p2"]
+    assert task.rejected == {("raw", "p1")}
+    assert not task.done
+
+
+class CountingResponder:
+    def __init__(self):
+        self.stages = []
+
+    def __call__(self, prompt):
+        body = prompt.split("Now, process the following:")[-1]
+        if "Which files should be inspected" in body:
+            self.stages.append("query")
+        elif "Write a git diff" in body:
+            self.stages.append("generate")
+        return canned_response(prompt)
+
+
+@pytest.fixture
+def instances(tmp_path):
+    source = tmp_path / "src"
+    source.mkdir()
+    (source / "a.py").write_text("def f():\n    return 1\n")
+    archive = str(tmp_path / "repo.tar")
+    with tarfile.open(archive, "w") as tar:
+        tar.add(str(source / "a.py"), arcname="a.py")
+    return [
+        {"instance_id": f"i{i}", "problem_statement": "bug in def f", "archive": archive} for i in range(4)
+    ]
+
+
+def run(journal_path, instances, pipeline):
+    responder = CountingResponder()
+    journal = RunJournal(journal_path)
+    predictor = Predictor(llm_provider=LLMProvider(FakeBackend(responder=responder)), journal=journal)
+    if pipeline:
+        predictions = PipelineScheduler(predictor, max_batch=2).run(instances)
+    else:
+        predictions = predictor.predict_batch(instances, batch_size=2)
+    journal.close()
+    return predictions, responder.stages
+
+
+@pytest.mark.parametrize("pipeline", [False, True])
+def test_resumed_run_skips_finished_work_and_keeps_order(tmp_path, instances, pipeline):
+    journal_path = str(tmp_path / "journal.db")
+    first, stages = run(journal_path, instances, pipeline)
+    assert list(first) == ["i0", "i1", "i2", "i3"] and all(first.values())
+    assert stages.count("query") == 4
+
+    # 模拟中断：i1 的验证与完成记录丢失，i2 只剩查询结果
+    conn = sqlite3.connect(journal_path)
+    conn.execute("DELETE FROM events WHERE instance_id = 'i1' AND stage IN ('verify', 'done')")
+    conn.execute("DELETE FROM events WHERE instance_id = 'i2' AND stage != 'query'")
+    conn.commit()
+    conn.close()
+
+    second, stages = run(journal_path, instances, pipeline)
+    assert second == first
+    assert list(second) == ["i0", "i1", "i2", "i3"]
+    # 只有 i2 重新生成候选；所有实例的查询结果都来自日志
+    assert stages == ["generate"]
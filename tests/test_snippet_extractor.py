@@ -0,0 +1,85 @@
+# tests/test_snippet_extractor.py
+import os
+
+from repo_index import RepoIndex
+from snippet_extractor import SnippetExtractor
+from utils import Utils
+
+PY_SOURCE = """import os
+
+TARGET_CONSTANT = 1
+
+
+class Widget:
+    def build(self):
+        x = 1
+        return TARGET_CALL(x)
+
+    def other(self):
+        return 2
+"""
+
+
+def write(relpath, text):
+    os.makedirs(os.path.dirname(relpath), exist_ok=True)
+    with open(relpath, "w") as f:
+        f.write(text)
+
+
+def line_numbers(snippets):
+    return [(snippet[0][0], snippet[-1][0]) for snippet in snippets]
+
+
+def test_snippet_boundaries(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write("repo/widget.py", PY_SOURCE)
+    write("repo/notes.txt", "".join(f"line {i}\n" for i in range(1, 31)))
+    index = RepoIndex("repo")
+    extractor = SnippetExtractor(context_lines=3)
+    # Python 文件中命中行扩展为最内层的函数
+    snippets = extractor.extract(index, "repo/widget.py", ["TARGET_CALL"])
+    assert line_numbers(snippets) == [(7, 9)]
+    assert snippets[0][0] == (7, "    def build(self):")
+    # 模块级命中不在任何定义内：退回固定窗口，并截断在文件开头
+    assert line_numbers(extractor.extract(index, "repo/widget.py", ["TARGET_CONSTANT"])) == [(1, 6)]
+    # 非 Python 文件：命中行上下 context_lines 行，截断在文件末尾
+    assert line_numbers(extractor.extract(index, "repo/notes.txt", ["line 15"])) == [(12, 18)]
+    assert line_numbers(extractor.extract(index, "repo/notes.txt", ["line 29"])) == [(26, 30)]
+
+
+def test_overlapping_windows_are_merged(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write("repo/notes.txt", "".join(f"row {i}\n" for i in range(1, 31)))
+    write("repo/widget.py", PY_SOURCE)
+    index = RepoIndex("repo")
+    extractor = SnippetExtractor(context_lines=2)
+    snippets = extractor.extract(index, "repo/notes.txt", ["row 10", "row 13"])
+    assert line_numbers(snippets) == [(8, 12), (11, 15)]
+    # 同一函数内的多个命中只产生一个片段
+    assert line_numbers(extractor.extract(index, "repo/widget.py", ["x = 1", "TARGET_CALL"])) == [(7, 9)]
+
+    output = Utils.fetch_file_contents(
+        {"repo/notes.txt": ["row 10", "row 13"]}, repo_index=index, snippet_extractor=extractor,
+    )
+    assert "Match #1, lines 8 to 15:" in output
+    assert "Match #2" not in output
+    assert output.count("row 12\n") == 1
+
+
+def test_missing_search_string(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write("repo/widget.py", PY_SOURCE)
+    write("repo/broken.py", "def f(:\n    TARGET_CALL()\n" + "pass\n" * 10)
+    index = RepoIndex("repo")
+    extractor = SnippetExtractor(context_lines=2)
+    assert extractor.extract(index, "repo/widget.py", ["not_in_file"]) == []
+    # 缺失的搜索串不影响其他搜索串的片段
+    assert line_numbers(extractor.extract(index, "repo/widget.py", ["not_in_file", "TARGET_CALL"])) == [(7, 9)]
+    # 无法解析的 Python 文件退回固定窗口
+    assert line_numbers(extractor.extract(index, "repo/broken.py", ["TARGET_CALL"])) == [(1, 4)]
+
+    output = Utils.fetch_file_contents(
+        {"repo/widget.py": ["not_in_file"], "repo/missing.py": ["TARGET_CALL"]},
+        repo_index=index, snippet_extractor=extractor,
+    )
+    assert output.count("No matches found.") == 2
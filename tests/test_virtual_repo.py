@@ -0,0 +1,38 @@
+# tests/test_virtual_repo.py
+import os
+import shutil
+import tarfile
+
+import pytest
+
+from virtual_repo import ArchiveSource, DirectorySource, open_repo_source
+
+
+@pytest.mark.parametrize("mode", ["w", "w:gz"])
+def test_archive_source_reads_members_without_extracting(tmp_path, mode):
+    source_dir = tmp_path / "src"
+    (source_dir / "pkg").mkdir(parents=True)
+    (source_dir / "pkg" / "a.py").write_text("A = 1\n")
+    (source_dir / "b.txt").write_text("b\n")
+    archive = str(tmp_path / "repo.tar")
+    with tarfile.open(archive, mode) as tar:
+        tar.add(str(source_dir), arcname=".")
+    source = open_repo_source(archive, str(tmp_path / "work"))
+    assert isinstance(source, ArchiveSource)
+    assert source.list_files() == [("b.txt", 2), (os.path.join("pkg", "a.py"), 6)]
+    assert source.read_bytes("pkg/a.py") == b"A = 1\n"
+    assert not os.path.exists(tmp_path / "work")
+
+    source.materialize(["pkg/a.py"], str(tmp_path / "tree"))
+    assert os.listdir(tmp_path / "tree") == ["pkg"]
+    assert (tmp_path / "tree" / "pkg" / "a.py").read_text() == "A = 1\n"
+    source.close()
+
+
+def test_non_tar_archive_is_extracted_into_the_workspace(tmp_path):
+    (tmp_path / "src").mkdir()
+    (tmp_path / "src" / "a.py").write_text("A = 1\n")
+    archive = shutil.make_archive(str(tmp_path / "repo"), "zip", str(tmp_path / "src"))
+    source = open_repo_source(archive, str(tmp_path / "work"))
+    assert isinstance(source, DirectorySource)
+    assert source.read_bytes("a.py") == b"A = 1\n"
@@ -0,0 +1,186 @@
+# tracing.py
+# 流水线的结构化追踪：每个 span 写成一行 JSON（字段沿用 OpenTelemetry span 的命名：
+# name / trace_id / span_id / start_time / end_time / status / attributes，trace_id 为实例 ID），
+# 默认关闭，configure(path) 后开始记录。汇总报告：
+#   python tracing.py trace.jsonl
+import argparse
+import itertools
+import json
+import math
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+# span 属性中按阶段累加的 token 计数
+TOKEN_FIELDS = ("prompt_tokens", "cached_tokens", "generated_tokens")
+# generation span（generation_policy）中按阶段累加的补全计数
+GENERATION_FIELDS = ("completions", "forced", "truncated")
+
+
+class Tracer:
+    def __init__(self, path=None):
+        self.path = path
+        self.file = open(path, "a", encoding="utf-8") if path else None
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    @property
+    def enabled(self):
+        return self.file is not None
+
+    @contextmanager
+    def span(self, name, instance_id=None, **attributes):
+        """
+        记录 with 块的耗时，yield 属性字典，块内可继续写入（token 数、接受/拒绝结果等）。
+        未启用时只 yield 属性字典，不计时、不写文件。
+        """
+        if not self.enabled:
+            yield attributes
+            return
+        start = time.time()
+        status = "ok"
+        try:
+            yield attributes
+        except BaseException as e:
+            status = "error"
+            attributes["error"] = repr(e)
+            raise
+        finally:
+            self.emit(name, start, instance_id, status=status, **attributes)
+
+    def emit(self, name, start, instance_id=None, status="ok", **attributes):
+        """写入一个从 start（time.time()）到现在的 span，用于跨越多个函数的区间（如实例的完整生命周期）。"""
+        if not self.enabled:
+            return
+        end = time.time()
+        record = {
+            "name": name,
+            "trace_id": instance_id,
+            "span_id": next(self._ids),
+            "start_time": start,
+            "end_time": end,
+            "duration_ms": round((end - start) * 1000, 3),
+            "status": status,
+            "attributes": attributes,
+        }
+        line = json.dumps(record, default=str)
+        with self._lock:
+            self.file.write(line + "\n")
+            self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+tracer = Tracer()
+
+
+def configure(path):
+    """启用追踪，span 追加写入 path；返回新的全局 Tracer。"""
+    global tracer
+    tracer.close()
+    tracer = Tracer(path)
+    return tracer
+
+
+def span(name, instance_id=None, **attributes):
+    return tracer.span(name, instance_id, **attributes)
+
+
+def emit(name, start, instance_id=None, **attributes):
+    tracer.emit(name, start, instance_id, **attributes)
+
+
+# ---- 汇总报告 ----
+
+def load_spans(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def percentile(values, q):
+    """最近秩百分位数，values 已排序。"""
+    if not values:
+        return 0.0
+    return values[max(0, math.ceil(q / 100 * len(values)) - 1)]
+
+
+def span_group(record):
+    """LLM 调用与生成策略按所属阶段分组（llm:file_query、generation:file_query 等），其余按 span 名称分组。"""
+    stage = record["attributes"].get("stage")
+    return f"{record['name']}:{stage}" if record["name"] in ("llm", "generation") and stage else record["name"]
+
+
+def summarize(spans):
+    """返回 ({分组: 统计}, 总体统计)。"""
+    groups = defaultdict(list)
+    for record in spans:
+        groups[span_group(record)].append(record)
+    stages = {}
+    for group, records in groups.items():
+        durations = sorted(record["duration_ms"] for record in records)
+        stats = {
+            "count": len(records),
+            "errors": sum(1 for record in records if record["status"] != "ok"),
+            "p50_ms": percentile(durations, 50),
+            "p95_ms": percentile(durations, 95),
+            "max_ms": durations[-1],
+            "total_ms": sum(durations),
+        }
+        for field in TOKEN_FIELDS:
+            stats[field] = sum(record["attributes"].get(field) or 0 for record in records)
+        if group.startswith("generation"):
+            for field in GENERATION_FIELDS:
+                stats[field] = sum(record["attributes"].get(field) or 0 for record in records)
+        stages[group] = stats
+    instances = [record for record in spans if record["name"] == "instance"]
+    accepted = sum(1 for record in instances if record["attributes"].get("accepted"))
+    totals = {
+        field: sum(stats[field] for group, stats in stages.items() if group.startswith("llm"))
+        for field in TOKEN_FIELDS
+    }
+    overall = dict(totals, instances=len(instances), accepted=accepted)
+    for field in TOKEN_FIELDS:
+        overall[f"{field}_per_accepted"] = totals[field] / accepted if accepted else None
+    return stages, overall
+
+
+def print_report(spans):
+    stages, overall = summarize(spans)
+    print(f"{'span':<26} {'count':>6} {'err':>4} {'p50 ms':>10} {'p95 ms':>10} {'max ms':>10} "
+          f"{'prompt tok':>11} {'cached tok':>11} {'gen tok':>9}")
+    for group in sorted(stages, key=lambda group: -stages[group]["total_ms"]):
+        stats = stages[group]
+        print(f"{group:<26} {stats['count']:6d} {stats['errors']:4d} {stats['p50_ms']:10.1f} {stats['p95_ms']:10.1f} "
+              f"{stats['max_ms']:10.1f} {stats['prompt_tokens']:11d} {stats['cached_tokens']:11d} "
+              f"{stats['generated_tokens']:9d}")
+    for group in sorted(group for group in stages if group.startswith("generation")):
+        stats = stages[group]
+        total = stats["completions"] or 1
+        print(f"{group}: {stats['completions']} completion(s), forced conclusion {stats['forced'] / total:.1%}, "
+              f"truncated {stats['truncated'] / total:.1%}")
+    print(f"Instances: {overall['instances']}, accepted patches: {overall['accepted']}")
+    if overall["accepted"]:
+        print(f"Tokens per accepted patch: {overall['prompt_tokens_per_accepted']:.0f} prompt, "
+              f"{overall['cached_tokens_per_accepted']:.0f} cached, "
+              f"{overall['generated_tokens_per_accepted']:.0f} generated")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="汇总追踪文件：各阶段耗时 p50/p95 与每个被接受补丁的 token 数")
+    parser.add_argument("trace", help="--trace 写出的 JSONL 文件")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出汇总结果")
+    args = parser.parse_args()
+    spans = load_spans(args.trace)
+    if args.json:
+        stages, overall = summarize(spans)
+        print(json.dumps({"stages": stages, "overall": overall}, indent=2))
+    else:
+        print_report(spans)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,43 +1,47 @@
 # utils.py
-import os
+import json
 from io import StringIO
+from repo_index import RepoIndex
 
 class Utils:
     @staticmethod
-    def stringify_directory(directory):
-        """遍历目录，返回所有文件的完整路径（每行一个）。"""
-        full_paths = []
-        for root, dirs, files in os.walk(directory):
-            for file in files:
-                full_path = os.path.join(root, file)
-                full_paths.append(full_path)
-        return "\n".join(full_paths)
+    def stringify_directory(directory, repo_index=None):
+        """遍历目录，返回所有文件的完整路径（每行一个），跳过 .git、二进制及数据文件。"""
+        if repo_index is None:
+            repo_index = RepoIndex(directory)
+        return repo_index.directory_string()
 
     @staticmethod
-    def fetch_file_contents(files_to_search, repo_path="repo", context_lines=10, max_gap=0):
+    def fetch_file_contents(files_to_search, repo_path="repo", context_lines=10, max_gap=0, repo_index=None,
+                            snippet_extractor=None):
         """
         根据文件查询结果（字典：filepath -> [搜索字符串]），读取各文件并提取匹配内容，
-        返回格式化后的内容字符串。
+        返回格式化后的内容字符串。传入 repo_index 时复用其文件缓存与命中行索引；
+        传入 snippet_extractor 时按函数/类结构提取片段并控制每个文件的 token 预算。
         """
+        if repo_index is None:
+            repo_index = RepoIndex(repo_path)
+
         def find_lines_in_files_with_context(search_map, context_lines=context_lines):
             all_matches_per_file = []
             for path, terms in search_map.items():
-                if not os.path.isfile(path):
+                if not repo_index.is_file(path):
                     all_matches_per_file.append([])
                     continue
-                with open(path, "r", encoding="utf-8", errors="replace") as f:
-                    lines = f.readlines()
+                if snippet_extractor is not None:
+                    all_matches_per_file.append(snippet_extractor.extract(repo_index, path, terms))
+                    continue
+                lines = repo_index.read_lines(path)
                 file_snippets = []
                 num_lines = len(lines)
-                for i, line in enumerate(lines, start=1):
-                    if any(t in line for t in terms):
-                        start_idx = max(1, i - context_lines)
-                        end_idx = min(num_lines, i + context_lines)
-                        snippet = []
-                        for snippet_no in range(start_idx, end_idx + 1):
-                            text_content = lines[snippet_no - 1].rstrip("\n")
-                            snippet.append((snippet_no, text_content))
-                        file_snippets.append(snippet)
+                for i in repo_index.search(path, terms):
+                    start_idx = max(1, i - context_lines)
+                    end_idx = min(num_lines, i + context_lines)
+                    snippet = []
+                    for snippet_no in range(start_idx, end_idx + 1):
+                        text_content = lines[snippet_no - 1].rstrip("\n")
+                        snippet.append((snippet_no, text_content))
+                    file_snippets.append(snippet)
                 all_matches_per_file.append(file_snippets)
             return all_matches_per_file
 
@@ -95,3 +99,16 @@ class Utils:
                     output.write("\n")
             output.write("=" * 60 + "\n\n")
         return output.getvalue()
+
+
+    @staticmethod
+    def write_predictions(predictions, output_path, model_name_or_path):
+        """按 SWE-bench 预测文件格式（JSONL）写出 {instance_id: 补丁} 结果。"""
+        with open(output_path, "w", encoding="utf-8") as f:
+            for instance_id, patch in predictions.items():
+                record = {
+                    "instance_id": instance_id,
+                    "model_name_or_path": model_name_or_path,
+                    "model_patch": patch or "",
+                }
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
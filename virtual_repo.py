@@ -0,0 +1,121 @@
+# virtual_repo.py
+import mmap
+import os
+import shutil
+import tarfile
+import threading
+
+
+class DirectorySource:
+    """以磁盘目录为后端的仓库文件来源。"""
+    def __init__(self, base_dir):
+        self.base_dir = base_dir
+
+    def list_files(self, skip_dir=None):
+        """返回 (相对路径, 字节数) 列表；skip_dir(目录名) 为 True 的目录不进入。"""
+        files = []
+        for root, dirs, filenames in os.walk(self.base_dir):
+            dirs[:] = sorted(d for d in dirs if not (skip_dir and skip_dir(d)))
+            for filename in sorted(filenames):
+                path = os.path.join(root, filename)
+                try:
+                    size = os.path.getsize(path)
+                except OSError:
+                    continue
+                files.append((os.path.relpath(path, self.base_dir), size))
+        return files
+
+    def is_file(self, relpath):
+        return os.path.isfile(os.path.join(self.base_dir, relpath))
+
+    def read_bytes(self, relpath):
+        with open(os.path.join(self.base_dir, relpath), "rb") as f:
+            return f.read()
+
+    def materialize(self, relpaths, dest):
+        for relpath in relpaths:
+            target = os.path.join(dest, relpath)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copyfile(os.path.join(self.base_dir, relpath), target)
+
+    def close(self):
+        pass
+
+
+class ArchiveSource:
+    """
+    以 tar 压缩包为后端的虚拟仓库：只读取一次成员索引，不整体解压。
+    - 未压缩的 tar 通过 mmap 按成员偏移直接切片读取；
+    - 压缩的 tar 通过 extractfile 读取（加锁，tarfile 对象非线程安全）；
+    - materialize 只把需要的文件写到工作目录。
+    """
+    def __init__(self, archive_path):
+        self.archive_path = archive_path
+        self._lock = threading.Lock()
+        self._mmap = None
+        self._file = None
+        try:
+            self.tar = tarfile.open(archive_path, "r:")
+            compressed = False
+        except tarfile.ReadError:
+            self.tar = tarfile.open(archive_path, "r:*")
+            compressed = True
+        self.members = {}
+        for member in self.tar.getmembers():
+            if not member.isfile():
+                continue
+            name = os.path.normpath(member.name)
+            if name.startswith("..") or os.path.isabs(name):
+                continue
+            self.members[name] = member
+        if not compressed and os.path.getsize(archive_path) > 0:
+            self._file = open(archive_path, "rb")
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def list_files(self, skip_dir=None):
+        files = []
+        for name in sorted(self.members):
+            parts = name.split(os.sep)[:-1]
+            if skip_dir and any(skip_dir(part) for part in parts):
+                continue
+            files.append((name, self.members[name].size))
+        return files
+
+    def is_file(self, relpath):
+        return os.path.normpath(relpath) in self.members
+
+    def read_bytes(self, relpath):
+        member = self.members[os.path.normpath(relpath)]
+        if self._mmap is not None and not member.sparse:
+            return self._mmap[member.offset_data:member.offset_data + member.size]
+        with self._lock:
+            return self.tar.extractfile(member).read()
+
+    def materialize(self, relpaths, dest):
+        for relpath in relpaths:
+            target = os.path.join(dest, relpath)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open(target, "wb") as f:
+                f.write(self.read_bytes(relpath))
+            os.chmod(target, self.members[os.path.normpath(relpath)].mode & 0o777 or 0o644)
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._file.close()
+        self.tar.close()
+
+
+def open_repo_source(archive_path, workspace, blob_store=None):
+    """
+    tar 包直接作为虚拟仓库；其他格式（如 zip）解压到该预测独立的工作目录。
+    提供 blob_store（blob_store.BlobStore）时 tar 包先导入内容寻址存储，实例之间共享相同的文件。
+    """
+    try:
+        if blob_store is not None:
+            return blob_store.open(archive_path)
+        return ArchiveSource(archive_path)
+    except tarfile.ReadError:
+        extract_dir = os.path.join(workspace, "src")
+        shutil.unpack_archive(archive_path, extract_dir=extract_dir)
+        return DirectorySource(extract_dir)